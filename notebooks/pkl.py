@@ -3,42 +3,24 @@ import os
 from tqdm.notebook import tqdm
 import pickle
 import sys
-from multiprocessing import Process
 sys.path.append('..')
 
-from services.adapter.audio_fingerprint.shazam import fingerprint_file
+from services.adapter.audio_fingerprint.executor import FingerprintExecutor
+from services.adapter.audio_fingerprint.shazam import Fingerprint
 
 data_root = Path('/home/borntowarn/projects/borntowarn/train_data_yappy') / 'train_dataset'
-
-def pkl_aud(pathes, n):
-    root = Path('/home/borntowarn/projects/borntowarn/train_data_yappy')
-    frames_root = Path('/home/borntowarn/projects/borntowarn/train_data_yappy') / 'train_pickles_audios'
-    
-    for obj in tqdm(pathes, position=n, total = len(pathes)):
-        # pass
-        if os.path.exists(frames_root / Path(obj).with_suffix('.pkl')):
-            continue
-
-        try:
-            query_fingerprint = fingerprint_file(data_root / obj)
-        except:
-            query_fingerprint = ()
-        
-        pickle.dump(query_fingerprint, open(frames_root / Path(obj).with_suffix('.pkl'), 'wb'))
+frames_root = Path('/home/borntowarn/projects/borntowarn/train_data_yappy') / 'train_pickles_audios'
 
 
 if __name__ == '__main__':
-    to_dl = os.listdir(data_root)
-
-    part_size = 8
-    bs = len(to_dl) // part_size
-    processes = []
-    
-    for i in range(part_size):
-        part_links = to_dl[i*bs: i*bs+bs]
-        p = Process(target = pkl_aud, args=(part_links, i,), daemon=True)
-        p.start()
-        processes.append(p)
-
-    for p in processes:
-        p.join()
\ No newline at end of file
+    to_dl = [
+        obj for obj in os.listdir(data_root)
+        if not os.path.exists(frames_root / Path(obj).with_suffix('.pkl'))
+    ]
+
+    with FingerprintExecutor(max_workers=8, timeout=600) as executor:
+        executor.warm_up()
+        for obj, query_fingerprint in tqdm(executor.map(data_root / obj for obj in to_dl), total=len(to_dl)):
+            if isinstance(query_fingerprint, Exception):
+                query_fingerprint = Fingerprint()
+            pickle.dump(query_fingerprint, open(frames_root / obj.with_suffix('.pkl').name, 'wb'))
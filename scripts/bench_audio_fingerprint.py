@@ -0,0 +1,82 @@
+import argparse
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+from scipy.signal import spectrogram
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'services' / 'adapter'))
+
+from audio_fingerprint import sh_opt, shazam
+from audio_fingerprint.decode import read_audio
+from tests import synthetic
+
+
+def loop_hash_points(points):
+    hashes = []
+    for anchor in points:
+        for target in shazam.target_zone(
+                anchor, points, sh_opt.TARGET_T, sh_opt.TARGET_F, sh_opt.TARGET_START
+        ):
+            hashes.append((shazam.hash_point_pair(anchor, target), anchor[1]))
+    return hashes
+
+
+def set_compare_fingerprints(fingerprints1, fingerprints2):
+    hashes1 = {fp[0] for fp in fingerprints1}
+    hashes2 = {fp[0] for fp in fingerprints2}
+    total_hashes = len(hashes1.union(hashes2))
+    return len(hashes1.intersection(hashes2)) / total_hashes if total_hashes > 0 else 0
+
+
+def bench(name, fn, repeat):
+    best = min(timeit.repeat(fn, number=1, repeat=repeat))
+    print(f'{name:>28}: {best * 1000:9.1f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, default=60, help='Synthetic track duration, sec')
+    parser.add_argument('--candidates', type=int, default=100, help='Number of candidates to compare with')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timing runs')
+    args = parser.parse_args()
+    logger.disable('audio_fingerprint')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        signal = synthetic.track(args.duration)
+        wav = synthetic.write_wav(Path(tmp) / 'track.wav', signal)
+        mp4 = synthetic.write_mp4(Path(tmp) / 'track_video.mp4', signal)
+
+        bench('decode wav', lambda: read_audio(wav), args.repeat)
+        bench('decode mp4', lambda: read_audio(mp4), args.repeat)
+        audio = read_audio(mp4)
+
+        nperseg, _ = shazam.spectrogram_params()
+        bench('spectrogram float64', lambda: spectrogram(audio, sh_opt.SAMPLE_RATE, nperseg=nperseg), args.repeat)
+        bench('spectrogram float32', lambda: spectrogram(audio.astype(np.float32), sh_opt.SAMPLE_RATE, nperseg=nperseg), args.repeat)
+        _, _, Sxx = spectrogram(audio.astype(np.float32), sh_opt.SAMPLE_RATE, nperseg=nperseg)
+        bench('peaks whole spectrogram', lambda: shazam.find_peaks(Sxx), args.repeat)
+        bench('spectrogram + peaks chunked', lambda: shazam.find_peaks_chunked(audio), args.repeat)
+        peaks = shazam.find_peaks_chunked(audio)
+
+        bench('hashing loop', lambda: loop_hash_points(peaks), args.repeat)
+        bench('hashing vectorized', lambda: shazam.hash_points(peaks), args.repeat)
+        bench('fingerprint mp4', lambda: shazam.fingerprint_file(str(mp4)), args.repeat)
+
+    query = shazam.hash_points(peaks)
+    candidates = [
+        shazam.hash_points(shazam.find_peaks_chunked((synthetic.track(args.duration, seed=n) * 32000).astype(np.int16)))
+        for n in range(1, 6)
+    ] * (args.candidates // 5)
+    query_pairs = list(zip(query.hashes.tolist(), query.times.tolist()))
+    candidate_pairs = [list(zip(c.hashes.tolist(), c.times.tolist())) for c in candidates]
+    np.testing.assert_allclose(
+        [set_compare_fingerprints(query_pairs, c) for c in candidate_pairs],
+        shazam.compare_fingerprints_batch(query, candidates)
+    )
+    bench(f'compare x{len(candidates)} sets', lambda: [set_compare_fingerprints(query_pairs, c) for c in candidate_pairs], args.repeat)
+    bench(f'compare x{len(candidates)} batch', lambda: shazam.compare_fingerprints_batch(query, candidates), args.repeat)
+    print(f'{len(peaks)} peaks, {len(query)} hashes, {query.nbytes} bytes')
@@ -0,0 +1,95 @@
+import argparse
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'services' / 'adapter'))
+
+from ml_utils.utils.arena import TensorArena
+from src.decode import transform
+
+FRAMES = 8
+
+
+def legacy_clip(frames):
+    # Как раньше: новый массив на каждый кадр, np.stack и транспонирование под вход модели
+    batch = np.stack([transform(frame) for frame in frames])
+    return batch[None].transpose(0, 1, 4, 2, 3)
+
+
+def run_legacy(frames, batch_size):
+    clips = [legacy_clip(frames) for _ in range(batch_size)]
+    batch = np.concatenate(clips)
+    return np.ascontiguousarray(batch).sum()
+
+
+def run_arena(frames, batch_size, clip_arena, batch_arena):
+    clips = []
+    for _ in range(batch_size):
+        clip = clip_arena.acquire()
+        for i, frame in enumerate(frames):
+            transform(frame, out=clip[0, i])
+        clips.append(clip)
+    try:
+        with batch_arena.borrow() as batch:
+            batch = np.concatenate(clips, out=batch[:batch_size])
+            return np.ascontiguousarray(batch).sum()
+    finally:
+        for clip in clips:
+            clip_arena.release(clip)
+
+
+def measure(mode, args):
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, (FRAMES, args.height, args.width, 3), dtype=np.uint8)
+    if mode == 'arena':
+        clip_arena = TensorArena((1, FRAMES, 3, 224, 224), size=args.batch_size)
+        batch_arena = TensorArena((args.batch_size, FRAMES, 3, 224, 224), size=1)
+        step = lambda: run_arena(frames, args.batch_size, clip_arena, batch_arena)
+    else:
+        step = lambda: run_legacy(frames, args.batch_size)
+    step()
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    peak = 0
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    start = time.perf_counter()
+    for _ in range(args.batches):
+        tracemalloc.reset_peak()
+        step()
+        _, batch_peak = tracemalloc.get_traced_memory()
+        peak = max(peak, batch_peak - baseline)
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    clips = args.batches * args.batch_size
+    # Свежие большие массивы приходят из mmap и дают page faults при первой записи, переиспользованные - нет
+    print(
+        f'{mode:>8}: {elapsed / clips * 1000:7.1f} ms/clip, '
+        f'{(usage.ru_minflt - faults) / clips:8.1f} page faults/clip, '
+        f'peak traced {peak / 2 ** 20:7.1f} MB, peak RSS {usage.ru_maxrss / 1024:7.1f} MB'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['legacy', 'arena'], help='Run only one mode in this process')
+    parser.add_argument('--batches', type=int, default=20, help='Number of batches to process')
+    parser.add_argument('--batch-size', type=int, default=8, help='Clips in a Triton batch')
+    parser.add_argument('--width', type=int, default=1280, help='Synthetic frame width')
+    parser.add_argument('--height', type=int, default=720, help='Synthetic frame height')
+    args = parser.parse_args()
+
+    if args.mode:
+        measure(args.mode, args)
+    else:
+        # Каждый режим в своем процессе, чтобы пиковый RSS одного не влиял на другой
+        for mode in ['legacy', 'arena']:
+            subprocess.run([sys.executable, __file__, '--mode', mode, *sys.argv[1:]], check=True)
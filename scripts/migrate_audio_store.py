@@ -0,0 +1,21 @@
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / 'services' / 'adapter'))
+
+from audio_fingerprint.store import AudioStore
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='One-off migration of legacy pickled audio fingerprints to an AudioStore. '
+                    'Can run while the adapter is up and can be restarted if interrupted.'
+    )
+    parser.add_argument('--audio_store', type=str, required=True, help='Folder of the store (audio_store in resources.ini)')
+    parser.add_argument('--videos_folder', type=str, required=True, help='Folder with {video_id}.mp4 files')
+    parser.add_argument('--legacy', type=str, default=None, help='Legacy pickle, {audio_store}.pkl by default')
+    args = parser.parse_args()
+
+    path = Path(args.audio_store)
+    legacy_path = Path(args.legacy) if args.legacy else path.with_suffix('.pkl')
+    AudioStore.migrate(legacy_path, args.videos_folder, path)
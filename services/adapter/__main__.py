@@ -1,56 +1,109 @@
+import asyncio
 import configparser
 import os
+import signal
 import sys
 import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 from typing import *
 
 sys.path.append('adapter')
 
-import albumentations as A
+import aiohttp
 import numpy as np
 import requests
-from audio_fingerprint.shazam import compare_fingerprints, fingerprint_file
+from audio_fingerprint.executor import FingerprintExecutor
+from audio_fingerprint.index import AudioIndex
+from audio_fingerprint.pending import PendingFingerprints
+from audio_fingerprint.shazam import Fingerprint, compare_fingerprints_batch
+from audio_fingerprint.store import AudioStore
 from loguru import logger
-from ml_utils import MilvusWrapper, TritonWrapper, VideoDataloader
+from ml_utils import AsyncTritonWrapper, FederatedMilvusWrapper, MetadataFilter, MilvusWrapper, TritonWrapper, VideoDataloader
+from ml_utils.utils.arena import TensorArena
+from ml_utils.utils.metrics import metrics
+from ml_utils.utils.pipeline import Stage, StagedPipeline
+from ml_utils.utils.shared_ring import SharedClipRing
+from ml_utils.utils.supervisor import WorkerSupervisor
 from pymilvus import CollectionSchema, DataType, FieldSchema
+from src.decode import decode_clip, init_decoder, transform
 from src.utils import duplicates, filter_by_threshold
-import pickle
 
 logger.add(f"{__file__.split('/')[-1].split('.')[0]}.log", rotation="50 MB")
 
 class Model:
     
-    def __init__(self, config: dict | None = None) -> None:
+    threaded_stages = True
+    """ Собирать StagedPipeline и пул процессов декодирования. AsyncModel выполняет стадии в event loop. """
+    
+    def __init__(
+        self,
+        config: dict | None = None,
+        audio_store: AudioStore | None = None,
+        audio_index: AudioIndex | None = None
+    ) -> None:
+        """
+        Args:
+            config (dict, optional): Секция конфига адаптера. Defaults to None.
+            audio_store (AudioStore, optional): Уже открытое хранилище отпечатков, например
+                общее для воркеров WorkerSupervisor. Defaults to None.
+            audio_index (AudioIndex, optional): Уже построенный индекс отпечатков. Defaults to None.
+        """
         
-        self.milvus = MilvusWrapper(config=config)
+        # Если корпус разделен на шарды, то поиск идет по всем шардам параллельно
+        if config.get('MILVUS_SHARDS'):
+            self.milvus = FederatedMilvusWrapper(config=config)
+        else:
+            self.milvus = MilvusWrapper(config=config)
         self.milvus.connect()
         self.milvus.init_collection(
             config['collection_name'],
             schema=self.create_schema()
         )
         
-        if len(self.milvus.collection.indexes) == 0:
-            self.milvus.collection.create_index(
-                field_name = "features", 
-                index_params = {
-                        "metric_type": "COSINE",
-                        "index_type": "IVF_FLAT",
-                        "params": {"nlist": 128}
-                    },
-                index_name="qwer"
-            )
-        self.milvus.collection.load()
+        self.milvus.create_index_if_missing(
+            field_name = "features", 
+            index_params = {
+                    "metric_type": "COSINE",
+                    "index_type": "IVF_FLAT",
+                    "params": {"nlist": 128}
+                },
+            index_name="qwer"
+        )
         
-        self.audio_store = {}
+        # Фильтрация кандидатов по метаданным видео (длительность и ориентация)
+        self.metadata_filter = config.getboolean('metadata_filter', False)
+        self.duration_tolerance = float(config.get('duration_tolerance', 0.2))
+        self.same_orientation = config.getboolean('same_orientation', True)
+        if config.getboolean('metadata_index', False):
+            self.milvus.create_scalar_indexes(['duration', 'aspect_ratio'])
+        self.milvus.load()
         
         
         self.timesformer = TritonWrapper(config=config, config_prefix='TIMESFORMER')
-        self.transform = lambda x: A.Compose([
-            A.SmallestMaxSize(224),
-            A.CenterCrop(224, 224),
-            A.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))
-        ])(image=x)['image']
+        self.transform = transform
+        
+        # Видео декодируются в отдельных процессах, кадры передаются через слоты разделяемой памяти
+        self.decode_processes = int(config.get('decode_processes', 0)) if self.threaded_stages else 0
+        self.clip_ring = None
+        self.decoder = None
+        self._decoder_lock = threading.Lock()
+        if self.decode_processes > 0:
+            self.clip_ring = SharedClipRing(slots=int(config.get('clip_ring_slots', 4 * self.decode_processes)))
+            self.decoder = self.create_decoder()
+        
+        # Буферы клипов и батчей переиспользуются между сообщениями, а не выделяются заново на каждое видео.
+        # Когда все буферы клипов заняты, декодирование ждет, пока инференс вернет их в пул
+        self.clip_arena = TensorArena((1, 8, 3, 224, 224), size=int(config.get('clip_arena_size', 16)))
+        # Батч больше max_batch_size Triton не примет
+        self.pipeline_batch_size = min(
+            int(config.get('pipeline_batch_size', self.timesformer.max_batch_size)),
+            self.timesformer.max_batch_size
+        )
+        self.batch_arena = TensorArena((self.pipeline_batch_size, 8, 3, 224, 224), size=1)
         
         self.video_threshold = float(config['video_threshold']) # порог близости видео
         self.audio_threshold = float(config['audio_threshold']) # порог близости аудио
@@ -59,13 +112,58 @@ class Model:
         
         self.videos_folder = Path(config['videos_folder'])
         self.pickles_folder = Path(config['pickles_folder'])
-        audio_store_path = Path(config['audio_store'])
-        
-        if os.path.exists(audio_store_path):
-            self.audio_store = pickle.load(open(audio_store_path, 'rb'))
+        # Аудио отпечатки дописываются на диск при каждой вставке; старый pickle рядом с хранилищем мигрируется при первом запуске
+        if audio_store is None:
+            audio_store = AudioStore.open(config['audio_store'])
+        self.audio_store = audio_store
         logger.info(f'Len of audio {len(self.audio_store)}')
         
+        # Поиск видео с тем же аудио, если по видеоряду кандидатов нет
+        self.audio_search = config.getboolean('audio_search', False)
+        self.audio_candidates = int(config.get('audio_candidates', 10))
+        self.audio_min_matches = int(config.get('audio_min_matches', 5))
+        if audio_index is None and self.audio_search:
+            audio_index = AudioIndex.from_store(self.audio_store)
+        self.audio_index = audio_index if self.audio_search else None
+        
+        # Аудио длинных видео декодируется и сравнивается только в начале.
+        # Сохраненные отпечатки могли быть посчитаны по всему видео, поэтому обрезаются при сравнении
+        self.audio_max_duration = float(config.get('audio_max_duration', 0)) or None
+        
+        # Аудио отпечатки считаются в отдельных процессах параллельно с инференсом видео
+        self.fingerprinter = FingerprintExecutor(
+            max_workers=int(config.get('audio_workers', 2)),
+            timeout=float(config.get('audio_timeout', 60)),
+            max_duration=self.audio_max_duration
+        )
+        self.fingerprinter.warm_up()
+        
+        # Если кандидатов нет, ответ отправляется сразу, а отпечаток сохраняется в фоне.
+        # До сохранения запросы к такому видео ждут его задачу из pending_audio.
+        # С audio_search отпечаток нужен для поиска по аудио до ответа, поэтому audio_async не действует
+        self.audio_async = config.getboolean('audio_async', False)
+        if self.audio_async and self.audio_search:
+            logger.warning('audio_async has no effect with audio_search = True')
+        self.pending_audio = PendingFingerprints(self.audio_store)
+        
         os.makedirs(self.pickles_folder, exist_ok=True)
+        
+        # Конвейер стадий: пока одни запросы в Triton, следующие скачиваются и декодируются.
+        # Поиск и вставка идут в один поток, чтобы одновременные дубликаты находили друг друга
+        self.pipeline_batch_timeout = float(config.get('pipeline_batch_timeout', 0.05))
+        self.pipeline = None
+        if self.threaded_stages and config.getboolean('staged_pipeline', False):
+            self.pipeline = StagedPipeline([
+                Stage('download', self.prepare_video, workers=int(config.get('pipeline_download_workers', 4))),
+                Stage('decode', self.decode_video, workers=int(config.get('pipeline_decode_workers', 2))),
+                Stage(
+                    'embed',
+                    self.embed_videos,
+                    batch_size=self.pipeline_batch_size,
+                    batch_timeout=self.pipeline_batch_timeout
+                ),
+                Stage('search', self.find_duplicates),
+            ])
     
     def create_schema(self, description='Piracy features') -> CollectionSchema:
         """
@@ -91,24 +189,49 @@ class Model:
             dtype=DataType.FLOAT_VECTOR,
             dim=768
         )
+        
+        # Метаданные видео для скалярной фильтрации кандидатов
+        metadata = [
+            FieldSchema(name="duration", dtype=DataType.FLOAT, default_value=0.0),
+            FieldSchema(name="fps", dtype=DataType.FLOAT, default_value=0.0),
+            FieldSchema(name="width", dtype=DataType.INT32, default_value=0),
+            FieldSchema(name="height", dtype=DataType.INT32, default_value=0),
+            FieldSchema(name="aspect_ratio", dtype=DataType.FLOAT, default_value=0.0),
+        ]
 
         schema = CollectionSchema(
-            fields=[vid, name, features],
+            fields=[vid, name, features, *metadata],
             description=description,
             enable_dynamic_field=True
         )
         return schema
     
     
-    def create_data_rows(self, features, video_id) -> list:
+    def create_data_rows(self, features, video_id, metadata: dict | None = None) -> list[dict]:
         """
         Метод для генерации строк для вставки в Milvus.
+        В коллекциях, созданных до появления полей метаданных, они сохраняются в динамическое поле.
         """
+        metadata = metadata or {}
         data = [
-            [video_id for i in range(len(features))],
-            features
+            {'video_id': video_id, 'features': feature, **metadata}
+            for feature in features
         ]
         return data
+    
+    
+    def create_metadata_filter(self, metadata: dict) -> MetadataFilter | None:
+        """
+        Метод для построения фильтра кандидатов по метаданным видео запроса.
+        """
+        if not self.metadata_filter:
+            return None
+        return MetadataFilter(
+            duration=metadata['duration'],
+            duration_tolerance=self.duration_tolerance,
+            aspect_ratio=metadata['aspect_ratio'],
+            same_orientation=self.same_orientation
+        )
 
     
     def download_video(self, link) -> str:
@@ -141,127 +264,152 @@ class Model:
         return str(filepath)
     
     
-    def get_audio_scores(self, candidate_video_scores: dict, video_path: str | Path) -> tuple[dict, list | tuple[()]]:
+    def get_audio_scores(self, candidate_video_scores: dict, audio_future: Future) -> tuple[dict, Fingerprint]:
         """
         Метод для получения схожести аудиодорожек после видеосравнения.
         Если в видеодорожке нет аудио - помечаем его как 2.0 для дальнейшей проверки.
 
         Args:
             candidate_video_scores (dict): _description_
-            video_path (str | Path): _description_
+            audio_future (Future): Задача расчета отпечатка аудио запроса в FingerprintExecutor
 
         Returns:
-            tuple[dict, list | tuple[()]]: Словарь, аналогичный candidate_video_scores, 
+            tuple[dict, Fingerprint]: Словарь, аналогичный candidate_video_scores, 
                 и закодированные точки в алгоритм сравнения аудио.
         """
         candidate_audio_scores = {}
         try:
-            query_fingerprint = fingerprint_file(video_path)
+            query_fingerprint = self.fingerprinter.result(audio_future)
         except:
-            query_fingerprint = ()
+            query_fingerprint = Fingerprint()
         
+        # Кандидат мог быть вставлен другим процессом адаптера после нашего последнего чтения хранилища
+        if any(
+            vid_id not in self.audio_store and vid_id not in self.pending_audio
+            for vid_id in candidate_video_scores
+        ):
+            self.audio_store.refresh()
+        
+        candidat_fingerprints = {}
         for vid_id, _ in candidate_video_scores.items():
-            candidat_fingerprint = self.audio_store[vid_id] # фичи кандидата
+            candidat_fingerprint = self.get_fingerprint(vid_id) # фичи кандидата
             if len(candidat_fingerprint) == 0 or len(query_fingerprint) == 0:
                 candidate_audio_scores[vid_id] = 2.0
                 continue
-            score = compare_fingerprints(
-                query_fingerprint, 
-                candidat_fingerprint
-            )
-            candidate_audio_scores[vid_id] = score
+            candidat_fingerprints[vid_id] = candidat_fingerprint
+        
+        # Все кандидаты сравниваются с запросом за один проход
+        scores = compare_fingerprints_batch(
+            query_fingerprint, 
+            list(candidat_fingerprints.values())
+        )
+        candidate_audio_scores.update(zip(candidat_fingerprints, scores.tolist()))
         
         return candidate_audio_scores, query_fingerprint
     
     
-    def __call__(self, video_link: str, **kwargs):
+    def get_fingerprint(self, video_id: str) -> Fingerprint:
+        """
+        Метод для получения отпечатка аудио сохраненного видео.
+        Если отпечаток еще считается в фоне, то метод дожидается его.
+        Если отпечатка нет в хранилище (например, старый pickle еще не перенесен
+        scripts/migrate_audio_store.py), он считается по видео из videos_folder и сохраняется.
+        Отпечаток обрезается до audio_max_duration, как и отпечаток запроса.
+        """
+        future = self.pending_audio.get(video_id)
+        if future is None and video_id not in self.audio_store:
+            video_path = self.videos_folder / f'{video_id}.mp4'
+            if not video_path.exists():
+                logger.warning(f'There is no audio fingerprint of {video_id}')
+                return Fingerprint()
+            future = self.fingerprinter.submit(video_path)
+            self.pending_audio.save_later(video_id, future)
+        
+        if future is not None:
+            logger.info(f'Waiting for audio fingerprint of {video_id}')
+            try:
+                return self.fingerprinter.result(future)
+            except Exception:
+                return Fingerprint()
+        return self.audio_store[video_id].truncated(self.audio_max_duration)
+    
+    
+    def save_fingerprint_later(self, video_id: str, audio_future: Future) -> None:
+        """
+        Метод для сохранения отпечатка аудио, когда он будет посчитан, без ожидания.
+        Видео остается в pending_audio, пока отпечаток не записан в хранилище.
+        Используется только без audio_search: индекс отпечатков при этом не ведется.
+        """
+        self.pending_audio.save_later(video_id, audio_future)
+    
+    
+    def get_audio_candidates(self, query_fingerprint: Fingerprint) -> dict:
+        """
+        Метод для поиска видео с тем же аудио по инвертированному индексу отпечатков.
+        Кандидаты отбираются по количеству хэшей с одинаковым сдвигом во времени,
+        а их схожесть считается так же, как в get_audio_scores.
+
+        Args:
+            query_fingerprint (Fingerprint): Отпечаток аудио запроса
+
+        Returns:
+            dict: Словарь {video_id: схожесть аудио}, лучшие кандидаты первыми
+        """
+        if self.audio_index is None or len(query_fingerprint) == 0:
+            return {}
+        
+        # Отпечатки, сохраненные другими воркерами и процессами адаптера, добавляются в индекс перед поиском
+        self.audio_index.sync(self.audio_store)
+        found = self.audio_index.search(
+            query_fingerprint,
+            limit=self.audio_candidates,
+            min_matches=self.audio_min_matches
+        )
+        for vid_id, matches in found:
+            logger.info(f'Audio candidate {vid_id}: {matches} aligned hashes')
+        
+        scores = compare_fingerprints_batch(
+            query_fingerprint,
+            [self.audio_store[vid_id].truncated(self.audio_max_duration) for vid_id, _ in found]
+        )
+        return {vid_id: score for (vid_id, _), score in zip(found, scores.tolist())}
+    
+    
+    def __call__(self, video_link: str, deadline: float | None = None, **kwargs):
         """
         Метод для обработки входящего сообщения из очереди.
+        В режиме similarity обработка идет стадиями prepare_video -> decode_video -> embed_videos ->
+        find_duplicates. Если включен staged_pipeline, стадии выполняются в StagedPipeline,
+        и запросы из разных потоков брокера проходят их конвейером.
 
         Args:
             video_link (str): id видео на платформе или локальный путь
+            deadline (float, optional): unix time, после которого ответ уже не нужен.
+                Если видео скачивалось дольше, обработка прерывается до инференса
 
         Returns:
             dict: словарь ответа. В брокере будет переведен в json
         """
+        job = {'video_link': video_link, 'deadline': deadline}
         try:
-            if not 'http' in video_link:
-                video_path = video_link
-                video_id = str(Path(video_path).stem)
-                
-            else:
-                video_path = self.download_video(video_link)
-                video_id = video_link.split('/')[-1].split('.')[0]
-
-            logger.info(f'Start procesing {video_id}')
             if self.mode == 'similarity':
-                similarity_data = []
-                insert_features = []
-                
-                dataloader = VideoDataloader(video_path, transforms=self.transform)
-                
-                #! Это нужно для более быстрого локального запуска
-                npy_path = self.pickles_folder / f"{video_id}.npy"
-                if os.path.exists(npy_path):
-                    features = np.load(npy_path)
-                    insert_features = features
-                    similarity_data.extend(self.milvus.vector_search(features))
-                    logger.success('Feature loaded sucessed')
+                if self.pipeline is not None:
+                    future = self.pipeline.submit(job)
+                    logger.debug(f'Pipeline queues: {self.pipeline.depths()}')
+                    future.result()
                 else:
-                    #! Основная часть с подгрузкой видео на лету
-                    for n, batch in enumerate(dataloader):
-                        batch = batch[None].transpose(0, 1, 4, 2, 3)
-                        last_hidden_state = self.timesformer(batch)[0]
-                        feature = last_hidden_state[:, 0]
-                        feature = feature / np.linalg.norm(feature, axis=-1, keepdims=True)
-                        similarity_data.extend(self.milvus.vector_search(feature))
-                        insert_features.append(feature)
-                        break
-                    insert_features = np.concatenate(insert_features)
-                    logger.success('Feature requests sucessed')
-                
-                candidate_video_scores = filter_by_threshold(
-                    similarity_data,
-                    self.video_threshold
-                )
-
-                candidate_audio_scores, query_fingerprint = self.get_audio_scores(
-                    candidate_video_scores,
-                    video_path
-                )
-                
-                is_duplicate, is_hard, duplicate_for = duplicates(
-                    candidate_video_scores, 
-                    candidate_audio_scores,
-                    self.video_threshold,
-                    self.audio_threshold
-                )
-                
-                logger.info(f'Is duplicate - {is_duplicate}')
-                
-                if not is_duplicate:
-                    self.audio_store[video_id] = query_fingerprint
-                    self.milvus.insert(
-                        self.create_data_rows(
-                            insert_features,
-                            video_id
-                    ))
-                    logger.success(f'Inserting sucessful')
-                    
-                
-                result = {
-                    'video_link': video_link,
-                    'is_duplicate': is_duplicate,
-                    'is_hard': is_hard,
-                    'duplicate_for': duplicate_for
-                }
-                return result
+                    self.prepare_video(job)
+                    self.decode_video(job)
+                    self.embed_videos([job])
+                    self.find_duplicates(job)
+                result = job['result']
             
             elif self.mode == 'save':
+                self.prepare_video(job)
                 features = []
                 
                 dataloader = VideoDataloader(
-                    video_path, 
+                    job['video_path'], 
                     transforms=self.transform
                 )
                 
@@ -275,33 +423,449 @@ class Model:
                 features = np.concatenate(features)
                 logger.success('Feature requests sucessed')
                 
-                filepath =  self.pickles_folder / f'{video_id}.npy'
+                filepath =  self.pickles_folder / f"{job['video_id']}.npy"
                 np.save(filepath, features)
-                logger.success(f'Save {video_id} sucessful')
+                logger.success(f"Save {job['video_id']} sucessful")
                 
                 result = {'path': str(filepath)}
 
-        except Exception as e:
-            if os.path.exists(video_path):
+        finally:
+            video_path = job.get('video_path')
+            if video_path and os.path.exists(video_path):
                 # os.remove(video_path)
                 logger.info(f'Video {video_path} has been deleted')
-            raise e
-        
-        if os.path.exists(video_path):
-            # os.remove(video_path)
-            logger.info(f'Video {video_path} has been deleted')
 
         return result
+    
+    
+    def prepare_video(self, job: dict) -> dict:
+        """
+        Стадия скачивания видео. Заполняет video_path и video_id,
+        а в режиме similarity запускает расчет отпечатка аудио.
+        Если deadline запроса уже истек, сразу заполняет result.
+        """
+        video_link = job['video_link']
+        if not 'http' in video_link:
+            job['video_path'] = video_link
+            job['video_id'] = str(Path(video_link).stem)
+        else:
+            # AsyncModel скачивает видео сам до вызова этой стадии
+            job['video_path'] = job.get('video_path') or self.download_video(video_link)
+            job['video_id'] = video_link.split('/')[-1].split('.')[0]
+        
+        logger.info(f"Start procesing {job['video_id']}")
+        deadline = job.get('deadline')
+        if deadline is not None and time.time() > deadline:
+            dropped = metrics.inc('expired_dropped')
+            logger.warning(f"{job['video_id']} has expired after download, dropped {dropped} items in total")
+            job['result'] = {'video_link': video_link, 'is_duplicate': None, 'expired': True}
+        elif self.mode == 'similarity':
+            # Отпечаток аудио считается в пуле процессов, пока идут декодирование и инференс видео
+            job['audio_future'] = self.fingerprinter.submit(job['video_path'])
+        return job
+    
+    
+    def create_decoder(self) -> ProcessPoolExecutor:
+        """
+        Метод создания пула процессов-декодеров, подключенных к clip_ring.
+        """
+        return ProcessPoolExecutor(
+            max_workers=self.decode_processes,
+            initializer=init_decoder,
+            initargs=(self.clip_ring,)
+        )
+    
+    
+    def decode_video(self, job: dict) -> dict:
+        """
+        Стадия декодирования: метаданные и кадры видео для инференса (batch или слот clip_ring)
+        или сохраненные фичи (features), если они есть.
+        """
+        if 'result' in job:
+            return job
+        
+        #! Это нужно для более быстрого локального запуска
+        npy_path = self.pickles_folder / f"{job['video_id']}.npy"
+        if os.path.exists(npy_path):
+            job['metadata'] = VideoDataloader(job['video_path']).metadata
+            job['features'] = np.load(npy_path)
+            logger.success('Feature loaded sucessed')
+            return job
+        
+        if self.decoder is not None:
+            decoder = self.decoder
+            try:
+                job['slot'], job['frames'], job['metadata'] = decoder.submit(decode_clip, job['video_path']).result()
+            except BrokenProcessPool:
+                # Слоты упавшего декодера возвращаются в кольцо, следующие видео пойдут в новый пул
+                with self._decoder_lock:
+                    if self.decoder is decoder:
+                        self.clip_ring.reclaim()
+                        self.decoder = self.create_decoder()
+                raise
+            return job
+        
+        #! Основная часть с подгрузкой видео на лету. Кадры пишутся на месте в буфер из clip_arena
+        buffer = self.clip_arena.acquire()
+        try:
+            dataloader = VideoDataloader(job['video_path'], transforms=self.transform, out=buffer[0])
+            job['metadata'] = dataloader.metadata
+            for batch in dataloader:
+                if len(batch):
+                    break
+            else:
+                raise ValueError(f"There are no frames in {job['video_path']}")
+        except:
+            self.clip_arena.release(buffer)
+            raise
+        job['batch'] = buffer[:, :len(batch)]
+        job['buffer'] = buffer
+        return job
+    
+    
+    def embed_videos(self, jobs: list[dict]) -> list[dict]:
+        """
+        Стадия инференса: кадры видео отправляются в Triton батчем.
+        Кадры из clip_ring и clip_arena читаются без копирования, полные клипы собираются
+        в буфер из batch_arena. Клипы коротких видео (меньше 8 кадров)
+        в батч не склеиваются и отправляются по одному. Слоты и буферы освобождаются после запроса.
+        """
+        todo = [job for job in jobs if 'result' not in job and 'features' not in job]
+        if not todo:
+            return jobs
+        try:
+            clips = [self.take_clip(job) for job in todo]
+            for request in self.group_clips(clips):
+                if len(request) == 1:
+                    last_hidden_state = self.timesformer(clips[request[0]])[0]
+                else:
+                    with self.batch_arena.borrow() as batch:
+                        batch = np.concatenate([clips[i] for i in request], out=batch[:len(request)])
+                        last_hidden_state = self.timesformer(batch)[0]
+                self.set_features([todo[i] for i in request], last_hidden_state)
+        finally:
+            for job in todo:
+                self.release_clip(job)
+        
+        logger.success(f'Feature requests sucessed for {len(todo)} videos')
+        return jobs
+    
+    
+    def group_clips(self, clips: list[np.ndarray]) -> list[list[int]]:
+        """
+        Разбиение клипов на запросы к Triton: полные клипы идут одним батчем, остальные по одному.
 
+        Returns:
+            list[list[int]]: Индексы клипов каждого запроса
+        """
+        full = [i for i, clip in enumerate(clips) if clip.shape[1] == self.batch_arena.shape[1]]
+        requests = [[i] for i in range(len(clips)) if i not in full]
+        if full:
+            requests.append(full)
+        return requests
+    
+    
+    def set_features(self, jobs: list[dict], last_hidden_state: np.ndarray) -> None:
+        """
+        Нормированные CLS вектора из выхода Triton для видео одного запроса.
+        """
+        features = last_hidden_state[:, 0]
+        features = features / np.linalg.norm(features, axis=-1, keepdims=True)
+        for job, feature in zip(jobs, features):
+            job['features'] = feature[None]
+    
+    
+    def take_clip(self, job: dict) -> np.ndarray:
+        """
+        Кадры видео для инференса из слота clip_ring или буфера clip_arena без копирования.
+        """
+        return self.clip_ring.view(job['slot'])[None, :job['frames']] if 'slot' in job else job['batch']
+    
+    
+    def release_clip(self, job: dict) -> None:
+        """
+        Возврат слота или буфера с кадрами видео. Повторный вызов ничего не делает.
+        """
+        job.pop('batch', None)
+        if 'buffer' in job:
+            self.clip_arena.release(job.pop('buffer'))
+        if 'slot' in job:
+            self.clip_ring.release(job.pop('slot'))
+    
+    
+    def find_duplicates(self, job: dict) -> dict:
+        """
+        Стадия поиска: кандидаты в Milvus, сравнение аудио, решение о дубликате
+        и вставка нового видео. Заполняет result.
+        """
+        if 'result' in job:
+            return job
+        
+        video_link, video_id = job['video_link'], job['video_id']
+        insert_features, metadata = job['features'], job['metadata']
+        audio_future = job['audio_future']
+        
+        similarity_data = self.milvus.vector_search(
+            insert_features,
+            threshold=self.video_threshold,
+            metadata_filter=self.create_metadata_filter(metadata)
+        )
+        
+        candidate_video_scores = filter_by_threshold(
+            similarity_data,
+            self.video_threshold
+        )
 
-if __name__ == '__main__':
-    config = configparser.ConfigParser()
-    # config.read('/home/borntowarn/projects/borntowarn/find-duplicates/configs/resources.ini')
-    # config = config['adapter_local']
-    config.read(f'configs/resources.ini')
-    config = config['adapter_docker']
+        # Без кандидатов и без поиска по аудио (audio_search = False) отпечаток нужен только для будущих сравнений
+        defer_audio = self.audio_async and not candidate_video_scores and self.audio_index is None
+        if defer_audio:
+            candidate_audio_scores, query_fingerprint = {}, None
+        else:
+            candidate_audio_scores, query_fingerprint = self.get_audio_scores(
+                candidate_video_scores,
+                audio_future
+            )
+        
+        # Видео с тем же аудио, но другим видеорядом добавляются с нулевой схожестью видео.
+        # Только при отсутствии видеокандидатов: duplicates смотрит на кандидата с наименьшей схожестью
+        if not candidate_video_scores and not defer_audio:
+            candidate_audio_scores = self.get_audio_candidates(query_fingerprint)
+            candidate_video_scores = {vid_id: 0.0 for vid_id in candidate_audio_scores}
+        
+        is_duplicate, is_hard, duplicate_for = duplicates(
+            candidate_video_scores, 
+            candidate_audio_scores,
+            self.video_threshold,
+            self.audio_threshold
+        )
+        
+        logger.info(f'Is duplicate - {is_duplicate}')
+        
+        if not is_duplicate:
+            if defer_audio:
+                self.save_fingerprint_later(video_id, audio_future)
+            else:
+                self.audio_store[video_id] = query_fingerprint
+                if self.audio_index is not None:
+                    self.audio_index.sync(self.audio_store)
+            self.milvus.insert(
+                self.create_data_rows(
+                    insert_features,
+                    video_id,
+                    metadata
+            ))
+            logger.success(f'Inserting sucessful')
+        
+        job['result'] = {
+            'video_link': video_link,
+            'is_duplicate': is_duplicate,
+            'is_hard': is_hard,
+            'duplicate_for': duplicate_for
+        }
+        return job
+    
+    
+    def close(self) -> None:
+        """
+        Остановка пулов и закрытие соединений.
+        """
+        if self.pipeline is not None:
+            self.pipeline.close()
+        self.milvus.close()
+        self.fingerprinter.shutdown()
+        if self.decoder is not None:
+            self.decoder.shutdown()
+            self.clip_ring.close()
+
+
+class AsyncModel(Model):
+    """
+    Вариант Model для asyncio (runtime = async). Скачивание идет через aiohttp, инференс через
+    async_timesformer с одним соединением на процесс, поэтому десятки видео могут одновременно
+    ждать сети и Triton. Декодирование выполняется в пуле потоков, поиск и вставка в Milvus -
+    в отдельном потоке по одному, как в стадии search у StagedPipeline.
+    
+    У модели в Triton max_batch_size: 0, поэтому динамический батчинг сервера не работает:
+    клипы одновременных видео собираются в батчи до pipeline_batch_size здесь, в _embed_loop.
+    StagedPipeline и процессы декодирования не создаются.
+    """
+    
+    threaded_stages = False
+    
+    def __init__(self, config: dict | None = None, **kwargs) -> None:
+        super().__init__(config=config, **kwargs)
+        self.async_timesformer = AsyncTritonWrapper(config=config, config_prefix='TIMESFORMER')
+        self.decode_executor = ThreadPoolExecutor(
+            max_workers=int(config.get('pipeline_decode_workers', 2)),
+            thread_name_prefix='decode'
+        )
+        self.search_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search')
+        self.http = None
+        self.embed_queue = None
+        self.embed_task = None
+    
+    
+    async def start(self) -> None:
+        """
+        Создание клиентов, привязанных к event loop. Вызывается внутри работающего loop.
+        """
+        self.http = aiohttp.ClientSession()
+        await self.async_timesformer.start()
+        self.embed_queue = asyncio.Queue()
+        self.embed_task = asyncio.create_task(self._embed_loop())
+    
+    
+    async def aclose(self) -> None:
+        if self.embed_task is not None:
+            self.embed_task.cancel()
+            await asyncio.gather(self.embed_task, return_exceptions=True)
+        if self.http is not None:
+            await self.http.close()
+        await self.async_timesformer.close()
+        self.decode_executor.shutdown()
+        self.search_executor.shutdown()
+        self.close()
+    
+    
+    async def __call__(self, video_link: str, deadline: float | None = None, **kwargs):
+        """
+        Метод для обработки входящего сообщения из очереди, как Model.__call__.
+        В режиме similarity стадии prepare_video -> decode_video -> embed_video -> find_duplicates
+        выполняются без блокировки event loop, режим save выполняется синхронно в потоке.
+        """
+        if self.mode != 'similarity':
+            return await asyncio.to_thread(super().__call__, video_link, deadline, **kwargs)
+        
+        loop = asyncio.get_running_loop()
+        job = {'video_link': video_link, 'deadline': deadline}
+        try:
+            await self.prepare_video(job)
+            await loop.run_in_executor(self.decode_executor, self.decode_video, job)
+            await self.embed_video(job)
+            await loop.run_in_executor(self.search_executor, self.find_duplicates, job)
+            return job['result']
+        finally:
+            self.release_clip(job)
+            video_path = job.get('video_path')
+            if video_path and os.path.exists(video_path):
+                # os.remove(video_path)
+                logger.info(f'Video {video_path} has been deleted')
+    
+    
+    async def prepare_video(self, job: dict) -> dict:
+        """
+        Стадия скачивания, как Model.prepare_video, но видео по ссылке скачивается через aiohttp.
+        Постановка отпечатка аудио в пул может ждать свободного места, поэтому идет в потоке.
+        """
+        if 'http' in job['video_link']:
+            job['video_path'] = await self.fetch_video(job['video_link'])
+        return await asyncio.to_thread(super().prepare_video, job)
     
-    model = Model(config=config)
+    
+    async def fetch_video(self, link) -> str:
+        """
+        Асинхронный вариант download_video.
+
+        Args:
+            link (str): Ссылка на скачивание файла
+
+        Returns:
+            str: Путь к скачанному файлу
+        """
+        logger.info(f'Downloading {link}...')
+        try:
+            async with self.http.get(link) as response:
+                content = await response.read()
+        except Exception as e:
+            logger.error(f'Unable to download file {link}; error: {e}')
+            raise e
+        
+        filepath = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4').name
+        try:
+            await asyncio.to_thread(Path(filepath).write_bytes, content)
+        except Exception as e:
+            logger.error(f'Error saving file {link}; error: {e}')
+            raise e
+        
+        logger.success(f'Downloaded {link}')
+        return str(filepath)
+    
+    
+    async def embed_video(self, job: dict) -> dict:
+        """
+        Стадия инференса одного видео. Видео ждет, пока _embed_loop отправит его клип
+        в Triton вместе с клипами других одновременных видео.
+        """
+        if 'result' in job or 'features' in job:
+            return job
+        future = asyncio.get_running_loop().create_future()
+        await self.embed_queue.put((job, future))
+        await future
+        return job
+    
+    
+    async def _embed_loop(self) -> None:
+        """
+        Сбор клипов из embed_queue в батчи: батч отправляется, когда в нем pipeline_batch_size
+        клипов или с первого клипа прошло pipeline_batch_timeout. Пока батч в Triton,
+        копится следующий, поэтому batch_arena используется только этой корутиной.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.embed_queue.get()]
+            deadline = loop.time() + self.pipeline_batch_timeout
+            while len(items) < self.pipeline_batch_size:
+                try:
+                    items.append(await asyncio.wait_for(self.embed_queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+            
+            # Отмененные видео уже вернули свои буферы
+            items = [(job, future) for job, future in items if not future.cancelled()]
+            jobs = [job for job, _ in items]
+            if not jobs:
+                continue
+            try:
+                await self.embed_batch(jobs)
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for _, future in items:
+                    if not future.done():
+                        future.set_result(None)
+    
+    
+    async def embed_batch(self, jobs: list[dict]) -> None:
+        """
+        Асинхронный вариант embed_videos: полные клипы одним батчем, короткие по одному.
+        """
+        try:
+            clips = [self.take_clip(job) for job in jobs]
+            for request in self.group_clips(clips):
+                if len(request) == 1:
+                    last_hidden_state = (await self.async_timesformer(clips[request[0]]))[0]
+                else:
+                    with self.batch_arena.borrow() as batch:
+                        batch = np.concatenate([clips[i] for i in request], out=batch[:len(request)])
+                        last_hidden_state = (await self.async_timesformer(batch))[0]
+                self.set_features([jobs[i] for i in request], last_hidden_state)
+        finally:
+            for job in jobs:
+                self.release_clip(job)
+        logger.success(f'Feature requests sucessed for {len(jobs)} videos')
+
+
+def serve(config, **kwargs) -> None:
+    """
+    Запуск адаптера в текущем процессе. kwargs передаются в Model, например общий audio_store.
+    """
+    # Один процесс с asyncio обрабатывает десятки видео одновременно, sync - потоками брокера
+    if config.get('runtime', 'sync') == 'async':
+        return asyncio.run(serve_async(config, **kwargs))
+    
+    model = Model(config=config, **kwargs)
     
     broker = config['broker']
     match broker:
@@ -310,12 +874,85 @@ if __name__ == '__main__':
             broker = RabbitWrapper(config=config)
         case 'kafka':
             from ml_utils import KafkaWrapper
-            broker = KafkaWrapper(
-                config=config,
-                consumer_kwargs={"max_poll_interval_ms": 500 * 3600 * 1000, "enable_auto_commit": False}
-            )
+            broker = KafkaWrapper(config=config)
+            # Потоки партиций вызывают одну Model одновременно. Поиск и вставку по одному
+            # выполняет только стадия search в StagedPipeline, иначе одновременные дубликаты не найдут друг друга
+            if broker.partition_workers and model.pipeline is None:
+                logger.warning('KAFKA_PARTITION_WORKERS requires staged_pipeline = True, partitions are processed in the poll loop')
+                broker.partition_workers = False
+    
+    # docker stop присылает SIGTERM: брокер останавливается как по Ctrl+C, а close() записывает
+    # буфер отложенной вставки в Milvus. Иначе строки уже подтвержденных сообщений теряются
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        broker.listen(pipeline=model)
+    except KeyboardInterrupt:
+        logger.info('Adapter is stopping')
+    finally:
+        model.close()
+
+
+async def serve_async(config, **kwargs) -> None:
+    """
+    Запуск с runtime = async: AsyncModel и AsyncRabbitWrapper в одном event loop.
+    """
+    from ml_utils import AsyncRabbitWrapper
+    assert config['broker'] == 'rabbit', 'Async runtime supports only rabbit broker'
+    
+    model = AsyncModel(config=config, **kwargs)
+    broker = AsyncRabbitWrapper(config=config)
+    # По SIGTERM задача отменяется, и finally закрывает брокер и модель с записью буфера вставки
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        await model.start()
+        await broker.connect()
+        await broker.listen(pipeline=model)
+    except asyncio.CancelledError:
+        logger.info('Adapter is stopping')
+    finally:
+        await broker.close()
+        await model.aclose()
+
+
+def serve_workers(config, workers: int) -> None:
+    """
+    Запуск workers процессов адаптера под WorkerSupervisor. Отпечатки аудио загружаются один раз
+    в родителе: данные AudioStore лежат в mmap, а AudioIndex достается воркерам через fork
+    без копирования. Отпечатки, вставленные другими воркерами, каждый воркер дочитывает из хранилища
+    перед поиском (AudioIndex.sync). Соединения с Milvus, Triton и брокером каждый воркер открывает сам.
+    """
+    audio_store = AudioStore.open(config['audio_store'])
+    audio_index = AudioIndex.from_store(audio_store) if config.getboolean('audio_search', False) else None
+    logger.info(f'Len of audio {len(audio_store)}, starting {workers} workers')
+    
+    supervisor = WorkerSupervisor(
+        serve,
+        args=(config,),
+        kwargs={'audio_store': audio_store, 'audio_index': audio_index},
+        workers=workers,
+        threads_per_worker=int(config.get('adapter_threads_per_worker', 0)) or None,
+        name='adapter'
+    )
+    # docker stop присылает SIGTERM: воркеры останавливаются вместе с родителем
+    signal.signal(signal.SIGTERM, lambda *args: supervisor.stop())
+    try:
+        supervisor.run()
+    finally:
+        supervisor.stop()
+
+
+if __name__ == '__main__':
+    config = configparser.ConfigParser()
+    # config.read('/home/borntowarn/projects/borntowarn/find-duplicates/configs/resources.ini')
+    # config = config['adapter_local']
+    config.read(f'configs/resources.ini')
+    config = config['adapter_docker']
     
-    broker.listen(pipeline=model)
+    workers = int(config.get('adapter_workers', 1))
+    if workers > 1:
+        serve_workers(config, workers)
+    else:
+        serve(config)
     
     # Локальный запуск
     # import time
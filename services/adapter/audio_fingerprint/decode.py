@@ -0,0 +1,73 @@
+import os
+import subprocess
+import threading
+
+import numpy as np
+
+from . import sh_opt
+
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+
+CHUNK_DURATION = 60
+""" Seconds of audio the buffer grows by when the duration is not capped. """
+
+
+def read_audio(filename, sample_rate=None, max_duration=None, timeout=None):
+    """
+    Decodes the audio track of a file to mono int16 PCM.
+    ffmpeg decodes, downmixes and resamples the track and streams raw samples through a pipe
+    straight into a preallocated NumPy buffer, so the track is never held at the source rate.
+
+    :param filename: Path to the audio or video file
+    :param sample_rate: Output sample rate (SAMPLE_RATE by default)
+    :param max_duration: Decode only the first max_duration seconds (MAX_DURATION by default, None - whole track)
+    :param timeout: Time in seconds after which ffmpeg is killed, None - no limit
+    :returns: np.array of int16 samples
+    :raises TimeoutError: If ffmpeg has not finished in time
+    """
+    sample_rate = sample_rate or sh_opt.SAMPLE_RATE
+    max_duration = sh_opt.MAX_DURATION if max_duration is None else max_duration
+
+    cmd = [FFMPEG_BINARY, '-nostdin', '-v', 'error', '-i', str(filename), '-vn', '-ac', '1', '-ar', str(sample_rate)]
+    if max_duration:
+        cmd += ['-t', str(max_duration)]
+    cmd += ['-f', 's16le', '-acodec', 'pcm_s16le', 'pipe:1']
+
+    # Если длительность ограничена, буфер выделяется один раз, иначе растет кусками по CHUNK_DURATION
+    audio = np.empty(int(sample_rate * (max_duration or CHUNK_DURATION)), dtype='<i2')
+    pos = 0  # байт прочитано
+
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc:
+        # Зависший ffmpeg убивается, иначе чтение из pipe не вернется никогда
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            proc.kill()
+
+        timer = threading.Timer(timeout, kill) if timeout else None
+        if timer is not None:
+            timer.start()
+        try:
+            while True:
+                if pos == audio.nbytes:
+                    if max_duration:
+                        # Округление длительности в ffmpeg может дать несколько лишних отсчетов
+                        proc.stdout.read()
+                        break
+                    audio = np.concatenate([audio, np.empty(int(sample_rate * CHUNK_DURATION), dtype='<i2')])
+                n = proc.stdout.readinto(memoryview(audio).cast('B')[pos:])
+                if not n:
+                    break
+                pos += n
+            stderr = proc.stderr.read()
+            returncode = proc.wait()
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    if returncode != 0 and timed_out.is_set():
+        raise TimeoutError(f'ffmpeg has not decoded {filename} in {timeout} s')
+    if returncode != 0:
+        raise RuntimeError(f'ffmpeg failed to decode {filename}: {stderr.decode(errors="replace").strip()}')
+    return audio[:pos // 2]
@@ -0,0 +1,148 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+
+import numpy as np
+from loguru import logger
+
+from . import sh_opt
+from .shazam import find_peaks_chunked, fingerprint_file
+
+
+def _init_worker(options):
+    # Настройки, измененные в родительском процессе, не попадают в процессы, запущенные через spawn
+    for name, value in options.items():
+        setattr(sh_opt, name, value)
+
+
+def _warm_up():
+    # Первый вызов scipy в процессе догружает модули и готовит FFT
+    find_peaks_chunked(np.zeros(sh_opt.SAMPLE_RATE, dtype=np.int16))
+    return os.getpid()
+
+
+class FingerprintExecutor:
+    """
+    Audio fingerprinting in a pool of processes, so CPU-bound fingerprinting does not hold the GIL
+    of the caller and scales with cores.
+
+    Submission is bounded: submit() blocks while max_pending tasks are queued or running,
+    so a fast producer can't pile up an unbounded queue of files.
+    With max_workers=0 fingerprinting runs inline in the calling thread.
+    """
+
+    def __init__(self, max_workers=None, max_pending=None, timeout=None, max_duration=None):
+        """
+        :param max_workers: Number of worker processes (number of CPUs by default, 0 - no processes)
+        :param max_pending: Maximum number of queued and running tasks (2 * max_workers by default)
+        :param timeout: Default time in seconds to wait for a fingerprint in result(), None - no limit.
+            Decoding in a task is limited by the same time: a hung ffmpeg is killed, so it can't hold
+            a worker process and a submission slot forever
+        :param max_duration: Default number of first seconds to fingerprint (MAX_DURATION by default)
+        """
+        self.max_workers = os.cpu_count() if max_workers is None else max_workers
+        self.max_pending = max_pending or 2 * max(self.max_workers, 1)
+        self.timeout = timeout
+        self.max_duration = max_duration
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pool = None
+        if self.max_workers > 0:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(dict(vars(sh_opt)),)
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def warm_up(self):
+        """
+        Starts all worker processes and runs a short fingerprinting in each,
+        so the first requests don't pay for process start and imports.
+        """
+        if self._pool is None:
+            return
+        futures = [self._pool.submit(_warm_up) for _ in range(self.max_workers)]
+        pids = {future.result() for future in futures}
+        logger.info(f'Fingerprint workers are ready: {sorted(pids)}')
+
+    def submit(self, filename, max_duration=None):
+        """
+        Schedules fingerprinting of a file. Blocks while max_pending tasks are not finished.
+
+        :param filename: Path to the audio or video file
+        :param max_duration: Fingerprint only the first max_duration seconds (self.max_duration by default)
+        :returns: Future with the Fingerprint
+        """
+        max_duration = self.max_duration if max_duration is None else max_duration
+        self._slots.acquire()
+        if self._pool is None:
+            future = Future()
+            try:
+                future.set_result(fingerprint_file(str(filename), max_duration, self.timeout))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self._slots.release()
+            return future
+
+        try:
+            future = self._pool.submit(fingerprint_file, str(filename), max_duration, self.timeout)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def result(self, future, timeout=None):
+        """
+        Waits for the fingerprint of a submitted file.
+
+        :param timeout: Time in seconds to wait (self.timeout by default)
+        :raises TimeoutError: If the fingerprint is not ready in time. The task is cancelled if it has not started yet
+        """
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            if not future.cancel():
+                logger.warning(f'Fingerprinting is still running after {timeout} s')
+            raise
+
+    def fingerprint(self, filename, timeout=None):
+        """
+        Fingerprints a file in the pool and waits for the result.
+        """
+        return self.result(self.submit(filename), timeout)
+
+    def map(self, filenames, timeout=None):
+        """
+        Fingerprints files keeping at most max_pending of them in flight.
+
+        :returns: Iterator of (filename, Fingerprint or exception) in the order of filenames
+        """
+        pending = deque()
+
+        def pop():
+            filename, future = pending.popleft()
+            try:
+                return filename, self.result(future, timeout)
+            except Exception as e:
+                return filename, e
+
+        for filename in filenames:
+            # Слот освобождается только после завершения задачи, поэтому сначала отдаем готовые результаты
+            while len(pending) >= self.max_pending:
+                yield pop()
+            pending.append((filename, self.submit(filename)))
+        while pending:
+            yield pop()
+
+    def shutdown(self, wait=True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,148 @@
+import threading
+
+import numpy as np
+
+from . import sh_opt
+
+
+class AudioIndex:
+    """
+    Inverted index of packed fingerprints: hash -> postings (video, anchor time).
+
+    Postings are kept as arrays sorted by hash, so all hashes of a query are looked up
+    with one searchsorted. New videos go to a small delta segment which is merged
+    into the main one when it grows over merge_size postings.
+
+    Matches are scored with time-offset histograms: a real match has many common hashes
+    with the same offset between the candidate and the query anchor times, while random
+    collisions are spread over all offsets.
+    """
+
+    def __init__(self, merge_size=100000):
+        """
+        :param merge_size: Number of postings in the delta segment before it is merged
+        """
+        self.merge_size = merge_size
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._store_position = 0
+        self._video_ids = []
+        self._docs = {}
+        self._main = self._empty_segment()
+        self._delta = self._empty_segment()
+
+    def __len__(self):
+        return len(self._video_ids)
+
+    @classmethod
+    def from_store(cls, store, **kwargs):
+        """
+        Builds the index from all fingerprints of an AudioStore.
+        """
+        index = cls(**kwargs)
+        if hasattr(store, 'keys_since'):
+            _, index._store_position = store.keys_since(0)
+        video_ids, fingerprints = [], []
+        for video_id, fingerprint in store.items():
+            index._docs[video_id] = len(index._video_ids)
+            index._video_ids.append(video_id)
+            video_ids.append(index._docs[video_id])
+            fingerprints.append(fingerprint)
+        index._main = index._make_segment(video_ids, fingerprints)
+        return index
+
+    def add(self, video_id, fingerprint):
+        """
+        Adds the fingerprint of a video. A video can be added only once.
+        """
+        with self._lock:
+            if video_id in self._docs:
+                return
+            self._docs[video_id] = len(self._video_ids)
+            self._video_ids.append(video_id)
+            if len(fingerprint) == 0:
+                return
+            segment = self._make_segment([self._docs[video_id]], [fingerprint])
+            self._delta = self._merge(self._delta, segment)
+            if len(self._delta[0]) >= self.merge_size:
+                self._main = self._merge(self._main, self._delta)
+                self._delta = self._empty_segment()
+
+    def sync(self, store):
+        """
+        Adds the fingerprints appended to an AudioStore since the index was built or last synced,
+        including ones written by other processes (e.g. other adapter workers sharing the store).
+        New videos go to the delta segment, so the main segment stays shared between forked workers
+        until the delta is merged.
+        """
+        with self._sync_lock:
+            store.refresh()
+            video_ids, self._store_position = store.keys_since(self._store_position)
+            for video_id in video_ids:
+                self.add(video_id, store[video_id])
+
+    def search(self, fingerprint, limit=10, min_matches=5):
+        """
+        Finds videos with the most hashes aligned at one time offset with the query.
+
+        :param fingerprint: Fingerprint of the query
+        :param limit: Maximum number of videos in the result
+        :param min_matches: Minimum number of aligned hashes for a video to be returned
+        :returns: List of (video_id, number of aligned hashes), best first
+        """
+        if len(fingerprint) == 0:
+            return []
+        with self._lock:
+            segments = [self._main, self._delta]
+            n_docs = len(self._video_ids)
+            video_ids = self._video_ids
+
+        docs, offsets = [], []
+        for segment in segments:
+            d, o = self._lookup(segment, fingerprint)
+            docs.append(d)
+            offsets.append(o)
+        docs, offsets = np.concatenate(docs), np.concatenate(offsets)
+        if len(docs) == 0:
+            return []
+
+        # Histogram of (video, offset) pairs, score of a video is its highest bin
+        keys = (docs.astype(np.int64) << 32) | (offsets - offsets.min())
+        keys, counts = np.unique(keys, return_counts=True)
+        best = np.zeros(n_docs, dtype=np.int64)
+        np.maximum.at(best, keys >> 32, counts)
+
+        found = np.flatnonzero(best >= min_matches)
+        found = found[np.argsort(-best[found], kind='stable')][:limit]
+        return [(video_ids[doc], int(best[doc])) for doc in found]
+
+    @staticmethod
+    def _lookup(segment, fingerprint):
+        hashes, docs, times = segment
+        lo = np.searchsorted(hashes, fingerprint.hashes, side='left')
+        hi = np.searchsorted(hashes, fingerprint.hashes, side='right')
+        counts = hi - lo
+        queries = np.repeat(np.arange(len(fingerprint)), counts)
+        postings = np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        offsets = np.rint((times[postings] - fingerprint.times[queries]) / sh_opt.HASH_DT_STEP).astype(np.int64)
+        return docs[postings], offsets
+
+    @staticmethod
+    def _empty_segment():
+        return np.empty(0, np.uint32), np.empty(0, np.int32), np.empty(0, np.float32)
+
+    @staticmethod
+    def _make_segment(docs, fingerprints):
+        if not fingerprints:
+            return AudioIndex._empty_segment()
+        hashes = np.concatenate([fp.hashes for fp in fingerprints])
+        times = np.concatenate([fp.times for fp in fingerprints])
+        docs = np.repeat(np.asarray(docs, dtype=np.int32), [len(fp) for fp in fingerprints])
+        order = np.argsort(hashes, kind='stable')
+        return hashes[order], docs[order], times[order]
+
+    @staticmethod
+    def _merge(segment1, segment2):
+        hashes, docs, times = (np.concatenate([a, b]) for a, b in zip(segment1, segment2))
+        order = np.argsort(hashes, kind='stable')
+        return hashes[order], docs[order], times[order]
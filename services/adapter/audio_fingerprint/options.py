@@ -33,4 +33,28 @@ class ShazamOptions:
     FFT_WINDOW_SIZE = 0.2
     """ The number of seconds of audio to use in each spectrogram segment. Larger windows mean higher
     frequency resolution but lower time resolution in the spectrogram.
+    """
+    SPECTROGRAM_CHUNK = 1024
+    """ The number of spectrogram segments computed at once when fingerprinting.
+    Bounds the memory used for long files; does not change the peaks found.
+    """
+    MAX_DURATION = None
+    """ Only the first MAX_DURATION seconds of audio are fingerprinted. None means the whole track.
+    Long uploads are decoded only up to this point.
+    """
+    HASH_FREQ_BITS = 12
+    """ The number of bits for each quantized frequency of a peak pair in the packed hash.
+    """
+    HASH_FREQ_STEP = 5.0
+    """ The frequency quantization step in Hz. Equals the spectrogram frequency resolution
+    (1 / FFT_WINDOW_SIZE), so the quantized frequency is just the index of the spectrogram bin.
+    """
+    HASH_DT_BITS = 8
+    """ The number of bits for the quantized time delta between the anchor and the target.
+    2 * HASH_FREQ_BITS + HASH_DT_BITS must fit into 32 bits.
+    """
+    HASH_DT_STEP = 0.175
+    """ The time delta quantization step in seconds. Equals the spectrogram hop
+    (7/8 of FFT_WINDOW_SIZE with the default overlap), so deltas are whole numbers of steps
+    and rounding is stable. HASH_DT_STEP * 2 ** HASH_DT_BITS must cover TARGET_START + TARGET_T.
     """
\ No newline at end of file
@@ -0,0 +1,58 @@
+import threading
+from functools import partial
+
+from loguru import logger
+
+from .shazam import Fingerprint
+
+
+class PendingFingerprints:
+    """
+    Fingerprints which are still being computed and are saved to an AudioStore when ready.
+
+    A video stays pending until its fingerprint is written, so lookups can wait for the future
+    instead of missing the fingerprint. A failed computation is saved as an empty fingerprint.
+    """
+
+    def __init__(self, store):
+        """
+        :param store: AudioStore the fingerprints are saved to
+        """
+        self.store = store
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, video_id):
+        return video_id in self._futures
+
+    def __len__(self):
+        return len(self._futures)
+
+    def get(self, video_id):
+        """
+        Returns the future of a pending video or None.
+        """
+        return self._futures.get(video_id)
+
+    def save_later(self, video_id, future):
+        """
+        Saves the result of the future to the store when it is done, without waiting for it.
+        """
+        with self._lock:
+            self._futures[video_id] = future
+        future.add_done_callback(partial(self._save, video_id))
+
+    def _save(self, video_id, future):
+        try:
+            fingerprint = future.result()
+        except Exception:
+            fingerprint = Fingerprint()
+        try:
+            self.store[video_id] = fingerprint
+            logger.info(f'Audio fingerprint of {video_id} has been saved')
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            with self._lock:
+                if self._futures.get(video_id) is future:
+                    del self._futures[video_id]
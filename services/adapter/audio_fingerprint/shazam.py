@@ -1,9 +1,55 @@
+from dataclasses import dataclass, field
+
 import numpy as np
-from pydub import AudioSegment
+from loguru import logger
 from moviepy.editor import VideoFileClip
 from scipy.signal import spectrogram
 from scipy.ndimage import maximum_filter
 from . import sh_opt
+from .decode import read_audio
+
+
+@dataclass(eq=False)
+class Fingerprint:
+    """
+    Packed fingerprint of an audio file: hashes of peak pairs and anchor times, sorted by hash.
+    """
+    hashes: np.ndarray = field(default_factory=lambda: np.empty(0, np.uint32))
+    """ uint32 hashes of peak pairs (see pack_hashes). """
+    times: np.ndarray = field(default_factory=lambda: np.empty(0, np.float32))
+    """ Time of the anchor peak of each pair in seconds. """
+    unique: np.ndarray = None
+    """ Sorted unique hashes. Computed from hashes if not given (e.g. precomputed by AudioStore). """
+
+    def __post_init__(self):
+        self.hashes = np.asarray(self.hashes, dtype=np.uint32)
+        self.times = np.asarray(self.times, dtype=np.float32)
+        if self.unique is None:
+            # hashes are usually sorted, but a Fingerprint can be built from any arrays
+            self.unique = np.unique(self.hashes)
+        self.unique = np.asarray(self.unique, dtype=np.uint32)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @property
+    def nbytes(self):
+        return self.hashes.nbytes + self.times.nbytes
+
+    def truncated(self, max_duration):
+        """
+        Fingerprint of the first max_duration seconds only: pairs whose target peak is later are dropped.
+        A stored fingerprint of a whole track then compares with a capped query as if it was capped too.
+
+        :param max_duration: Duration in seconds, None or 0 - the fingerprint is returned as is
+        """
+        if not max_duration or len(self) == 0:
+            return self
+        dt = (self.hashes & ((1 << sh_opt.HASH_DT_BITS) - 1)) * sh_opt.HASH_DT_STEP
+        keep = self.times + dt <= max_duration
+        if keep.all():
+            return self
+        return Fingerprint(self.hashes[keep], self.times[keep])
 
 
 def mp4_to_wav(mp4_file, wav_file):
@@ -15,19 +61,63 @@ def mp4_to_wav(mp4_file, wav_file):
     audio.write_audiofile(wav_file)
 
 
-def file_to_spectrogram(filename):
+def spectrogram_params():
+    """
+    Parameters of the spectrogram with the specified SAMPLE_RATE and FFT_WINDOW_SIZE.
+
+    :returns: nperseg - samples in a segment, step - samples between segments (default overlap of 1/8)
+    """
+    nperseg = int(sh_opt.SAMPLE_RATE * sh_opt.FFT_WINDOW_SIZE)
+    return nperseg, nperseg - nperseg // 8
+
+
+def file_to_spectrogram(filename, max_duration=None):
     """
     Generates a spectrogram with the specified SAMPLE_RATE and FFT_WINDOW_SIZE.
 
     :param filename: Path to the audio file
+    :param max_duration: Use only the first max_duration seconds of audio (MAX_DURATION by default)
     :returns:   f - np.array of frequencies
                 t - np.array of time segments
-                Sxx - np.array of power (magnitude) for each time/frequency pair
+                Sxx - float32 np.array of power (magnitude) for each time/frequency pair
     """
-    a = AudioSegment.from_file(filename).set_channels(1).set_frame_rate(sh_opt.SAMPLE_RATE)
-    audio = np.frombuffer(a.raw_data, np.int16)
-    nperseg = int(sh_opt.SAMPLE_RATE * sh_opt.FFT_WINDOW_SIZE)
-    return spectrogram(audio, sh_opt.SAMPLE_RATE, nperseg=nperseg)
+    audio = read_audio(filename, max_duration=max_duration)
+    nperseg, _ = spectrogram_params()
+    return spectrogram(audio.astype(np.float32), sh_opt.SAMPLE_RATE, nperseg=nperseg)
+
+
+def peak_target(shape):
+    """
+    The number of peaks kept for a spectrogram of the given shape.
+    """
+    total = shape[0] * shape[1]
+    return int((total / (sh_opt.PEAK_BOX_SIZE ** 2)) * sh_opt.POINT_EFFICIENCY)
+
+
+def local_maxima(Sxx, start=0, stop=None):
+    """
+    Finds local maxima of the spectrogram in the columns [start, stop).
+    Columns outside of this range are used only as neighbours, so a chunk of a spectrogram
+    extended by PEAK_BOX_SIZE // 2 + 1 columns on each side gives the same maxima as the whole one.
+
+    :returns: Arrays of frequency indexes, time indexes (relative to start) and values of maxima
+    """
+    data_max = maximum_filter(Sxx, size=sh_opt.PEAK_BOX_SIZE, mode='constant', cval=0.0)
+    core = slice(start, stop)
+    peak_goodmask = (Sxx[:, core] == data_max[:, core])  # пики помечаем значениями True
+    y_peaks, x_peaks = peak_goodmask.nonzero()
+    return y_peaks, x_peaks, Sxx[:, core][y_peaks, x_peaks]
+
+
+def top_k(values, k):
+    """
+    Indexes of the k largest values, sorted from the largest.
+    """
+    if len(values) > k:
+        idx = np.argpartition(-values, k - 1)[:k] if k > 0 else np.empty(0, dtype=np.int64)
+    else:
+        idx = np.arange(len(values))
+    return idx[np.argsort(-values[idx], kind='stable')]
 
 
 def find_peaks(Sxx):
@@ -35,18 +125,52 @@ def find_peaks(Sxx):
     Finds peaks in the spectrogram.
 
     :param Sxx: Spectrogram
-    :returns: List of tuples (peaks in the form of (frequency, time))
+    :returns: np.array of peak indexes in the form of (frequency, time), the highest first
     """
-    data_max = maximum_filter(Sxx, size=sh_opt.PEAK_BOX_SIZE, mode='constant', cval=0.0)
-    peak_goodmask = (Sxx == data_max)  # пики помечаем значениями True
-    y_peaks, x_peaks = peak_goodmask.nonzero()
-    peak_values = Sxx[y_peaks, x_peaks]
-    i = peak_values.argsort()[::-1]
-    j = [(y_peaks[idx], x_peaks[idx]) for idx in i]
-    total = Sxx.shape[0] * Sxx.shape[1]
+    y_peaks, x_peaks, peak_values = local_maxima(Sxx)
+    i = top_k(peak_values, peak_target(Sxx.shape))  # Сколько пиков оставим
+    return np.stack([y_peaks[i], x_peaks[i]], axis=1)
 
-    peak_target = int((total / (sh_opt.PEAK_BOX_SIZE ** 2)) * sh_opt.POINT_EFFICIENCY)  # Сколько пиков оставим
-    return j[:peak_target]
+
+def find_peaks_chunked(audio, chunk_frames=None):
+    """
+    Finds peaks of the spectrogram of an audio signal without building the whole spectrogram.
+    The float32 spectrogram is computed by chunks of chunk_frames segments with a halo of
+    PEAK_BOX_SIZE // 2 + 1 segments on each side, so local maxima are the same as in find_peaks.
+    Only the top peaks found so far are kept between chunks.
+
+    :param audio: np.array of samples at SAMPLE_RATE
+    :param chunk_frames: Spectrogram segments in a chunk (SPECTROGRAM_CHUNK by default)
+    :returns: np.array of time/frequency pairs, the highest peaks first
+    """
+    chunk_frames = chunk_frames or sh_opt.SPECTROGRAM_CHUNK
+    nperseg, step = spectrogram_params()
+    n_frames = (len(audio) - nperseg) // step + 1 if len(audio) >= nperseg else 0
+    n_freqs = nperseg // 2 + 1
+    k = peak_target((n_freqs, n_frames))
+    halo = sh_opt.PEAK_BOX_SIZE // 2 + 1
+
+    y_peaks = np.empty(0, dtype=np.int64)
+    x_peaks = np.empty(0, dtype=np.int64)
+    peak_values = np.empty(0, dtype=np.float32)
+    for start in range(0, n_frames, chunk_frames):
+        stop = min(start + chunk_frames, n_frames)
+        lo, hi = max(0, start - halo), min(n_frames, stop + halo)
+        _, _, Sxx = spectrogram(
+            audio[lo * step:(hi - 1) * step + nperseg].astype(np.float32),
+            sh_opt.SAMPLE_RATE,
+            nperseg=nperseg
+        )
+        y, x, values = local_maxima(Sxx, start - lo, stop - lo)
+        y_peaks = np.concatenate([y_peaks, y])
+        x_peaks = np.concatenate([x_peaks, x + start])
+        peak_values = np.concatenate([peak_values, values])
+        i = top_k(peak_values, k)
+        y_peaks, x_peaks, peak_values = y_peaks[i], x_peaks[i], peak_values[i]
+
+    f = np.fft.rfftfreq(nperseg, 1 / sh_opt.SAMPLE_RATE)
+    t = (np.arange(n_frames) * step + nperseg / 2) / sh_opt.SAMPLE_RATE
+    return idxs_to_tf_pairs(np.stack([y_peaks, x_peaks], axis=1), t, f)
 
 
 def idxs_to_tf_pairs(idxs, t, f):
@@ -58,7 +182,27 @@ def idxs_to_tf_pairs(idxs, t, f):
     :param f: Frequency array
     :returns: Array of time/frequency pairs
     """
-    return np.array([(f[i[0]], t[i[1]]) for i in idxs])
+    idxs = np.asarray(idxs, dtype=np.int64).reshape(-1, 2)
+    return np.stack([f[idxs[:, 0]], t[idxs[:, 1]]], axis=1)
+
+
+def pack_hashes(f1, f2, dt):
+    """
+    Packs quantized frequencies of the anchor and the target and the time delta between them
+    into uint32 hashes: f1 | f2 | dt, HASH_FREQ_BITS, HASH_FREQ_BITS and HASH_DT_BITS wide.
+    Unlike Python's hash the result is the same in every process and Python version.
+
+    :param f1: Frequencies of anchor points
+    :param f2: Frequencies of target points
+    :param dt: Time deltas between targets and anchors in seconds
+    :returns: np.array of uint32 hashes
+    """
+    f_max = (1 << sh_opt.HASH_FREQ_BITS) - 1
+    dt_max = (1 << sh_opt.HASH_DT_BITS) - 1
+    f1 = np.clip(np.rint(np.asarray(f1) / sh_opt.HASH_FREQ_STEP), 0, f_max).astype(np.uint32)
+    f2 = np.clip(np.rint(np.asarray(f2) / sh_opt.HASH_FREQ_STEP), 0, f_max).astype(np.uint32)
+    dt = np.clip(np.rint(np.asarray(dt) / sh_opt.HASH_DT_STEP), 0, dt_max).astype(np.uint32)
+    return (f1 << (sh_opt.HASH_FREQ_BITS + sh_opt.HASH_DT_BITS)) | (f2 << sh_opt.HASH_DT_BITS) | dt
 
 
 def hash_point_pair(p1, p2):
@@ -69,7 +213,7 @@ def hash_point_pair(p1, p2):
     :param p2: Second point (frequency, time)
     :returns: Hashed value of the pair
     """
-    return hash((p1[0], p2[0], p2[1] - p2[1]))
+    return int(pack_hashes(p1[0], p2[0], p2[1] - p1[1]))
 
 
 def target_zone(anchor, points, width, height, t):
@@ -95,35 +239,75 @@ def target_zone(anchor, points, width, height, t):
         yield point
 
 
+def pair_points(points, width=None, height=None, t=None):
+    """
+    Finds all (anchor, target) pairs of peaks where target lies in the anchor's target zone.
+    Same pairs and order as iterating target_zone over every anchor, but the peaks are sorted
+    by time once and each anchor's window is found with searchsorted, so the cost is
+    O(P log P + pairs) in NumPy instead of O(P^2) Python iterations.
+
+    :param points: Array of peaks (frequency, time)
+    :param width: Width of the target zone (TARGET_T by default)
+    :param height: Height of the target zone (TARGET_F by default)
+    :param t: Seconds between the start of the target zone and the anchor point (TARGET_START by default)
+    :returns: Tuple of index arrays (anchors, targets) into points
+    """
+    width = sh_opt.TARGET_T if width is None else width
+    height = sh_opt.TARGET_F if height is None else height
+    t = sh_opt.TARGET_START if t is None else t
+
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    order = np.argsort(points[:, 1], kind='stable')
+    times = points[order, 1]
+
+    # Time window of every anchor: [x_min, x_max] in the sorted times
+    x_min = points[:, 1] + t
+    x_max = x_min + width
+    lo = np.searchsorted(times, x_min, side='left')
+    hi = np.searchsorted(times, x_max, side='right')
+    counts = hi - lo
+
+    anchors = np.repeat(np.arange(len(points)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    targets = order[np.repeat(lo, counts) + offsets]
+
+    # Frequency band of the anchor's target zone
+    y_min = points[anchors, 0] - (height * 0.5)
+    y_max = y_min + height
+    freqs = points[targets, 0]
+    mask = (freqs >= y_min) & (freqs <= y_max)
+    anchors, targets = anchors[mask], targets[mask]
+
+    # Targets of each anchor in the original order of points
+    i = np.lexsort((targets, anchors))
+    return anchors[i], targets[i]
+
+
 def hash_points(points):
     """
     Creates hashes for peaks (forms pairs of peaks from the target zone for each peak).
 
     :param points: List of peaks
-    :returns: List of tuples in the form (hash of the peak pair, time difference, video_id)
+    :returns: Fingerprint with the hash and the anchor time of every pair
     """
-    hashes = []
-    for anchor in points:
-        for target in target_zone(
-                anchor, points, sh_opt.TARGET_T, sh_opt.TARGET_F, sh_opt.TARGET_START
-        ):
-            hashes.append((
-                hash_point_pair(anchor, target),
-                anchor[1],
-                target[1],
-            ))
-    return hashes
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    anchors, targets = pair_points(points)
+    hashes = pack_hashes(points[anchors, 0], points[targets, 0], points[targets, 1] - points[anchors, 1])
+    order = np.argsort(hashes, kind='stable')
+    return Fingerprint(hashes[order], points[anchors[order], 1])
 
 
-def fingerprint_file(filename):
+def fingerprint_file(filename, max_duration=None, timeout=None):
     """
     Generates the fingerprint (hash) from the audio file.
 
-    :returns: Output of hash_points function
+    :param filename: Path to the audio or video file
+    :param max_duration: Fingerprint only the first max_duration seconds (MAX_DURATION by default)
+    :param timeout: Time in seconds to decode the audio, None - no limit
+    :returns: Fingerprint of the file (output of hash_points function)
     """
-    f, t, Sxx = file_to_spectrogram(filename)
-    peaks = find_peaks(Sxx)
-    peaks = idxs_to_tf_pairs(peaks, t, f)
+    audio = read_audio(filename, max_duration=max_duration, timeout=timeout)
+    peaks = find_peaks_chunked(audio)
     return hash_points(peaks)
 
 
@@ -131,28 +315,50 @@ def compare_fingerprints(fingerprints1, fingerprints2):
     """
     Compares the fingerprints of two files.
 
-    :param file1: Path to the first audio file
-    :param file2: Path to the second audio file
+    :param fingerprints1: Fingerprint of the first file
+    :param fingerprints2: Fingerprint of the second file
     :returns: A similarity score between the two files
     """
-    
-    # Extract only the hashes from the fingerprints
-    hashes1 = {fp[0] for fp in fingerprints1}
-    hashes2 = {fp[0] for fp in fingerprints2}
-
-    # Calculate the number of common hashes
-    common_hashes = hashes1.intersection(hashes2)
-    
-    # Calculate similarity score
-    total_hashes = len(hashes1.union(hashes2))
-    similarity = len(common_hashes) / total_hashes if total_hashes > 0 else 0
-
-    print(f"Number of common hashes: {len(common_hashes)}")
-    print(f"Total unique hashes: {total_hashes}")
-    print(f"Similarity score: {similarity * 100:.2f}%")
-    
+    return float(compare_fingerprints_batch(fingerprints1, [fingerprints2])[0])
+
+
+def compare_fingerprints_batch(query, candidates):
+    """
+    Compares the fingerprint of a query with the fingerprints of all candidates at once.
+    The similarity is the Jaccard index of unique hashes. Unique hashes of all candidates
+    are concatenated and looked up in the sorted unique hashes of the query with one searchsorted.
+
+    :param query: Fingerprint of the query
+    :param candidates: List of candidate fingerprints
+    :returns: np.array of similarity scores, one for each candidate
+    """
+    if len(candidates) == 0:
+        return np.zeros(0)
+    query_hashes = query.unique
+    lengths = np.array([len(c.unique) for c in candidates], dtype=np.int64)
+    candidate_hashes = np.concatenate([c.unique for c in candidates])
+
+    # Calculate the number of common hashes of each candidate
+    if len(query_hashes) > 0 and len(candidate_hashes) > 0:
+        idx = np.searchsorted(query_hashes, candidate_hashes).clip(max=len(query_hashes) - 1)
+        common = query_hashes[idx] == candidate_hashes
+    else:
+        common = np.zeros(len(candidate_hashes), dtype=bool)
+    owners = np.repeat(np.arange(len(candidates)), lengths)
+    common_hashes = np.bincount(owners, weights=common, minlength=len(candidates))
+
+    # Calculate similarity scores
+    total_hashes = len(query_hashes) + lengths - common_hashes
+    similarity = np.divide(common_hashes, total_hashes, out=np.zeros(len(candidates)), where=total_hashes > 0)
+
+    for n in range(len(candidates)):
+        logger.debug(
+            f"Common hashes: {int(common_hashes[n])}, total unique hashes: {int(total_hashes[n])}, "
+            f"similarity score: {similarity[n] * 100:.2f}%"
+        )
     return similarity
 
+
 if __name__ == '__main__':
     # Example usage:
     file1 = "2cf8f595-acd3-489f-b4ca-86d02c4e1eb2.wav"
@@ -0,0 +1,322 @@
+import fcntl
+import os
+import pickle
+import threading
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from .shazam import Fingerprint, fingerprint_file
+
+
+class AudioStore:
+    """
+    Append-only on-disk storage of packed audio fingerprints by video_id.
+
+    The store is a folder with four files:
+        hashes.u32  - concatenated uint32 hashes of all fingerprints
+        times.f32   - concatenated float32 anchor times
+        unique.u32  - concatenated sorted unique hashes of all fingerprints, precomputed for scoring
+        entries.tsv - lines "video_id<TAB>offset<TAB>length<TAB>unique_offset<TAB>unique_length"
+                      pointing into the data files
+
+    A fingerprint is appended to the data files and fsynced before its entry line is written,
+    so after a crash the store contains only complete fingerprints: a truncated last line
+    and data without an entry are ignored (and cut off by the next writer).
+    Data files are memory-mapped read-only, so opening the store only parses the entries
+    and fingerprints are views into the page cache shared by all processes with the store open.
+    Later entries for the same video_id replace earlier ones.
+
+    Stores written before unique hashes were kept (entries "video_id<TAB>offset<TAB>length")
+    are upgraded by the first writer that opens them, see _upgrade_entries().
+    """
+
+    HASHES = 'hashes.u32'
+    TIMES = 'times.f32'
+    UNIQUE = 'unique.u32'
+    ENTRIES = 'entries.tsv'
+    LOCK = '.lock'
+    MIGRATED = '.migrated'
+
+    def __init__(self, path, readonly=False):
+        """
+        :param path: Folder of the store, created if it does not exist
+        :param readonly: Open without write access. Entries appended by a writer
+            in another process become visible after refresh()
+        """
+        self.path = Path(path)
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._order = []
+        self._entries_pos = 0
+        self._end = 0
+        self._unique_end = 0
+        self._hashes = np.empty(0, np.uint32)
+        self._times = np.empty(0, np.float32)
+        self._unique = np.empty(0, np.uint32)
+
+        if not readonly:
+            os.makedirs(self.path, exist_ok=True)
+            for name in (self.HASHES, self.TIMES, self.UNIQUE, self.ENTRIES, self.LOCK):
+                (self.path / name).touch(exist_ok=True)
+            with self._file_lock():
+                if self._has_legacy_entries():
+                    self._upgrade_entries()
+                self._read_entries()
+                self._repair()
+        else:
+            if self._has_legacy_entries():
+                raise ValueError(f'Audio store {self.path} has the old entries layout, open it for writing once to upgrade')
+            self._read_entries()
+        self._map()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, video_id):
+        return video_id in self._entries
+
+    def __getitem__(self, video_id):
+        offset, length, unique_offset, unique_length = self._entries[video_id]
+        if offset + length > len(self._hashes) or unique_offset + unique_length > len(self._unique):
+            self._map()
+        return Fingerprint(
+            self._hashes[offset:offset + length],
+            self._times[offset:offset + length],
+            self._unique[unique_offset:unique_offset + unique_length]
+        )
+
+    def __setitem__(self, video_id, fingerprint):
+        self.append(video_id, fingerprint)
+
+    def get(self, video_id, default=None):
+        return self[video_id] if video_id in self._entries else default
+
+    def keys(self):
+        return self._entries.keys()
+
+    def items(self):
+        for video_id in list(self._entries):
+            yield video_id, self[video_id]
+
+    def keys_since(self, position):
+        """
+        Video ids of the entries read after the first position ones, in the order of appending.
+        Together with refresh() lets an AudioIndex pick up videos appended by other processes.
+
+        :returns: (list of video ids, new position)
+        """
+        with self._lock:
+            return self._order[position:], len(self._order)
+
+    @property
+    def nbytes(self):
+        return self._end * 8 + self._unique_end * 4
+
+    def append(self, video_id, fingerprint):
+        """
+        Durably appends the fingerprint of a video.
+        """
+        assert not self.readonly, 'Store is opened read-only'
+        assert '\t' not in video_id and '\n' not in video_id, f'Invalid video_id {video_id!r}'
+        hashes = np.ascontiguousarray(fingerprint.hashes, dtype='<u4')
+        times = np.ascontiguousarray(fingerprint.times, dtype='<f4')
+        unique = np.ascontiguousarray(fingerprint.unique, dtype='<u4')
+
+        with self._lock, self._file_lock():
+            # Другой процесс мог дописать хранилище после нашего последнего чтения
+            self._read_entries()
+            offset, unique_offset = self._end, self._unique_end
+            for name, data, start in (
+                (self.HASHES, hashes, offset),
+                (self.TIMES, times, offset),
+                (self.UNIQUE, unique, unique_offset),
+            ):
+                with open(self.path / name, 'r+b') as f:
+                    f.seek(start * data.itemsize)
+                    f.write(data.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            line = f'{video_id}\t{offset}\t{len(hashes)}\t{unique_offset}\t{len(unique)}\n'.encode('utf-8')
+            with open(self.path / self.ENTRIES, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._entries[video_id] = (offset, len(hashes), unique_offset, len(unique))
+            self._order.append(video_id)
+            self._entries_pos += len(line)
+            self._end = offset + len(hashes)
+            self._unique_end = unique_offset + len(unique)
+
+    def refresh(self):
+        """
+        Picks up fingerprints appended by other processes.
+        """
+        with self._lock:
+            self._read_entries()
+        self._map()
+
+    def _read_entries(self):
+        with open(self.path / self.ENTRIES, 'rb') as f:
+            f.seek(self._entries_pos)
+            data = f.read()
+        size = min(os.path.getsize(self.path / self.HASHES), os.path.getsize(self.path / self.TIMES)) // 4
+        unique_size = os.path.getsize(self.path / self.UNIQUE) // 4
+        # Последняя строка без перевода строки еще дописывается или оборвана сбоем
+        for line in data.split(b'\n')[:-1]:
+            # Полная строка, которая не разбирается, - это не оборванная запись: хранилище нельзя обрезать
+            video_id, offset, length, unique_offset, unique_length = self._parse_entry(line, 5)
+            if offset + length > size or unique_offset + unique_length > unique_size:
+                break
+            self._entries[video_id] = (offset, length, unique_offset, unique_length)
+            self._order.append(video_id)
+            self._entries_pos += len(line) + 1
+            self._end = max(self._end, offset + length)
+            self._unique_end = max(self._unique_end, unique_offset + unique_length)
+
+    def _parse_entry(self, line, fields):
+        try:
+            video_id, *entry = line.decode('utf-8').split('\t')
+            if len(entry) != fields - 1:
+                raise ValueError(f'expected {fields} fields, got {len(entry) + 1}')
+            return (video_id, *map(int, entry))
+        except ValueError as e:
+            raise ValueError(f'Invalid entry {line!r} in audio store {self.path}: {e}') from None
+
+    def _has_legacy_entries(self):
+        with open(self.path / self.ENTRIES, 'rb') as f:
+            line = f.readline()
+        return line.endswith(b'\n') and line.count(b'\t') == 2
+
+    def _upgrade_entries(self):
+        """
+        Converts entries of the layout without unique hashes: unique hashes of every fingerprint
+        are computed from hashes.u32, then unique.u32 and entries.tsv are replaced atomically.
+        An interrupted upgrade leaves the old entries in place and is done again on the next open.
+        """
+        with open(self.path / self.ENTRIES, 'rb') as f:
+            data = f.read()
+        size = os.path.getsize(self.path / self.HASHES) // 4
+        hashes = np.memmap(self.path / self.HASHES, dtype='<u4', mode='r', shape=(size,)) if size else np.empty(0, '<u4')
+
+        lines, unique_end = [], 0
+        with open(self.path / (self.UNIQUE + '.tmp'), 'wb') as unique_file:
+            # Оборванная последняя строка отбрасывается, ее данные обрежет _repair
+            for line in data.split(b'\n')[:-1]:
+                video_id, offset, length = self._parse_entry(line, 3)
+                if offset + length > size:
+                    break
+                unique = np.unique(hashes[offset:offset + length]).astype('<u4')
+                unique_file.write(unique.tobytes())
+                lines.append(f'{video_id}\t{offset}\t{length}\t{unique_end}\t{len(unique)}\n')
+                unique_end += len(unique)
+            unique_file.flush()
+            os.fsync(unique_file.fileno())
+        with open(self.path / (self.ENTRIES + '.tmp'), 'wb') as f:
+            f.write(''.join(lines).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        del hashes
+        os.replace(self.path / (self.UNIQUE + '.tmp'), self.path / self.UNIQUE)
+        os.replace(self.path / (self.ENTRIES + '.tmp'), self.path / self.ENTRIES)
+        logger.info(f'Audio store {self.path} has been upgraded: unique hashes of {len(lines)} entries are stored')
+
+    def _repair(self):
+        """
+        Cuts off the incomplete tail left by a crash during append.
+        """
+        truncated = False
+        for name, itemsize, size in (
+            (self.ENTRIES, 1, self._entries_pos),
+            (self.HASHES, 4, self._end),
+            (self.TIMES, 4, self._end),
+            (self.UNIQUE, 4, self._unique_end),
+        ):
+            if os.path.getsize(self.path / name) > size * itemsize:
+                os.truncate(self.path / name, size * itemsize)
+                truncated = True
+        if truncated:
+            logger.warning(f'Incomplete tail of audio store {self.path} has been truncated')
+
+    def _map(self):
+        with self._lock:
+            if self._end != len(self._hashes):
+                self._hashes = np.memmap(self.path / self.HASHES, dtype='<u4', mode='r', shape=(self._end,))
+                self._times = np.memmap(self.path / self.TIMES, dtype='<f4', mode='r', shape=(self._end,))
+            if self._unique_end != len(self._unique):
+                self._unique = np.memmap(self.path / self.UNIQUE, dtype='<u4', mode='r', shape=(self._unique_end,))
+
+    def _file_lock(self):
+        # Отдельный файл: entries.tsv заменяется при обновлении формата, а flock держится на inode
+        return _FileLock(self.path / self.LOCK)
+
+    @classmethod
+    def migrate(cls, legacy_path, videos_folder, path, fingerprint=fingerprint_file):
+        """
+        Converts the legacy pickle with lists of (hash, time, time) tuples.
+        Python hashes can't be converted to packed ones, so every video is fingerprinted again
+        from videos_folder. Videos without audio in the legacy store and videos that are missing
+        or fail to decode get an empty fingerprint, as they would on a new request.
+        Videos already in the store are skipped, so an interrupted migration is resumed.
+        Takes a while for a large store: run it with scripts/migrate_audio_store.py, not on startup.
+
+        :param legacy_path: Path to the legacy pickle
+        :param videos_folder: Folder with {video_id}.mp4 files
+        :param path: Folder of the new store
+        :param fingerprint: Function computing a fingerprint of a video file
+        :returns: AudioStore
+        """
+        with open(legacy_path, 'rb') as f:
+            legacy = pickle.load(f)
+        store = cls(path)
+        failed = 0
+        for video_id, legacy_fingerprint in legacy.items():
+            if video_id in store:
+                continue
+            if len(legacy_fingerprint) == 0:
+                store[video_id] = Fingerprint()
+                continue
+            try:
+                store[video_id] = fingerprint(str(Path(videos_folder) / f'{video_id}.mp4'))
+            except Exception as e:
+                logger.warning(f'Unable to fingerprint {video_id} during migration: {e}')
+                store[video_id] = Fingerprint()
+                failed += 1
+        (store.path / cls.MIGRATED).touch()
+        logger.info(f'Migrated {len(store)} fingerprints from {legacy_path}, {failed} failed')
+        return store
+
+    @classmethod
+    def open(cls, path, readonly=False):
+        """
+        Opens the store at path. A legacy pickle with the same name (.pkl) is not migrated here,
+        only reported: run scripts/migrate_audio_store.py once.
+        """
+        path = Path(path)
+        legacy_path = path.with_suffix('.pkl')
+        if legacy_path.exists() and not (path / cls.MIGRATED).exists():
+            logger.warning(
+                f'Legacy audio fingerprints {legacy_path} have not been migrated to {path}, '
+                f'run scripts/migrate_audio_store.py'
+            )
+        return cls(path, readonly=readonly)
+
+
+class _FileLock:
+    """
+    Exclusive flock on a file for the time of a with block.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self._file = open(self.path, 'rb')
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
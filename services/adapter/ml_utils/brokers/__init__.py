@@ -5,5 +5,10 @@ except:
 
 try:
     from .rabbit import RabbitWrapper
+except:
+    pass
+
+try:
+    from .rabbit import AsyncRabbitWrapper
 except:
     pass
\ No newline at end of file
@@ -1,2 +1,4 @@
 from .answer import BaseAnswer
-from .wrapper import BaseWrapper
\ No newline at end of file
+from .wrapper import BaseWrapper
+from .async_wrapper import AsyncBaseWrapper
+from .lanes import LaneScheduler, INTERACTIVE, BULK
\ No newline at end of file
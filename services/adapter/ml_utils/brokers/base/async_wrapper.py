@@ -0,0 +1,45 @@
+import inspect
+import time
+import traceback
+from abc import abstractmethod
+from typing import *
+
+from loguru import logger
+
+from .wrapper import BaseWrapper
+
+
+class AsyncBaseWrapper(BaseWrapper):
+    """
+    Базовый класс брокеров для asyncio. Сообщения обрабатываются конкурентно в одном event loop,
+    pipeline должен быть корутинной функцией (или возвращать awaitable), иначе он заблокирует loop.
+    """
+    
+    @abstractmethod
+    async def connect(self) -> None:
+        pass
+    
+    
+    @abstractmethod
+    async def close(self) -> None:
+        pass
+    
+    
+    async def _process_item(self, pipeline, **payload) -> tuple[dict, float]:
+        payload, expired_result = self._check_deadline(payload)
+        if expired_result is not None:
+            return expired_result, None
+        
+        try:
+            logger.info('Start processing an item')
+            start_time = time.time()
+            result = pipeline(**payload)
+            if inspect.isawaitable(result):
+                result = await result
+            process_time = time.time() - start_time
+            logger.info(f'Item has been processed in {process_time}s')
+        except Exception as e:
+            result = None
+            process_time = None
+            logger.error(f'{traceback.format_exc()}')
+        return result, process_time
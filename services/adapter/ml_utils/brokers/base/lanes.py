@@ -0,0 +1,60 @@
+from collections import deque
+from typing import Any, Dict, Optional
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+
+class LaneScheduler:
+    """
+    Очередь сообщений с полосами (lanes) разного приоритета.
+    
+    Пока сообщения есть в нескольких полосах, они выдаются пропорционально весам полос
+    (плавный взвешенный round robin): bulk не вытесняет interactive, но и не простаивает совсем.
+    """
+    
+    def __init__(self, weights: Dict[str, int]) -> None:
+        """
+        Args:
+            weights (Dict[str, int]): Веса полос, например {'interactive': 4, 'bulk': 1}.
+        """
+        self.weights = dict(weights)
+        self._lanes = {lane: deque() for lane in self.weights}
+        self._current = {lane: 0 for lane in self.weights}
+    
+    
+    def __len__(self) -> int:
+        return sum(len(items) for items in self._lanes.values())
+    
+    
+    def __contains__(self, lane: str) -> bool:
+        return lane in self._lanes
+    
+    
+    def put(self, lane: str, item: Any) -> None:
+        self._lanes[lane].append(item)
+    
+    
+    def get(self) -> Optional[Any]:
+        """
+        Следующее сообщение или None, если все полосы пусты.
+        """
+        ready = [lane for lane, items in self._lanes.items() if items]
+        if not ready:
+            return None
+        total = 0
+        for lane in ready:
+            self._current[lane] += self.weights[lane]
+            total += self.weights[lane]
+        lane = max(ready, key=self._current.__getitem__)
+        self._current[lane] -= total
+        item = self._lanes[lane].popleft()
+        if not self._lanes[lane]:
+            self._current[lane] = 0
+        return item
+    
+    
+    def clear(self) -> None:
+        for lane in self._lanes:
+            self._lanes[lane].clear()
+            self._current[lane] = 0
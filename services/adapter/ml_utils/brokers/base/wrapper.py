@@ -5,11 +5,20 @@ from typing import *
 
 from loguru import logger
 
+from ...utils.metrics import metrics
 from .answer import BaseAnswer
+from .lanes import BULK
 
 
 class BaseWrapper(ABC):
     
+    expired_policy = 'drop'
+    """
+    Что делать с сообщениями, у которых истек deadline (unix time в поле deadline):
+    drop - не обрабатывать и сразу отправить ответ с expired = True,
+    bulk - bulk сообщения все равно обработать, чтобы видео попало в базу.
+    """
+    
     
     @abstractmethod
     def _load_config(self) -> None:
@@ -37,6 +46,10 @@ class BaseWrapper(ABC):
     
     
     def _process_item(self, pipeline, **payload) -> tuple[dict, float]:
+        payload, expired_result = self._check_deadline(payload)
+        if expired_result is not None:
+            return expired_result, None
+        
         try:
             logger.info('Start processing an item')
             start_time = time.time()
@@ -49,4 +62,42 @@ class BaseWrapper(ABC):
             logger.error(f'{traceback.format_exc()}')
         return result, process_time
     
-    
\ No newline at end of file
+    
+    
+    
+    def _check_deadline(self, payload: dict) -> tuple[dict, Optional[dict]]:
+        """
+        Проверка deadline сообщения по expired_policy.
+
+        Returns:
+            tuple: payload для pipeline и ответ, если сообщение не нужно обрабатывать
+        """
+        deadline = payload.get('deadline')
+        if deadline is None:
+            return payload, None
+        try:
+            deadline = float(deadline)
+        except (TypeError, ValueError):
+            # Ошибка здесь оставила бы сообщение без ответа, поэтому оно обрабатывается без срока
+            logger.warning(f'Invalid deadline {deadline!r}, the item is processed without it')
+            return {key: value for key, value in payload.items() if key != 'deadline'}, None
+        
+        payload = {**payload, 'deadline': deadline}
+        if time.time() <= deadline:
+            return payload, None
+        
+        if self.expired_policy == 'bulk' and payload.get('priority') == BULK:
+            # Ответ уже никто не ждет, поэтому pipeline не должен прерывать обработку по сроку
+            logger.info('Start processing an expired bulk item')
+            return {key: value for key, value in payload.items() if key != 'deadline'}, None
+        
+        dropped = metrics.inc('expired_dropped')
+        logger.warning(f'Item has expired {time.time() - deadline:.1f}s ago, dropped {dropped} items in total')
+        return payload, self._create_expired_result(payload)
+    
+    
+    def _create_expired_result(self, payload: dict) -> dict:
+        # Поля запроса (например video_link) нужны отправителю, чтобы сопоставить ответ с запросом
+        result = {key: value for key, value in payload.items() if key not in ('deadline', 'priority')}
+        result['expired'] = True
+        return result
\ No newline at end of file
@@ -0,0 +1,101 @@
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+from kafka.consumer.fetcher import ConsumerRecord
+from kafka.structs import OffsetAndMetadata, TopicPartition
+
+from ... import logger
+
+
+class PartitionWorker:
+    """
+    Поток, обрабатывающий сообщения одной партиции по порядку.
+    
+    Сообщения обрабатываются последовательно, поэтому все сообщения до processed
+    уже обработаны и смещение processed можно коммитить. Если обработка сообщения упала,
+    поток останавливается, а смещение сообщения сохраняется в failed: partition
+    нужно вернуть к нему и обработать заново в новом потоке.
+    """
+    
+    def __init__(self, partition: TopicPartition, handler: Callable[[dict], None]) -> None:
+        """
+        Args:
+            partition (TopicPartition): Партиция, сообщения которой обрабатывает поток.
+            handler (Callable[[dict], None]): Функция, обрабатывающая payload сообщения.
+        """
+        self.partition = partition
+        self.handler = handler
+        self.processed: Optional[int] = None
+        self.committed: Optional[int] = None
+        self.start_offset: Optional[int] = None
+        self.failed: Optional[int] = None
+        self.failed_time: Optional[float] = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f'kafka_{partition.topic}_{partition.partition}',
+            daemon=True
+        )
+        self._thread.start()
+    
+    
+    @property
+    def backlog(self) -> int:
+        """ Сколько сообщений ждут обработки. """
+        return self._queue.qsize()
+    
+    
+    def put(self, message: ConsumerRecord) -> None:
+        # После ошибки сообщения не обрабатываются, их заново прочитают с failed
+        if self.failed is not None:
+            return
+        if self.start_offset is None:
+            self.start_offset = message.offset
+        self._queue.put(message)
+    
+    
+    def stop(self, wait: bool = True) -> None:
+        """
+        Остановить поток. Необработанные сообщения отбрасываются:
+        их смещения не закоммичены, и они будут доставлены повторно.
+
+        Args:
+            wait (bool, optional): Дождаться обработки текущего сообщения. Defaults to True.
+        """
+        self._drain()
+        self._queue.put(None)
+        if wait:
+            self._thread.join()
+    
+    
+    def _run(self) -> None:
+        while True:
+            message = self._queue.get()
+            if message is None:
+                return
+            try:
+                self.handler(message.value)
+            except Exception:
+                logger.exception(f'Unable to process message {message.offset} of {self.partition}')
+                self.failed_time = time.time()
+                self.failed = message.offset
+                self._drain()
+                return
+            self.processed = message.offset + 1
+    
+    
+    def _drain(self) -> None:
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+
+def offset_and_metadata(offset: int) -> OffsetAndMetadata:
+    # В kafka-python 2.1 у OffsetAndMetadata появилось поле leader_epoch
+    if 'leader_epoch' in OffsetAndMetadata._fields:
+        return OffsetAndMetadata(offset, '', -1)
+    return OffsetAndMetadata(offset, '')
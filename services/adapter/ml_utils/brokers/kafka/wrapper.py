@@ -1,10 +1,11 @@
 import configparser
 import json
 import os
+import time
 import traceback
 from typing import Union, Optional, Any, Callable, List, Dict
 
-from kafka import KafkaConsumer, KafkaProducer
+from kafka import ConsumerRebalanceListener, KafkaConsumer, KafkaProducer
 from kafka.admin import KafkaAdminClient, NewTopic
 from kafka.errors import TopicAlreadyExistsError
 from kafka.structs import TopicPartition
@@ -12,6 +13,7 @@ from kafka.structs import TopicPartition
 from ... import logger
 from ..base import BaseWrapper
 from .answer_template import KafkaAnswer
+from .partition_worker import PartitionWorker, offset_and_metadata
 
 
 class KafkaWrapper(BaseWrapper):
@@ -28,7 +30,18 @@ class KafkaWrapper(BaseWrapper):
     3. export INPUT_TOPIC=
     4. export GROUP_ID=
     5. export NUM_REPLICAS=
+    6. export KAFKA_MAX_RECORDS=
+    7. export KAFKA_LINGER_MS=
+    8. export KAFKA_BATCH_SIZE=
+    9. export KAFKA_PARTITION_WORKERS=
+    10. export KAFKA_MAX_BACKLOG=
+    11. export EXPIRED_POLICY=
     """
+    
+    commit_interval = 1.0
+    """ Как часто коммитятся смещения обработанных сообщений в режиме partition_workers, сек. """
+    retry_interval = 5.0
+    """ Через сколько партиция, обработка которой упала, читается заново с упавшего сообщения, сек. """
 
     def __init__(
         self,
@@ -42,6 +55,11 @@ class KafkaWrapper(BaseWrapper):
         output_partition: Optional[int] = None,
         swap_topics: bool = False,
         num_replicas: Optional[int] = None,
+        max_records: Optional[int] = None,
+        linger_ms: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        partition_workers: Optional[bool] = None,
+        max_backlog: Optional[int] = None,
         consumer_kwargs: Dict = {},
         publisher_kwargs: Dict = {},
     ) -> None:
@@ -71,6 +89,15 @@ class KafkaWrapper(BaseWrapper):
             ```
             Defaults to False.
             num_replicas (int, optional): Количество реплик для создания очереди. Defaults to False.
+            max_records (int, optional): Сколько сообщений забирается из очереди за один poll.
+                Смещения коммитятся после обработки всей пачки. Defaults to None.
+            linger_ms (int, optional): Сколько продюсер ждет новые сообщения, чтобы отправить
+                их одним запросом. Defaults to None.
+            batch_size (int, optional): Максимальный размер пачки продюсера в байтах. Defaults to None.
+            partition_workers (bool, optional): Обрабатывать каждую партицию в своем потоке,
+                не блокируя poll. pipeline должен быть потокобезопасным. Defaults to None.
+            max_backlog (int, optional): Сколько сообщений может ждать обработки в потоке партиции,
+                прежде чем партиция будет поставлена на паузу. Defaults to None.
             consumer_kwargs (Dict): Дополнительные аргументы для KafkaConsumer (например group_id).
             publisher_kwargs (Dict): Дополнительные аргументы для KafkaPublisher.
         """
@@ -78,9 +105,16 @@ class KafkaWrapper(BaseWrapper):
         self.input_topic = input_topic
         self.output_topic = output_topic
         self.num_replicas = num_replicas
+        self.max_records = max_records
+        self.linger_ms = linger_ms
+        self.batch_size = batch_size
+        self.partition_workers = partition_workers
+        self.max_backlog = max_backlog
+        self.workers: Dict[TopicPartition, PartitionWorker] = {}
+        self._send_errors: List[Exception] = []
         self.config = config
-        self.consumer_kwargs = consumer_kwargs
-        self.publisher_kwargs = publisher_kwargs
+        self.consumer_kwargs = dict(consumer_kwargs)
+        self.publisher_kwargs = dict(publisher_kwargs)
         self.output_partition = output_partition
         
         if config_path and service_name and os.path.exists(config_path):
@@ -102,7 +136,7 @@ class KafkaWrapper(BaseWrapper):
             if input_partitions and isinstance(input_partitions, list):
                 self.consumer.assign([TopicPartition(self.input_topic, i) for i in input_partitions])
             else:
-                self.consumer.subscribe([self.input_topic])
+                self.consumer.subscribe([self.input_topic], listener=_RebalanceListener(self))
             logger.info(f'Input topic {self.input_topic} has been connected')
         else:
             self.consumer = None
@@ -132,8 +166,31 @@ class KafkaWrapper(BaseWrapper):
         if not self.num_replicas:
             self.num_replicas = int(self.config.get('NUM_REPLICAS', os.environ.get('NUM_REPLICAS', 1)))
         
+        if not self.max_records:
+            self.max_records = int(self.config.get('KAFKA_MAX_RECORDS', os.environ.get('KAFKA_MAX_RECORDS', 10)))
+        
+        if not self.linger_ms:
+            self.linger_ms = int(self.config.get('KAFKA_LINGER_MS', os.environ.get('KAFKA_LINGER_MS', 5)))
+        
+        if not self.batch_size:
+            self.batch_size = int(self.config.get('KAFKA_BATCH_SIZE', os.environ.get('KAFKA_BATCH_SIZE', 64 * 1024)))
+        
+        if self.partition_workers is None:
+            self.partition_workers = str(self.config.get(
+                'KAFKA_PARTITION_WORKERS',
+                os.environ.get('KAFKA_PARTITION_WORKERS', False)
+            )).lower() in ('1', 'true', 'yes', 'on')
+        
+        if not self.max_backlog:
+            self.max_backlog = int(self.config.get('KAFKA_MAX_BACKLOG', os.environ.get('KAFKA_MAX_BACKLOG', self.max_records)))
+        
+        self.expired_policy = self.config.get('EXPIRED_POLICY', os.environ.get('EXPIRED_POLICY', self.expired_policy))
+        
         self.consumer_kwargs['group_id'] = self.consumer_kwargs.get('group_id', self.config.get('GROUP_ID', os.environ.get('GROUP_ID', None)))
         self.consumer_kwargs['auto_offset_reset'] = self.consumer_kwargs.get('auto_offset_reset', 'latest')
+        self.consumer_kwargs['enable_auto_commit'] = self.consumer_kwargs.get('enable_auto_commit', False)
+        self.publisher_kwargs['linger_ms'] = self.publisher_kwargs.get('linger_ms', self.linger_ms)
+        self.publisher_kwargs['batch_size'] = self.publisher_kwargs.get('batch_size', self.batch_size)
 
         logger.info('Config has been loaded')
     
@@ -158,6 +215,8 @@ class KafkaWrapper(BaseWrapper):
     def publish(self, data: Union[list[dict], dict], time: Optional[float] = None, payload: Optional[dict] = None) -> None:
         """
         Функция для подключения к выходной очереди, в которую нужно отправлять сообщения.
+        Отправка асинхронная: продюсер копит сообщения до linger_ms или batch_size
+        и отправляет их пачкой. Дождаться доставки и узнать об ошибках можно через flush.
 
         Args:
             data (Union[list[dict], dict]): Данные для отправки в очередь.
@@ -174,11 +233,34 @@ class KafkaWrapper(BaseWrapper):
                 answer = self._create_answer(time, payload, item).json
             else:
                 answer = json.dumps(item)
-            self.producer.send(self.output_topic, answer, partition=self.output_partition)
-            self.producer.flush()
+            future = self.producer.send(self.output_topic, answer, partition=self.output_partition)
+            future.add_errback(self._on_send_error, answer)
             logger.debug(f'Publish msg to {self.output_topic}')
     
     
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """
+        Дождаться доставки всех отправленных сообщений.
+
+        Args:
+            timeout (float, optional): Сколько ждать, сек. Defaults to None.
+        
+        Raises:
+            KafkaError: Если с прошлого flush какое-то сообщение не удалось доставить.
+        """
+        if self.producer:
+            self.producer.flush(timeout)
+        if self._send_errors:
+            errors, self._send_errors = self._send_errors, []
+            logger.error(f'{len(errors)} messages have not been delivered to {self.output_topic}')
+            raise errors[0]
+    
+    
+    def _on_send_error(self, answer: str, exception: Exception) -> None:
+        logger.error(f'Unable to publish msg to {self.output_topic}: {exception!r}\n{answer}')
+        self._send_errors.append(exception)
+    
+    
     def listen(self, num = -1, pipeline: Optional[Callable] = None, consumer_timeout_ms: float = float('inf')) -> None:
         """
         Функция для подключения ко входной очереди, которую нужно слушать.
@@ -196,6 +278,11 @@ class KafkaWrapper(BaseWrapper):
                 # payload == {'video_id': '19936b03156acfd10a9b0cfd63c6a89b'}
                 pipeline(**payload)
             ```
+            Сообщения забираются пачками по max_records, смещения коммитятся после того,
+            как результаты всей пачки доставлены. Если обработка или доставка пачки не удалась,
+            консьюмер возвращается к началу пачки, и она обрабатывается заново.
+            Если включен partition_workers, каждая партиция обрабатывается в своем потоке,
+            см. _consume_partitions.
             
             Defaults to None.
             consumer_timeout_ms (float, optional): Через какое время после отсутствия сообщений
@@ -205,27 +292,193 @@ class KafkaWrapper(BaseWrapper):
         
         if pipeline:
             logger.info(f'Consumer gets pipeline: {pipeline.__class__.__name__}')
-        
-        self.consumer.config['consumer_timeout_ms'] = consumer_timeout_ms
+            if self.partition_workers:
+                return self._consume_partitions(pipeline)
         
         payloads = []
+        last_message_time = time.time()
         logger.info(f'Start consuming on {self.input_topic}')
-        for n, msg in enumerate(self.consumer):
+        while True:
             try:
-                if self.consumer_kwargs['group_id']:
-                    self.consumer.commit()
-                logger.debug(f'Got and commited message')
-                payload = msg.value
+                max_records = self.max_records
+                if not pipeline and num > 0:
+                    max_records = min(max_records, num - len(payloads))
+                records = self.consumer.poll(timeout_ms=1000, max_records=max_records)
+                batch = [msg.value for messages in records.values() for msg in messages]
+                if not batch:
+                    if (time.time() - last_message_time) * 1000 > consumer_timeout_ms:
+                        return payloads
+                    continue
+                last_message_time = time.time()
+                logger.debug(f'Got {len(batch)} messages')
                 
-                if pipeline:
-                    result, time = self._process_item(pipeline, **payload)
-                    if self.producer:
-                        self.publish(result, time, payload)
+                if not pipeline:
+                    payloads.extend(batch)
                 else:
-                    payloads.append(payload)    
-                    if n + 1 == num:
-                        return payloads
+                    try:
+                        for payload in batch:
+                            result, process_time = self._process_item(pipeline, **payload)
+                            if self.producer:
+                                self.publish(result, process_time, payload)
+                        # Смещения коммитятся только после доставки результатов всей пачки
+                        self.flush()
+                    except Exception:
+                        # Позиция консьюмера уже за пачкой: без возврата следующий коммит пропустил бы ее
+                        for partition, messages in records.items():
+                            self.consumer.seek(partition, messages[0].offset)
+                        raise
+                
+                if self.consumer_kwargs['group_id']:
+                    self.consumer.commit()
+                    logger.debug(f'Commited {len(batch)} messages')
+                if len(payloads) == num:
+                    return payloads
+            except KeyboardInterrupt:
+                raise
             except:
                 logger.error(f'{traceback.format_exc()}')
+    
+    
+    def _consume_partitions(self, pipeline: Callable) -> None:
+        """
+        Обработка сообщений в потоках по одному на партицию.
+        
+        Поток poll только раздает сообщения по потокам партиций, поэтому продолжает
+        опрашивать брокер во время долгой обработки и не вылетает из группы по max_poll_interval_ms.
+        Партиция ставится на паузу, если в ее потоке накопилось больше max_backlog сообщений,
+        и возобновляется, когда поток разберет половину. Смещения коммитятся раз в commit_interval
+        до последнего обработанного сообщения каждой партиции после доставки результатов.
+        
+        Если обработка сообщения упала, партиция ставится на паузу и через retry_interval
+        читается заново с этого сообщения. Если результаты не удалось доставить,
+        все партиции возвращаются к последним закоммиченным смещениям.
+        """
+        def handle(payload):
+            result, process_time = self._process_item(pipeline, **payload)
+            if self.producer:
+                self.publish(result, process_time, payload)
         
-        return payloads
+        last_commit_time = time.time()
+        logger.info(f'Start consuming on {self.input_topic} with partition workers')
+        try:
+            while True:
+                try:
+                    records = self.consumer.poll(timeout_ms=100, max_records=self.max_records)
+                    for partition, messages in records.items():
+                        worker = self.workers.get(partition)
+                        if worker is None:
+                            worker = self.workers[partition] = PartitionWorker(partition, handle)
+                        for msg in messages:
+                            worker.put(msg)
+                    self._apply_backpressure()
+                    self._retry_failed()
+                    
+                    if time.time() - last_commit_time >= self.commit_interval:
+                        last_commit_time = time.time()
+                        try:
+                            self._commit_processed(self.workers.values())
+                        except Exception:
+                            self._rewind(list(self.workers.values()))
+                            raise
+                except KeyboardInterrupt:
+                    raise
+                except:
+                    logger.error(f'{traceback.format_exc()}')
+        finally:
+            self._stop_workers(list(self.workers))
+    
+    
+    def _apply_backpressure(self) -> None:
+        paused = self.consumer.paused()
+        for partition, worker in self.workers.items():
+            if worker.failed is not None:
+                # Упавшая партиция стоит на паузе до повторной попытки в _retry_failed
+                if partition not in paused:
+                    self.consumer.pause(partition)
+                    logger.warning(f'Partition {partition} has been paused after a failed message {worker.failed}')
+            elif partition not in paused and worker.backlog >= self.max_backlog:
+                self.consumer.pause(partition)
+                logger.debug(f'Partition {partition} has been paused, backlog {worker.backlog}')
+            elif partition in paused and worker.backlog <= self.max_backlog // 2:
+                self.consumer.resume(partition)
+                logger.debug(f'Partition {partition} has been resumed')
+    
+    
+    def _retry_failed(self) -> None:
+        for worker in list(self.workers.values()):
+            if worker.failed is None or time.time() - worker.failed_time < self.retry_interval:
+                continue
+            try:
+                # Сообщения до упавшего обработаны, их результаты должны уйти до повторной попытки
+                self._commit_processed([worker])
+            except Exception:
+                self._rewind(list(self.workers.values()))
+                raise
+            self._restart(worker, worker.failed)
+            logger.info(f'Partition {worker.partition} is retried from offset {worker.failed}')
+    
+    
+    def _rewind(self, workers: List[PartitionWorker]) -> None:
+        # Результаты после committed могли не дойти, поэтому они обрабатываются заново
+        for worker in workers:
+            offset = worker.committed if worker.committed is not None else worker.start_offset
+            if offset is not None:
+                self._restart(worker, offset)
+                logger.warning(f'Partition {worker.partition} has been rewound to offset {offset}')
+    
+    
+    def _restart(self, worker: PartitionWorker, offset: int) -> None:
+        worker.stop(wait=True)
+        self.consumer.seek(worker.partition, offset)
+        restarted = self.workers[worker.partition] = PartitionWorker(worker.partition, worker.handler)
+        restarted.processed = restarted.committed = worker.committed
+        if worker.partition in self.consumer.paused():
+            self.consumer.resume(worker.partition)
+    
+    
+    def _commit_processed(self, workers: List[PartitionWorker]) -> None:
+        # Смещения запоминаются до flush, поэтому результаты всех сообщений до них уже отправлены
+        offsets = {
+            worker.partition: worker.processed for worker in workers
+            if worker.processed is not None and worker.processed != worker.committed
+        }
+        if not offsets:
+            return
+        self.flush()
+        self.consumer.commit({partition: offset_and_metadata(offset) for partition, offset in offsets.items()})
+        for partition, offset in offsets.items():
+            self.workers[partition].committed = offset
+        logger.debug(f'Commited offsets {offsets}')
+    
+    
+    def _stop_workers(self, partitions: List[TopicPartition]) -> None:
+        workers = [self.workers[partition] for partition in partitions if partition in self.workers]
+        for worker in workers:
+            worker.stop(wait=False)
+        for worker in workers:
+            worker.stop(wait=True)
+        try:
+            self._commit_processed(workers)
+        finally:
+            for worker in workers:
+                self.workers.pop(worker.partition)
+
+
+class _RebalanceListener(ConsumerRebalanceListener):
+    """
+    Перед тем как партиции уйдут другому консьюмеру, дожидается их потоков
+    и коммитит обработанные смещения, чтобы новый владелец не обрабатывал их повторно.
+    """
+    
+    def __init__(self, wrapper: KafkaWrapper) -> None:
+        self.wrapper = wrapper
+    
+    
+    def on_partitions_revoked(self, revoked):
+        if self.wrapper.workers:
+            logger.info(f'Partitions {revoked} have been revoked')
+            self.wrapper._stop_workers(list(revoked))
+    
+    
+    def on_partitions_assigned(self, assigned):
+        logger.info(f'Partitions {assigned} have been assigned')
@@ -1 +1,6 @@
-from .wrapper import RabbitWrapper
\ No newline at end of file
+from .wrapper import RabbitWrapper
+
+try:
+    from .async_wrapper import AsyncRabbitWrapper
+except:
+    pass
\ No newline at end of file
@@ -0,0 +1,271 @@
+import asyncio
+import configparser
+import json
+import os
+import traceback
+from functools import partial
+from typing import Union, Optional, Callable
+
+import aio_pika
+
+from ... import logger
+from ..base import AsyncBaseWrapper, LaneScheduler, INTERACTIVE, BULK
+from .answer_template import RabbitAnswer
+
+
+class AsyncRabbitWrapper(AsyncBaseWrapper):
+    """
+    Асинхронный вариант RabbitWrapper на aio-pika.
+    Одно соединение обслуживает десятки сообщений в обработке: пока одни ждут скачивания
+    или инференса, следующие уже принимаются и отправляются в pipeline.
+    
+    Для установки конфига через системный переменные:
+    1. export RABBIT_URL=
+    2. export OUTPUT_TOPIC=
+    3. export INPUT_TOPIC=
+    4. export RABBIT_ASYNC_PREFETCH_COUNT=
+    5. export RABBIT_ASYNC_WORKERS=
+    6. export BULK_INPUT_TOPIC=
+    7. export INTERACTIVE_WEIGHT=
+    8. export EXPIRED_POLICY=
+    """
+    
+    def __init__(
+        self,
+        config_path: str = None,
+        service_name: str = None,
+        config: dict = {},
+        url: Optional[str] = None,
+        input_topic: Optional[str] = None,
+        output_topic: Optional[str] = None,
+        swap_topics: bool = False,
+        prefetch_count: Optional[int] = None,
+        workers: Optional[int] = None,
+        bulk_input_topic: Optional[str] = None,
+        interactive_weight: Optional[int] = None
+    ) -> None:
+        """
+        Параметры те же, что у RabbitWrapper. Подключение к брокеру выполняется в connect().
+        
+        Args:
+            prefetch_count (int, optional): Сколько неподтвержденных сообщений брокер
+                присылает заранее при обработке через pipeline. Defaults to None.
+            workers (int, optional): Сколько сообщений обрабатывается pipeline одновременно
+                (корутин, а не потоков). Defaults to None.
+        """
+        self.url = url
+        self.input_topic = input_topic
+        self.output_topic = output_topic
+        self.prefetch_count = prefetch_count
+        self.workers = workers
+        self.bulk_input_topic = bulk_input_topic
+        self.interactive_weight = interactive_weight
+        self.config = config
+        self.connection = None
+        
+        if config_path and service_name and os.path.exists(config_path):
+            self.config = configparser.ConfigParser()
+            self.config.read(config_path)
+            self.config = self.config[service_name]
+        self._load_config()
+        
+        if swap_topics:
+            self.input_topic, self.output_topic = self.output_topic, self.input_topic
+    
+    
+    def _load_config(self):
+        if not self.url:
+            self.url = self.config.get('RABBIT_URL', os.environ.get('RABBIT_URL', None))
+        
+        if not self.input_topic:
+            self.input_topic = self.config.get('INPUT_TOPIC', os.environ.get('INPUT_TOPIC', None)) 
+        
+        if not self.output_topic:    
+            self.output_topic = self.config.get('OUTPUT_TOPIC', os.environ.get('OUTPUT_TOPIC', None))
+        
+        if not self.workers:
+            self.workers = int(self.config.get('RABBIT_ASYNC_WORKERS', os.environ.get('RABBIT_ASYNC_WORKERS', 32)))
+        
+        if not self.prefetch_count:
+            self.prefetch_count = int(self.config.get(
+                'RABBIT_ASYNC_PREFETCH_COUNT',
+                os.environ.get('RABBIT_ASYNC_PREFETCH_COUNT', 2 * self.workers)
+            ))
+        
+        if not self.bulk_input_topic:
+            self.bulk_input_topic = self.config.get('BULK_INPUT_TOPIC', os.environ.get('BULK_INPUT_TOPIC', None))
+        
+        if not self.interactive_weight:
+            self.interactive_weight = int(self.config.get('INTERACTIVE_WEIGHT', os.environ.get('INTERACTIVE_WEIGHT', 4)))
+        
+        self.expired_policy = self.config.get('EXPIRED_POLICY', os.environ.get('EXPIRED_POLICY', self.expired_policy))
+
+        logger.info('Config has been loaded')
+    
+    
+    async def connect(self) -> None:
+        """
+        Подключение к брокеру и создание очередей. connect_robust сам переподключается
+        при разрыве и возобновляет прослушивание очередей.
+        """
+        tries = 0
+        while True:
+            try:
+                tries += 1
+                logger.info(f'Trying to connect at {tries} time')
+                self.connection = await aio_pika.connect_robust(self.url)
+                self.channel = await self.connection.channel()
+                logger.info('Connection successful')
+                break
+            except Exception as e:
+                logger.warning(f'Connection failed. Waiting for a 5 seconds...')
+                await asyncio.sleep(5)
+        
+        for topic in [self.input_topic, self.output_topic, self.bulk_input_topic]:
+            if topic:
+                await self._create_topic(topic)
+                logger.info(f'Topic {topic} has been connected')
+    
+    
+    async def close(self) -> None:
+        if self.connection is not None:
+            await self.connection.close()
+    
+    
+    async def _create_topic(self, topic_name, channel=None) -> aio_pika.abc.AbstractQueue:
+        queue = await (channel or self.channel).declare_queue(
+            topic_name,
+            durable=True,
+            exclusive=False,
+            auto_delete=False,
+            arguments={'x-queue-type=classic': 'classic'}
+        )
+        logger.debug(f'Topic {topic_name} has been created')
+        return queue
+    
+    
+    def _create_answer(self, time, payload: dict, result: Optional[dict]) -> None:
+        return RabbitAnswer(time, payload, result)
+    
+    
+    async def publish(
+        self,
+        data: Union[list[dict], dict],
+        time: float = None,
+        payload: dict = None,
+        topic: Optional[str] = None
+    ) -> None:
+        """
+        Отправка сообщений в выходную очередь, параметры как у RabbitWrapper.publish.
+        """
+        topic = topic or self.output_topic
+        assert topic, 'There is output topic needed'
+        
+        if not isinstance(data, list):
+            data = [data]
+        
+        for item in data:
+            if payload:
+                answer = self._create_answer(time, payload, item).json
+            else:
+                answer = json.dumps(item)
+            await self.channel.default_exchange.publish(
+                aio_pika.Message(body=answer.encode(), delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+                routing_key=topic
+            )
+            logger.debug(f'Publish msg to {topic}')
+    
+    
+    async def listen(self, num = -1, pipeline: Optional[Callable] = None, ack: bool = False) -> Optional[list[dict]]:
+        """
+        Прослушивание входной очереди, параметры как у RabbitWrapper.listen.
+        Если указан pipeline, сообщения обрабатываются бесконечно, см. _consume.
+        """
+        assert self.input_topic, 'There is input topic needed'
+        
+        if pipeline:
+            logger.info(f'Consumer gets pipeline: {pipeline.__class__.__name__}')
+            return await self._consume(pipeline)
+        
+        payloads = []
+        queue = await self._create_topic(self.input_topic)
+        logger.info(f'Start consuming on {self.input_topic}')
+        while len(payloads) != num:
+            message = await queue.get(no_ack=ack, fail=False)
+            if message is None:
+                break
+            logger.debug(f'Got message')
+            payloads.append(json.loads(message.body))
+        return payloads
+    
+    
+    async def _consume(self, pipeline: Callable) -> None:
+        """
+        Обработка сообщений входной очереди через pipeline.
+        
+        Каждая очередь слушается в своем канале со своим prefetch: из bulk_input_topic заранее
+        забирается не больше `workers` сообщений. Как и в RabbitWrapper, сообщения попадают в полосы
+        LaneScheduler, и при свободном месте из `workers` корутин полоса выбирается в пропорции
+        interactive_weight к 1. Сообщение подтверждается после публикации результата.
+        """
+        lanes = LaneScheduler({INTERACTIVE: self.interactive_weight, BULK: 1})
+        received = asyncio.Event()
+        topics = [(self.input_topic, INTERACTIVE, self.prefetch_count)]
+        if self.bulk_input_topic:
+            topics.append((self.bulk_input_topic, BULK, self.workers))
+        for topic, lane, prefetch_count in topics:
+            channel = await self.connection.channel()
+            await channel.set_qos(prefetch_count=prefetch_count)
+            queue = await self._create_topic(topic, channel)
+            await queue.consume(partial(self._receive, lanes, lane, received))
+            logger.info(f'Start consuming on {topic} ({lane}) with {self.workers} workers')
+        
+        slots = asyncio.Semaphore(self.workers)
+        tasks = set()
+        while True:
+            await received.wait()
+            received.clear()
+            while len(lanes):
+                # Полоса выбирается, когда есть свободное место: за время ожидания могли прийти интерактивные
+                await slots.acquire()
+                message, payload = lanes.get()
+                task = asyncio.create_task(self._handle(pipeline, message, payload))
+                tasks.add(task)
+                task.add_done_callback(lambda task: (tasks.discard(task), slots.release()))
+    
+    
+    async def _receive(
+        self,
+        lanes: LaneScheduler,
+        lane: str,
+        received: asyncio.Event,
+        message: aio_pika.abc.AbstractIncomingMessage
+    ) -> None:
+        logger.debug(f'Got message')
+        try:
+            payload = json.loads(message.body)
+        except Exception as e:
+            logger.error(f'Unable to parse message {message.body}: {e}')
+            await message.reject(requeue=False)
+            return
+        
+        priority = payload.get('priority')
+        lanes.put(priority if priority in lanes else lane, (message, payload))
+        received.set()
+    
+    
+    async def _handle(self, pipeline: Callable, message: aio_pika.abc.AbstractIncomingMessage, payload: dict) -> None:
+        try:
+            result, time = await self._process_item(pipeline, **payload)
+        except Exception:
+            # Иначе сообщение осталось бы без ответа и ack до закрытия канала
+            logger.error(f'{traceback.format_exc()}')
+            result, time = None, None
+        try:
+            if self.output_topic:
+                await self.publish(result, time, payload)
+            await message.ack()
+            logger.debug(f'Acked on message')
+        except Exception as e:
+            # После переподключения канал сообщения закрыт, брокер доставит его повторно
+            logger.error(f'{traceback.format_exc()}')
@@ -1,15 +1,19 @@
 import configparser
 import json
 import os
+import queue
+import socket
 import sys
 import time
 import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 from typing import Union, Optional, Any, Callable
 
 import amqp
 
 from ... import logger
-from ..base import BaseWrapper
+from ..base import BaseWrapper, LaneScheduler, INTERACTIVE, BULK
 from .answer_template import RabbitAnswer
 
 
@@ -23,8 +27,16 @@ class RabbitWrapper(BaseWrapper):
     1. export RABBIT_URL=
     2. export OUTPUT_TOPIC=
     3. export INPUT_TOPIC=
+    4. export RABBIT_PREFETCH_COUNT=
+    5. export RABBIT_WORKERS=
+    6. export BULK_INPUT_TOPIC=
+    7. export INTERACTIVE_WEIGHT=
+    8. export EXPIRED_POLICY=
     """
     
+    poll_interval = 0.05
+    """ Как часто поток соединения проверяет готовые результаты, пока нет новых сообщений, сек. """
+    
     def __init__(
         self,
         config_path: str = None,
@@ -33,7 +45,11 @@ class RabbitWrapper(BaseWrapper):
         url: Optional[str] = None,
         input_topic: Optional[str] = None,
         output_topic: Optional[str] = None,
-        swap_topics: bool = False
+        swap_topics: bool = False,
+        prefetch_count: Optional[int] = None,
+        workers: Optional[int] = None,
+        bulk_input_topic: Optional[str] = None,
+        interactive_weight: Optional[int] = None
     ) -> None:
         """
         Инициализировать конфигурации можно 3 способами 
@@ -62,10 +78,22 @@ class RabbitWrapper(BaseWrapper):
                 output_msgs = rabbit.listen()
             ```
             Defaults to False.
+            prefetch_count (int, optional): Сколько неподтвержденных сообщений брокер
+                присылает заранее при обработке через pipeline. Defaults to None.
+            workers (int, optional): Сколько сообщений обрабатывается pipeline одновременно.
+                pipeline должен быть потокобезопасным, если workers > 1. Defaults to None.
+            bulk_input_topic (str, optional): Входная очередь для массовой низкоприоритетной
+                загрузки (bulk), чтобы она не задерживала интерактивные запросы. Defaults to None.
+            interactive_weight (int, optional): Сколько интерактивных сообщений обрабатывается
+                на одно bulk сообщение, когда есть и те и другие. Defaults to None.
         """
         self.url = url
         self.input_topic = input_topic
         self.output_topic = output_topic
+        self.prefetch_count = prefetch_count
+        self.workers = workers
+        self.bulk_input_topic = bulk_input_topic
+        self.interactive_weight = interactive_weight
         self.config = config
         
         if config_path and service_name and os.path.exists(config_path):
@@ -86,6 +114,10 @@ class RabbitWrapper(BaseWrapper):
         if self.output_topic:
             self._create_topic(self.output_topic)
             logger.info(f'Output topic {self.output_topic} has been connected')
+        
+        if self.bulk_input_topic:
+            self._create_topic(self.bulk_input_topic)
+            logger.info(f'Bulk input topic {self.bulk_input_topic} has been connected')
     
     
     def _load_config(self):
@@ -104,6 +136,23 @@ class RabbitWrapper(BaseWrapper):
         
         if not self.output_topic:    
             self.output_topic = self.config.get('OUTPUT_TOPIC', os.environ.get('OUTPUT_TOPIC', None))
+        
+        if not self.workers:
+            self.workers = int(self.config.get('RABBIT_WORKERS', os.environ.get('RABBIT_WORKERS', 1)))
+        
+        if not self.prefetch_count:
+            self.prefetch_count = int(self.config.get(
+                'RABBIT_PREFETCH_COUNT',
+                os.environ.get('RABBIT_PREFETCH_COUNT', 2 * self.workers)
+            ))
+        
+        if not self.bulk_input_topic:
+            self.bulk_input_topic = self.config.get('BULK_INPUT_TOPIC', os.environ.get('BULK_INPUT_TOPIC', None))
+        
+        if not self.interactive_weight:
+            self.interactive_weight = int(self.config.get('INTERACTIVE_WEIGHT', os.environ.get('INTERACTIVE_WEIGHT', 4)))
+        
+        self.expired_policy = self.config.get('EXPIRED_POLICY', os.environ.get('EXPIRED_POLICY', self.expired_policy))
 
         logger.info('Config has been loaded')
     
@@ -145,7 +194,13 @@ class RabbitWrapper(BaseWrapper):
                 time.sleep(5)
 
     
-    def publish(self, data: Union[list[dict], dict], time: float = None, payload: dict = None) -> None:
+    def publish(
+        self,
+        data: Union[list[dict], dict],
+        time: float = None,
+        payload: dict = None,
+        topic: Optional[str] = None
+    ) -> None:
         """
         Функция для подключения к выходной очереди, в которую нужно отправлять сообщения.
 
@@ -153,8 +208,10 @@ class RabbitWrapper(BaseWrapper):
             data (Union[list[dict], dict]): Данные для отправки в очередь.
             time (float, optional): Время обработки приходит из listen. Defaults to None.
             payload (dict, optional): Payload приходит из listen. Defaults to None.
+            topic (str, optional): Очередь для отправки вместо выходной. Defaults to None.
         """
-        assert self.output_topic, 'There is output topic needed'
+        topic = topic or self.output_topic
+        assert topic, 'There is output topic needed'
         
         if not isinstance(data, list):
             data = [data]
@@ -165,8 +222,8 @@ class RabbitWrapper(BaseWrapper):
             else:
                 answer = json.dumps(item)
             msg = amqp.basic_message.Message(body=answer)
-            self.channel.basic_publish(msg, exchange='', routing_key=self.output_topic)
-            logger.debug(f'Publish msg to {self.output_topic}')
+            self.channel.basic_publish(msg, exchange='', routing_key=topic)
+            logger.debug(f'Publish msg to {topic}')
     
     
     def listen(self, num = -1, pipeline: Optional[Callable] = None, ack: bool = False) -> None:
@@ -181,12 +238,15 @@ class RabbitWrapper(BaseWrapper):
             pipeline (Callable, optional): Функция, обрабатывающая данные в сообщении.
             Именованные аргументы body сообщения подаются в функцию без изменений:
             ```python
-                message = self.channel.basic_get(queue=self.input_topic)
                 # message.body == '{'video_id': '19936b03156acfd10a9b0cfd63c6a89b'}'
                 payload = json.loads(message.body)
                 # payload == {'video_id': '19936b03156acfd10a9b0cfd63c6a89b'}
                 pipeline(**payload)
             ```
+            Сообщения приходят через basic_consume и обрабатываются в пуле из `workers` потоков.
+            Сообщение подтверждается только после публикации результата.
+            Если задана bulk_input_topic, она слушается вместе с входной очередью
+            с меньшим приоритетом, см. _consume.
             
             Defaults to None.
             ack (bool, optional): Нужно ли отвечать на сообщения и удалять их из очереди.
@@ -195,8 +255,8 @@ class RabbitWrapper(BaseWrapper):
         assert self.input_topic, 'There is input topic needed'
         
         if pipeline:
-            ack = True
             logger.info(f'Consumer gets pipeline: {pipeline.__class__.__name__}')
+            return self._consume(pipeline)
         
         n = 0
         payloads = []
@@ -206,24 +266,119 @@ class RabbitWrapper(BaseWrapper):
                 message = self.channel.basic_get(queue=self.input_topic)
                 if message:
                     logger.debug(f'Got message')
+                    payload = json.loads(message.body)
                     if ack:
                         self.channel.basic_ack(delivery_tag=message.delivery_tag)
                         logger.debug(f'Acked on message')
-                    payload = json.loads(message.body)
                     
-                    if pipeline:
-                        result, time = self._process_item(pipeline, **payload)
-                        if self.output_topic:
-                            self.publish(result, time, payload)
-                    else:
-                        payloads.append(payload)    
-                        if n + 1 == num:
-                            return payloads
+                    payloads.append(payload)    
+                    if n + 1 == num:
+                        return payloads
                     n += 1
-                elif not pipeline: 
+                else: 
                     return payloads
+            except KeyboardInterrupt:
+                self.connection.close()
+                sys.exit()
             except Exception as e:
-                if e == KeyboardInterrupt:
+                logger.error(f'{traceback.format_exc()}')
+    
+    
+    def _consume(self, pipeline: Callable) -> None:
+        """
+        Обработка сообщений входной очереди через pipeline.
+        
+        Брокер присылает не более `prefetch_count` неподтвержденных сообщений, они обрабатываются
+        в пуле из `workers` потоков. Публикация результата и подтверждение сообщения выполняются
+        в потоке соединения, т.к. amqp не потокобезопасен. Если соединение разорвалось,
+        неподтвержденные сообщения будут доставлены повторно.
+        
+        Сообщения входной очереди и bulk_input_topic попадают в разные полосы LaneScheduler,
+        свободные потоки получают их в пропорции interactive_weight к 1. Полоса берется из поля
+        priority сообщения, а если его нет - по очереди. Из bulk очереди заранее забирается
+        не больше `workers` сообщений, чтобы они не занимали место интерактивных.
+        """
+        done = queue.Queue()
+        lanes = LaneScheduler({INTERACTIVE: self.interactive_weight, BULK: 1})
+        self._in_flight = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='rabbit_worker') as pool:
+            while True:
+                try:
+                    lanes.clear()
+                    self._subscribe(lanes)
+                    while True:
+                        try:
+                            self.connection.drain_events(timeout=self.poll_interval)
+                        except socket.timeout:
+                            pass
+                        self._complete(done)
+                        self._dispatch(pool, pipeline, lanes, done)
+                except KeyboardInterrupt:
                     self.connection.close()
                     sys.exit()
-                logger.error(f'{traceback.format_exc()}')
\ No newline at end of file
+                except Exception as e:
+                    logger.error(f'{traceback.format_exc()}')
+                    self._connect()
+    
+    
+    def _subscribe(self, lanes: LaneScheduler) -> None:
+        topics = [(self.input_topic, INTERACTIVE, self.prefetch_count)]
+        if self.bulk_input_topic:
+            topics.append((self.bulk_input_topic, BULK, self.workers))
+        for topic, lane, prefetch_count in topics:
+            # basic_qos без a_global действует на консьюмеров, созданных после него
+            self.channel.basic_qos(prefetch_size=0, prefetch_count=prefetch_count, a_global=False)
+            self.channel.basic_consume(
+                queue=topic,
+                callback=lambda message, lane=lane: self._receive(lanes, lane, message),
+                no_ack=False
+            )
+            logger.info(f'Start consuming on {topic} ({lane}) with {self.workers} workers')
+    
+    
+    def _receive(self, lanes: LaneScheduler, lane: str, message: amqp.Message) -> None:
+        logger.debug(f'Got message')
+        try:
+            payload = json.loads(message.body)
+        except Exception as e:
+            logger.error(f'Unable to parse message {message.body}: {e}')
+            self.channel.basic_reject(delivery_tag=message.delivery_tag, requeue=False)
+            return
+        
+        priority = payload.get('priority')
+        lanes.put(priority if priority in lanes else lane, (self.channel, message, payload))
+    
+    
+    def _dispatch(self, pool: ThreadPoolExecutor, pipeline: Callable, lanes: LaneScheduler, done: queue.Queue) -> None:
+        while self._in_flight < self.workers and len(lanes):
+            channel, message, payload = lanes.get()
+            future = pool.submit(self._process_item, pipeline, **payload)
+            future.add_done_callback(partial(self._done, done, channel, message, payload))
+            self._in_flight += 1
+    
+    
+    def _done(self, done: queue.Queue, channel: Any, message: amqp.Message, payload: dict, future: Future) -> None:
+        # Исключение из колбэка пул только логирует: сообщение осталось бы без ответа и ack,
+        # а слот _in_flight не освободился бы. Поэтому ошибка отправляется как неудачная обработка
+        try:
+            result, time = future.result()
+        except Exception:
+            logger.error(f'{traceback.format_exc()}')
+            result, time = None, None
+        done.put((channel, message, payload, result, time))
+    
+    
+    def _complete(self, done: queue.Queue) -> None:
+        while True:
+            try:
+                channel, message, payload, result, time = done.get_nowait()
+            except queue.Empty:
+                return
+            self._in_flight -= 1
+            if channel is not self.channel:
+                logger.warning('Channel has been reopened, message will be redelivered')
+                continue
+            if self.output_topic:
+                self.publish(result, time, payload)
+            self.channel.basic_ack(delivery_tag=message.delivery_tag)
+            logger.debug(f'Acked on message')
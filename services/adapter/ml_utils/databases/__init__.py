@@ -1,4 +1,6 @@
 try:
     from .milvus import MilvusWrapper
+    from .metadata_filter import MetadataFilter
+    from .federated import FederatedMilvusWrapper
 except:
     pass
\ No newline at end of file
@@ -0,0 +1,222 @@
+import configparser
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Optional, Union
+
+from pandas import DataFrame
+from pymilvus import CollectionSchema
+
+from .. import logger
+from .local_search import merge_hits
+from .milvus import MilvusWrapper
+
+
+class FederatedMilvusWrapper:
+    """
+    Класс для работы с корпусом, разделенным на несколько шардов - коллекций
+    в одном или нескольких развертываниях Milvus.
+    Поиск выполняется во всех шардах параллельно с объединением результатов,
+    вставка - только в шард-владелец видео.
+
+    Повторяет интерфейс MilvusWrapper, поэтому может использоваться вместо него.
+
+    Для установки конфига через системный переменные:
+    1. export MILVUS_SHARDS=
+    2. export MILVUS_SHARD_TIMEOUT=
+    3. export MILVUS_MIN_SHARDS=
+
+    Остальные параметры подключения читаются каждым шардом как в MilvusWrapper.
+    """
+
+    def __init__(
+        self,
+        config_path: str = None,
+        service_name: str = None,
+        config: dict = {},
+        shards: Optional[list[str]] = None,
+        timeout: Optional[float] = None,
+        min_shards: Optional[int] = None,
+        shard_key: Optional[Callable[[str], int]] = None
+    ) -> None:
+        """
+        Инициализировать конфигурации можно 3 способами
+        (указаны в порядке важности, верхние уровни перетирают значения нижних):
+
+        1. Аргументами инициализации класса
+        2. ini файлом конфигурации с указанием наименования сервиса
+        3. Через системные переменные (os.env)
+
+        Args:
+            config_path (str, optional): Путь до ini файла. Defaults to None.
+            service_name (str, optional): Наименование сервиса в ini. Defaults to None.
+            config (dict, optional): Загруженный конфиг в виде словаря.
+                Инициализация config_path + service_name эквивалентна config. Defaults to {}.
+            shards (list[str], optional): Шарды в формате `host:port` или `host:port/collection`.
+            Если коллекция не указана, то используется имя из `init_collection`:
+            ```python
+                shards = ['milvus-eu:19530', 'milvus-us:19530/piracy_us']
+            ```
+            Defaults to None.
+            timeout (float, optional): Время ожидания ответа шарда при поиске, сек. Шарды,
+                не ответившие вовремя, пропускаются. Defaults to None.
+            min_shards (int, optional): Минимальное количество ответивших шардов,
+                при котором результат поиска считается валидным. Defaults to None.
+            shard_key (Callable[[str], int], optional): Функция выбора шарда-владельца по video_id.
+                По умолчанию - crc32 от video_id по модулю количества шардов. Defaults to None.
+        """
+        self.shards = shards
+        self.timeout = timeout
+        self.min_shards = min_shards
+        self.shard_key = shard_key
+        self.config = config
+
+        if config_path and service_name and os.path.exists(config_path):
+            self.config = configparser.ConfigParser()
+            self.config.read(config_path)
+            self.config = self.config[service_name]
+        self._load_config()
+
+        self.wrappers: list[MilvusWrapper] = []
+        self.collection_names: list[Optional[str]] = []
+        for n, shard in enumerate(self.shards):
+            address, _, collection_name = shard.partition('/')
+            host, _, port = address.partition(':')
+            self.wrappers.append(MilvusWrapper(
+                config=self.config,
+                host=host,
+                port=port or None,
+                alias=f'shard_{n}'
+            ))
+            self.collection_names.append(collection_name or None)
+
+        # Запас потоков, чтобы зависшие до своего timeout шарды не задерживали следующие поиски
+        self.pool = ThreadPoolExecutor(max_workers=4 * len(self.wrappers), thread_name_prefix='milvus_shard')
+
+
+    def _load_config(self):
+        if not self.shards:
+            shards = self.config.get('MILVUS_SHARDS', os.environ.get('MILVUS_SHARDS', ''))
+            self.shards = [s.strip() for s in shards.split(',') if s.strip()]
+        assert self.shards, 'There are shards needed'
+        if self.timeout is None:
+            self.timeout = float(self.config.get('MILVUS_SHARD_TIMEOUT', os.environ.get('MILVUS_SHARD_TIMEOUT', 2.0)))
+        if self.min_shards is None:
+            self.min_shards = int(self.config.get('MILVUS_MIN_SHARDS', os.environ.get('MILVUS_MIN_SHARDS', 1)))
+        if self.shard_key is None:
+            self.shard_key = lambda video_id: zlib.crc32(str(video_id).encode('utf-8'))
+
+        logger.info('Config has been loaded')
+
+
+    def owner(self, video_id: str) -> int:
+        """
+        Номер шарда, в котором хранятся вектора видео `video_id`.
+        """
+        return self.shard_key(video_id) % len(self.wrappers)
+
+
+    def connect(self):
+        for wrapper in self.wrappers:
+            wrapper.connect()
+
+
+    def init_collection(
+        self,
+        collection_name: str,
+        schema: Optional[CollectionSchema] = None,
+        num_shards: int = 2
+    ) -> None:
+        """
+        Инициализация или подключение к коллекции в каждом шарде.
+        Аргументы аналогичны `MilvusWrapper.init_collection`.
+        """
+        for wrapper, name in zip(self.wrappers, self.collection_names):
+            wrapper.init_collection(name or collection_name, schema=schema, num_shards=num_shards)
+
+
+    def create_index_if_missing(self, field_name: str, index_params: dict, index_name: str) -> None:
+        for wrapper in self.wrappers:
+            wrapper.create_index_if_missing(field_name, index_params, index_name)
+
+
+    def create_scalar_indexes(self, field_names: list[str]) -> None:
+        for wrapper in self.wrappers:
+            wrapper.create_scalar_indexes(field_names)
+
+
+    def load(self) -> None:
+        for wrapper in self.wrappers:
+            wrapper.load()
+
+
+    def flush(self) -> None:
+        for wrapper in self.wrappers:
+            wrapper.flush()
+
+
+    def close(self) -> None:
+        for wrapper in self.wrappers:
+            wrapper.close()
+        self.pool.shutdown(wait=False)
+
+
+    def insert(
+        self,
+        data: Union[list, DataFrame, dict],
+        partition_name: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> Optional[list[int]]:
+        """
+        Вставка векторов в шарды-владельцы по полю video_id.
+        Аргументы аналогичны `MilvusWrapper.insert`.
+
+        Returns:
+            Optional[list[int]]: Список primary_keys, если все шарды вставили строки сразу.
+        """
+        by_owner: dict[int, list[dict]] = {}
+        for row in self.wrappers[0]._to_rows(data):
+            by_owner.setdefault(self.owner(row['video_id']), []).append(row)
+
+        primary_keys = []
+        for n, rows in sorted(by_owner.items()):
+            keys = self.wrappers[n].insert(rows, partition_name=partition_name, timeout=timeout)
+            if keys is None:
+                primary_keys = None
+            elif primary_keys is not None:
+                primary_keys.extend(keys)
+        return primary_keys
+
+
+    def vector_search(self, features, limit=10, metric_type="COSINE", **kwargs) -> list[list[dict]]:
+        """
+        Параллельный поиск во всех шардах с объединением ближайших совпадений по расстоянию.
+        Аргументы аналогичны `MilvusWrapper.vector_search`.
+
+        Шарды, не ответившие за `timeout` секунд или завершившиеся с ошибкой, пропускаются.
+        Если ответило меньше `min_shards` шардов, то вызывается исключение.
+        Запущенный поиск нельзя отменить, поэтому `timeout` передается и в сам запрос к шарду.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        futures = {
+            self.pool.submit(
+                wrapper.vector_search, features, limit=limit, metric_type=metric_type, **kwargs
+            ): n
+            for n, wrapper in enumerate(self.wrappers)
+        }
+        done, not_done = wait(futures, timeout=self.timeout)
+
+        results = []
+        for future in done:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f'Shard {futures[future]} search failed: {e}')
+        for future in not_done:
+            future.cancel()
+            logger.warning(f'Shard {futures[future]} search timed out')
+
+        if len(results) < self.min_shards:
+            raise RuntimeError(f'Only {len(results)} of {len(self.wrappers)} shards have answered')
+        # primary_keys разных коллекций независимы, поэтому совпадения не схлопываются по id
+        return merge_hits(*results, limit=limit, metric_type=metric_type, dedupe=False)
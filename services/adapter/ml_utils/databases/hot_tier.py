@@ -0,0 +1,139 @@
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+from .local_search import make_hit
+
+
+class HotTier:
+    """
+    Горячий уровень поиска: in-memory индекс последних вставленных векторов.
+
+    Вектора хранятся в кольцевом буфере фиксированного размера и вытесняются либо по возрасту
+    (старше `ttl_hours`), либо по размеру (самые старые перезаписываются новыми).
+    Поиск точный - нормированные вектора перемножаются с запросом одной матричной операцией,
+    что для десятков тысяч векторов быстрее сетевого запроса в Milvus.
+    Поддерживается только метрика COSINE.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 50000,
+        ttl_hours: float = 24.0,
+        anns_field: str = 'features'
+    ) -> None:
+        """
+        Args:
+            max_size (int, optional): Максимальное количество векторов в уровне. Defaults to 50000.
+            ttl_hours (float, optional): Сколько часов вектор хранится после вставки. Defaults to 24.0.
+            anns_field (str, optional): Наименование поля вектора в строке. Defaults to 'features'.
+        """
+        self.max_size = max_size
+        self.ttl = ttl_hours * 3600
+        self.anns_field = anns_field
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._times = np.full(max_size, -np.inf)
+        self._rows: list[Optional[dict]] = [None] * max_size
+        self._ids: list[Optional[int]] = [None] * max_size
+        self._tickets = np.full(max_size, -1, dtype=np.int64)
+        self._next = 0
+
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int((self._times >= time.time() - self.ttl).sum())
+
+
+    def add(self, rows: list[dict], primary_keys: Optional[list[int]] = None) -> list[int]:
+        """
+        Добавление строк в уровень. Если primary_keys неизвестны (строки еще в буфере вставки),
+        их можно проставить позже через `set_ids` по возвращенным номерам строк.
+
+        Returns:
+            list[int]: Порядковые номера добавленных строк. Номер не переиспользуется,
+                поэтому по нему нельзя попасть в слот, который уже занят более новой строкой.
+        """
+        if not rows:
+            return []
+        vectors = np.stack([np.asarray(row[self.anns_field], dtype=np.float32) for row in rows])
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+        primary_keys = primary_keys or [None] * len(rows)
+
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, vectors.shape[1]), dtype=np.float32)
+            now = time.time()
+            tickets = list(range(self._next, self._next + len(rows)))
+            for row, vector, pk, ticket in zip(rows, vectors, primary_keys, tickets):
+                slot = ticket % self.max_size
+                self._vectors[slot] = vector
+                self._times[slot] = now
+                self._rows[slot] = row
+                self._ids[slot] = pk
+                self._tickets[slot] = ticket
+            self._next += len(rows)
+        return tickets
+
+
+    def set_ids(self, tickets: list[int], primary_keys: list[int]) -> None:
+        """
+        Проставление primary_keys строкам после их фактической вставки в Milvus.
+        Нужно, чтобы совпадения из уровня и из Milvus не дублировали друг друга.
+        Строки, уже вытесненные из уровня, пропускаются.
+
+        Args:
+            tickets (list[int]): Номера строк из `add`.
+            primary_keys (list[int]): primary_keys строк в том же порядке.
+        """
+        with self._lock:
+            for ticket, pk in zip(tickets, primary_keys):
+                slot = ticket % self.max_size
+                if self._tickets[slot] == ticket:
+                    self._ids[slot] = pk
+
+
+    def search(
+        self,
+        features,
+        limit: int = 10,
+        output_fields: list[str] = ['video_id'],
+        metric_type: str = "COSINE",
+        row_filter: Optional[Callable[[dict], bool]] = None
+    ) -> list[list[dict]]:
+        """
+        Точный поиск по неустаревшим векторам уровня.
+        Формат результата совпадает с `MilvusWrapper.vector_search`.
+        Если указан `row_filter`, то поиск идет только по строкам, для которых он вернул True.
+        """
+        assert metric_type == "COSINE", 'Hot tier supports only COSINE metric'
+        queries = np.atleast_2d(np.asarray(features, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+
+        with self._lock:
+            if self._vectors is None:
+                return [[] for _ in range(len(queries))]
+            slots = np.flatnonzero(self._times >= time.time() - self.ttl)
+            if row_filter:
+                slots = slots[[row_filter(self._rows[slot]) for slot in slots]]
+            k = min(limit, len(slots))
+            if k == 0:
+                return [[] for _ in range(len(queries))]
+
+            distances = queries @ self._vectors[slots].T
+            idx = np.argpartition(-distances, k - 1, axis=-1)[:, :k]
+            idx = np.take_along_axis(idx, np.argsort(-np.take_along_axis(distances, idx, -1), axis=-1), -1)
+            return [
+                [
+                    make_hit(self._ids[slots[i]], distances[q, i], self._rows[slots[i]], output_fields)
+                    for i in idx[q]
+                ]
+                for q in range(len(queries))
+            ]
@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from .. import logger
+from .local_search import brute_force_search, make_hit
+
+
+class InsertBuffer:
+    """
+    Буфер отложенной вставки (write-behind) для Milvus.
+
+    Строки копятся в памяти и вставляются в коллекцию одним запросом, когда набирается
+    `max_rows` строк или с момента первой строки в буфере прошло `flush_interval` секунд.
+    Пока строки не стали гарантированно видны в поиске Milvus (буфер + `visibility_window`
+    секунд после вставки), по ним выполняется локальный поиск перебором.
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[list[dict], Optional[str]], Optional[list[int]]],
+        max_rows: int = 256,
+        flush_interval: float = 5.0,
+        visibility_window: float = 10.0,
+        anns_field: str = 'features',
+        on_flush: Optional[Callable[[list, list[int]], None]] = None
+    ) -> None:
+        """
+        Args:
+            flush_fn (Callable): Функция вставки строк в коллекцию. Принимает список строк
+                и наименование партиции, возвращает список primary_keys.
+            max_rows (int, optional): Количество строк, при котором буфер сбрасывается. Defaults to 256.
+            flush_interval (float, optional): Максимальное время жизни строки в буфере, сек. Defaults to 5.0.
+            visibility_window (float, optional): Сколько секунд после вставки строки продолжают
+                участвовать в локальном поиске. Должно быть не меньше допустимой задержки
+                консистентности "Bounded" в Milvus. Defaults to 10.0.
+            anns_field (str, optional): Наименование поля вектора. Defaults to 'features'.
+            on_flush (Callable, optional): Вызывается после успешной вставки с метками строк
+                (`tags` из `add`, по умолчанию сами строки) и полученными primary_keys. Defaults to None.
+        """
+        self.flush_fn = flush_fn
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.visibility_window = visibility_window
+        self.anns_field = anns_field
+        self.on_flush = on_flush
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._pending: list[tuple[Optional[str], dict, Any]] = []
+        self._pending_since: Optional[float] = None
+        self._flushed: deque[tuple[float, list[dict], list[Optional[int]]]] = deque()
+
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+    def add(self, rows: list[dict], partition_name: Optional[str] = None, tags: Optional[list] = None) -> None:
+        """
+        Добавление строк в буфер. Вставка в Milvus произойдет в фоновом потоке.
+        `tags` - метки строк для `on_flush`, например номера строк в горячем уровне.
+        """
+        tags = rows if tags is None else tags
+        with self._lock:
+            if not self._pending:
+                self._pending_since = time.time()
+            self._pending.extend((partition_name, row, tag) for row, tag in zip(rows, tags))
+            full = len(self._pending) >= self.max_rows
+        logger.debug(f'Buffered {len(rows)} rows')
+        if full:
+            self._wakeup.set()
+
+
+    def flush(self) -> None:
+        """
+        Синхронная вставка всех строк буфера. При ошибке строки остаются в буфере
+        и будут вставлены при следующем сбросе.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._pending_since = None
+            if not pending:
+                return
+
+            by_partition = defaultdict(list)
+            for partition_name, row, tag in pending:
+                by_partition[partition_name].append((row, tag))
+
+            failed = []
+            for partition_name, items in by_partition.items():
+                rows = [row for row, _ in items]
+                try:
+                    primary_keys = self.flush_fn(rows, partition_name)
+                except Exception as e:
+                    logger.exception(e)
+                    primary_keys = None
+
+                if primary_keys is None:
+                    failed.extend((partition_name, row, tag) for row, tag in items)
+                    continue
+                with self._lock:
+                    self._flushed.append((time.time(), rows, list(primary_keys)))
+                if self.on_flush:
+                    self.on_flush([tag for _, tag in items], list(primary_keys))
+                logger.info(f'Flushed {len(rows)} rows')
+
+            if failed:
+                with self._lock:
+                    self._pending = failed + self._pending
+                    self._pending_since = self._pending_since or time.time()
+
+
+    def search(
+        self,
+        features,
+        limit: int = 10,
+        output_fields: list[str] = ['video_id'],
+        metric_type: str = "COSINE",
+        row_filter: Optional[Callable[[dict], bool]] = None
+    ) -> list[list[dict]]:
+        """
+        Локальный поиск перебором по строкам, которые еще могут быть не видны в Milvus.
+        Формат результата совпадает с `MilvusWrapper.vector_search`.
+        Если указан `row_filter`, то поиск идет только по строкам, для которых он вернул True.
+        """
+        with self._lock:
+            self._expire()
+            rows = [row for _, row, _ in self._pending]
+            ids = [None] * len(rows)
+            for _, flushed_rows, primary_keys in self._flushed:
+                rows.extend(flushed_rows)
+                ids.extend(primary_keys)
+
+        if row_filter:
+            kept = [i for i, row in enumerate(rows) if row_filter(row)]
+            rows, ids = [rows[i] for i in kept], [ids[i] for i in kept]
+
+        n_query = len(np.atleast_2d(features))
+        if not rows:
+            return [[] for _ in range(n_query)]
+
+        vectors = np.stack([np.asarray(row[self.anns_field], dtype=np.float32) for row in rows])
+        indexes, distances = brute_force_search(features, vectors, limit, metric_type)
+        return [
+            [make_hit(ids[i], d, rows[i], output_fields) for i, d in zip(idx, dist)]
+            for idx, dist in zip(indexes, distances)
+        ]
+
+
+    def close(self) -> None:
+        """
+        Остановка фонового потока и сброс оставшихся строк.
+        """
+        self._closed.set()
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+
+
+    def _expire(self) -> None:
+        deadline = time.time() - self.visibility_window
+        while self._flushed and self._flushed[0][0] < deadline:
+            self._flushed.popleft()
+
+
+    def _flush_loop(self) -> None:
+        while not self._closed.is_set():
+            with self._lock:
+                since = self._pending_since
+            timeout = self.flush_interval if since is None else max(0.0, since + self.flush_interval - time.time())
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            if self._closed.is_set():
+                break
+
+            with self._lock:
+                due = self._pending_since is not None and (
+                    len(self._pending) >= self.max_rows
+                    or time.time() - self._pending_since >= self.flush_interval
+                )
+            if due:
+                self.flush()
@@ -0,0 +1,100 @@
+from typing import Optional
+
+import numpy as np
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def brute_force_search(
+    features,
+    vectors: np.ndarray,
+    limit: int = 10,
+    metric_type: str = "COSINE"
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Точный поиск ближайших векторов перебором (матричное умножение NumPy).
+    Используется для небольших локальных наборов векторов, которые еще не видны в Milvus.
+
+    Args:
+        features: Вектора запроса. Размер - [n_query, dim].
+        vectors (np.ndarray): Вектора, по которым производится поиск. Размер - [n, dim].
+        limit (int, optional): Количество ближайших векторов для каждого запроса. Defaults to 10.
+        metric_type (str, optional): COSINE | IP | L2. Defaults to "COSINE".
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Индексы найденных векторов и расстояния до них.
+            Размер каждого - [n_query, min(limit, n)], отсортированы от ближайшего.
+    """
+    queries = np.atleast_2d(np.asarray(features, dtype=np.float32))
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    k = min(limit, len(vectors))
+    if k == 0:
+        empty = np.empty((len(queries), 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+
+    if metric_type == "COSINE":
+        distances = _normalize(queries) @ _normalize(vectors).T
+    elif metric_type == "IP":
+        distances = queries @ vectors.T
+    elif metric_type == "L2":
+        # Milvus возвращает квадрат евклидова расстояния
+        distances = (
+            (queries ** 2).sum(-1, keepdims=True)
+            - 2 * queries @ vectors.T
+            + (vectors ** 2).sum(-1)[None]
+        )
+    else:
+        raise ValueError(f'Unsupported metric type {metric_type}')
+
+    # Для L2 ближе - меньше, для COSINE и IP - больше
+    order = distances if metric_type == "L2" else -distances
+    idx = np.argpartition(order, k - 1, axis=-1)[:, :k]
+    idx = np.take_along_axis(idx, np.argsort(np.take_along_axis(order, idx, -1), axis=-1), -1)
+    return idx, np.take_along_axis(distances, idx, -1)
+
+
+def merge_hits(
+    *results: list[list[dict]],
+    limit: int = 10,
+    metric_type: str = "COSINE",
+    dedupe: bool = True
+) -> list[list[dict]]:
+    """
+    Объединение нескольких результатов поиска (в формате `MilvusWrapper.vector_search`) по запросам.
+    Если `dedupe`, то совпадения с одинаковым непустым `id` учитываются один раз.
+
+    Returns:
+        list[list[dict]]: Список совпадений для каждого запроса. Размер - [n_query, <=limit].
+    """
+    results = [r for r in results if r]
+    if not results:
+        return []
+
+    merged = []
+    for hits_per_query in zip(*results):
+        seen = set()
+        hits = []
+        for hit in (hit for hits in hits_per_query for hit in hits):
+            if dedupe and hit.get('id') is not None:
+                if hit['id'] in seen:
+                    continue
+                seen.add(hit['id'])
+            hits.append(hit)
+        hits.sort(key=lambda x: x['distance'], reverse=metric_type != "L2")
+        merged.append(hits[:limit])
+    return merged
+
+
+def make_hit(id_: Optional[int], distance: float, row: dict, output_fields: list[str]) -> dict:
+    """
+    Формирование совпадения в том же виде, что и `Hit.to_dict()` из pymilvus.
+    """
+    return {
+        'id': id_,
+        'distance': float(distance),
+        'entity': {field: row.get(field) for field in output_fields}
+    }
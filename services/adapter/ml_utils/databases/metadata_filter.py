@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class MetadataFilter:
+    """
+    Фильтр кандидатов векторного поиска по метаданным видео.
+    Один и тот же фильтр применяется и в Milvus (через `expr`), и в локальных уровнях поиска (через `match`).
+
+    Неизвестные метаданные (0, значение по умолчанию в схеме) фильтр проходят, чтобы такие видео
+    оставались кандидатами. Строки коллекций, созданных до появления полей метаданных, хранят их
+    в динамическом поле, и у старых строк этих ключей нет совсем. Такие строки Milvus по `expr`
+    не находит, поэтому перед включением metadata_filter старые векторы нужно перевставить
+    с метаданными, иначе их дубликаты не будут найдены.
+    """
+    duration: Optional[float] = None
+    """ Длительность видео запроса в секундах. """
+    duration_tolerance: float = 0.2
+    """ Допустимое относительное отклонение длительности: 0.2 - это ±20%. """
+    aspect_ratio: Optional[float] = None
+    """ Соотношение сторон видео запроса (ширина / высота). """
+    same_orientation: bool = False
+    """ Оставлять только видео той же ориентации (горизонтальные или вертикальные). """
+
+    @property
+    def bounds(self) -> Optional[tuple[float, float]]:
+        if not self.duration or self.duration <= 0:
+            return None
+        return (
+            self.duration * (1 - self.duration_tolerance),
+            self.duration * (1 + self.duration_tolerance)
+        )
+
+    @property
+    def expr(self) -> str:
+        """
+        Логическое выражение фильтра в синтаксисе Milvus. Пустая строка, если фильтровать нечего.
+        """
+        conditions = []
+        if self.bounds:
+            low, high = self.bounds
+            conditions.append(f'duration <= 0 or (duration >= {low:.3f} and duration <= {high:.3f})')
+        if self.same_orientation and self.aspect_ratio:
+            conditions.append('aspect_ratio <= 0 or aspect_ratio >= 1.0' if self.aspect_ratio >= 1.0 else 'aspect_ratio < 1.0')
+        return ' and '.join(f'({c})' for c in conditions)
+
+    def match(self, row: dict) -> bool:
+        """
+        Проверка строки в памяти на соответствие фильтру.
+        """
+        if self.bounds:
+            low, high = self.bounds
+            duration = row.get('duration')
+            if duration is None or (duration > 0 and not low <= duration <= high):
+                return False
+        if self.same_orientation and self.aspect_ratio:
+            aspect_ratio = row.get('aspect_ratio')
+            if aspect_ratio is None or (aspect_ratio > 0 and (aspect_ratio >= 1.0) != (self.aspect_ratio >= 1.0)):
+                return False
+        return True
@@ -1,11 +1,18 @@
 import configparser
 import os
+import threading
+import time
+from datetime import datetime
 from typing import Optional, Union
 
 from pandas import DataFrame
 from pymilvus import Collection, CollectionSchema, connections, utility
 
 from .. import logger
+from .hot_tier import HotTier
+from .insert_buffer import InsertBuffer
+from .local_search import merge_hits
+from .metadata_filter import MetadataFilter
 
 
 class MilvusWrapper:
@@ -19,6 +26,17 @@ class MilvusWrapper:
     3. export MILVUS_ALIAS=
     4. export MILVUS_USER=
     5. export MILVUS_PASS=
+    6. export MILVUS_INSERT_BUFFER_SIZE=
+    7. export MILVUS_INSERT_FLUSH_INTERVAL=
+    8. export MILVUS_VISIBILITY_WINDOW=
+    9. export MILVUS_HOT_TIER_SIZE=
+    10. export MILVUS_HOT_TIER_HOURS=
+    11. export MILVUS_HOT_TIER_MODE=
+    12. export MILVUS_PARTITION_PERIOD=
+    13. export MILVUS_SEARCH_PARTITIONS=
+    14. export MILVUS_LOADED_PARTITIONS=
+    15. export MILVUS_PARTITION_RETENTION=
+    16. export MILVUS_DEEP_SEARCH=
     """
     
     def __init__(
@@ -30,7 +48,18 @@ class MilvusWrapper:
         port: Optional[Union[str, int]] = None,
         user: Optional[str] = None,
         password: Optional[str] = None,
-        alias: Optional[str] = None
+        alias: Optional[str] = None,
+        insert_buffer_size: Optional[int] = None,
+        insert_flush_interval: Optional[float] = None,
+        visibility_window: Optional[float] = None,
+        hot_tier_size: Optional[int] = None,
+        hot_tier_hours: Optional[float] = None,
+        hot_tier_mode: Optional[str] = None,
+        partition_period: Optional[str] = None,
+        search_partitions: Optional[int] = None,
+        loaded_partitions: Optional[int] = None,
+        partition_retention: Optional[int] = None,
+        deep_search: Optional[bool] = None
     ) -> None:
         """
         Инициализировать конфигурации можно 3 способами 
@@ -50,13 +79,51 @@ class MilvusWrapper:
             user (str, optional): Пользователь для авторизации. Defaults to None.
             password (str, optional): Пароль пользователя. Defaults to None.
             alias (str, optional): Короткое наименование текущего подключения к базе. Defaults to None.
+            insert_buffer_size (int, optional): Количество строк, накапливаемых перед вставкой.
+                Если 0, то буфер отключен и каждая вставка выполняется сразу. Defaults to None.
+            insert_flush_interval (float, optional): Максимальное время нахождения строки в буфере, сек.
+                Defaults to None.
+            visibility_window (float, optional): Сколько секунд после вставки строки ищутся локально,
+                пока не станут видны в поиске с consistency_level="Bounded". Defaults to None.
+            hot_tier_size (int, optional): Размер горячего уровня - in-memory индекса последних
+                вставленных векторов. Если 0, то уровень отключен. Defaults to None.
+            hot_tier_hours (float, optional): Сколько часов вектор хранится в горячем уровне. Defaults to None.
+            hot_tier_mode (str, optional): fallback | always. В режиме fallback Milvus запрашивается,
+                только если в горячем уровне нет совпадений выше порога `threshold` из `vector_search`.
+                В режиме always результаты обоих уровней объединяются. Defaults to None.
+            partition_period (str, optional): day | week. Период временных партиций, в которые
+                вставляются вектора. Если пустой, то партиции не используются. Defaults to None.
+            search_partitions (int, optional): В скольких последних временных партициях выполняется
+                поиск по умолчанию. Defaults to None.
+            loaded_partitions (int, optional): Сколько последних временных партиций держать в памяти
+                Milvus, более старые освобождаются (release). Если 0, то все. Defaults to None.
+            partition_retention (int, optional): Сколько последних временных партиций хранить,
+                более старые удаляются. Если 0, то все. Defaults to None.
+            deep_search (bool, optional): Искать ли во всех загруженных партициях, если в последних
+                не найдено совпадений выше порога `threshold` из `vector_search`. Defaults to None.
         """
         self.host = host
         self.port = port
         self.alias = alias
         self.user = user
         self.password = password
+        self.insert_buffer_size = insert_buffer_size
+        self.insert_flush_interval = insert_flush_interval
+        self.visibility_window = visibility_window
+        self.hot_tier_size = hot_tier_size
+        self.hot_tier_hours = hot_tier_hours
+        self.hot_tier_mode = hot_tier_mode
+        self.partition_period = partition_period
+        self.search_partitions = search_partitions
+        self.loaded_partitions = loaded_partitions
+        self.partition_retention = partition_retention
+        self.deep_search = deep_search
         self.config = config
+        self._current_partition: Optional[str] = None
+        self._partition_lock = threading.Lock()
+        self._partitions: tuple[float, list[str]] = (0.0, [])
+        self.buffer: Optional[InsertBuffer] = None
+        self.hot_tier: Optional[HotTier] = None
         
         if config_path and service_name and os.path.exists(config_path):
             self.config = configparser.ConfigParser()
@@ -76,6 +143,48 @@ class MilvusWrapper:
             self.user = self.config.get('MILVUS_USER', os.environ.get('MILVUS_USER', None)) 
         if not self.password:
             self.password = self.config.get('MILVUS_PASS', os.environ.get('MILVUS_PASS', None)) 
+        if self.insert_buffer_size is None:
+            self.insert_buffer_size = int(self.config.get(
+                'MILVUS_INSERT_BUFFER_SIZE', os.environ.get('MILVUS_INSERT_BUFFER_SIZE', 0)
+            ))
+        if self.insert_flush_interval is None:
+            self.insert_flush_interval = float(self.config.get(
+                'MILVUS_INSERT_FLUSH_INTERVAL', os.environ.get('MILVUS_INSERT_FLUSH_INTERVAL', 5.0)
+            ))
+        if self.visibility_window is None:
+            self.visibility_window = float(self.config.get(
+                'MILVUS_VISIBILITY_WINDOW', os.environ.get('MILVUS_VISIBILITY_WINDOW', 10.0)
+            ))
+        if self.hot_tier_size is None:
+            self.hot_tier_size = int(self.config.get(
+                'MILVUS_HOT_TIER_SIZE', os.environ.get('MILVUS_HOT_TIER_SIZE', 0)
+            ))
+        if self.hot_tier_hours is None:
+            self.hot_tier_hours = float(self.config.get(
+                'MILVUS_HOT_TIER_HOURS', os.environ.get('MILVUS_HOT_TIER_HOURS', 24.0)
+            ))
+        if not self.hot_tier_mode:
+            self.hot_tier_mode = self.config.get('MILVUS_HOT_TIER_MODE', os.environ.get('MILVUS_HOT_TIER_MODE', 'fallback'))
+        assert self.hot_tier_mode in ['fallback', 'always'], "Hot tier mode must be 'fallback' or 'always'"
+        if self.partition_period is None:
+            self.partition_period = self.config.get('MILVUS_PARTITION_PERIOD', os.environ.get('MILVUS_PARTITION_PERIOD', ''))
+        assert self.partition_period in ['', 'day', 'week'], "Partition period must be 'day', 'week' or empty"
+        if self.search_partitions is None:
+            self.search_partitions = int(self.config.get(
+                'MILVUS_SEARCH_PARTITIONS', os.environ.get('MILVUS_SEARCH_PARTITIONS', 4)
+            ))
+        if self.loaded_partitions is None:
+            self.loaded_partitions = int(self.config.get(
+                'MILVUS_LOADED_PARTITIONS', os.environ.get('MILVUS_LOADED_PARTITIONS', 0)
+            ))
+        if self.partition_retention is None:
+            self.partition_retention = int(self.config.get(
+                'MILVUS_PARTITION_RETENTION', os.environ.get('MILVUS_PARTITION_RETENTION', 0)
+            ))
+        if self.deep_search is None:
+            self.deep_search = str(self.config.get(
+                'MILVUS_DEEP_SEARCH', os.environ.get('MILVUS_DEEP_SEARCH', True)
+            )).lower() in ['true', '1', 'yes']
 
         logger.info('Config has been loaded')
     
@@ -115,11 +224,14 @@ class MilvusWrapper:
             num_shards (int, optional): На сколько частей делить коллекицю. Каждая часть увеличивает
                 пропускную способность вставки, так как они рассчитаны на работу в параллели. Defaults to 2.
             alias (str, optional): Дополнительное название (короткое имя коллекции по которому можно подключаться).
-                Если 'default', то alias не присвоится. Defaults to 'default'.
+                Если 'default', то alias не присвоится. Используется, если у обертки не задан
+                собственный alias подключения. Defaults to 'default'.
         """
-        if utility.has_collection(collection_name):
+        using = self.alias or alias
+        if utility.has_collection(collection_name, using=using):
             self.collection = Collection(
                 name=collection_name,
+                using=using
             )
             logger.info(f'Collection {collection_name} has been connected')
         else:
@@ -129,10 +241,177 @@ class MilvusWrapper:
             self.collection = Collection(
                 name=collection_name,
                 schema=schema,
-                using=alias,
+                using=using,
                 num_shards=num_shards
             )
             logger.info(f'New collection {collection_name} has been added')
+        
+        if self.hot_tier_size > 0 and self.hot_tier is None:
+            self.hot_tier = HotTier(max_size=self.hot_tier_size, ttl_hours=self.hot_tier_hours)
+            logger.info(f'Hot tier for {self.hot_tier_size} vectors has been enabled')
+        
+        if self.insert_buffer_size > 0 and self.buffer is None:
+            self.buffer = InsertBuffer(
+                flush_fn=self._insert_rows,
+                max_rows=self.insert_buffer_size,
+                flush_interval=self.insert_flush_interval,
+                visibility_window=self.visibility_window,
+                on_flush=self.hot_tier.set_ids if self.hot_tier else None
+            )
+            logger.info(f'Insert buffer for {self.insert_buffer_size} rows has been enabled')
+    
+    
+    def create_index_if_missing(self, field_name: str, index_params: dict, index_name: str) -> None:
+        """
+        Создание векторного индекса, если в коллекции еще нет ни одного индекса.
+        """
+        if len(self.collection.indexes) == 0:
+            self.collection.create_index(
+                field_name=field_name,
+                index_params=index_params,
+                index_name=index_name
+            )
+            logger.info(f'Index {index_name} has been created')
+    
+    
+    def load(self) -> None:
+        """
+        Загрузка коллекции в память. Если используются временные партиции, то загружаются
+        партиция по умолчанию (данные до включения партиций) и `loaded_partitions` последних.
+        """
+        if not self.partition_period or self.loaded_partitions <= 0:
+            self.collection.load()
+        else:
+            partitions = self.time_partitions()[:self.loaded_partitions]
+            self.collection.load(partition_names=['_default', *partitions])
+        logger.info(f'Collection {self.collection.name} has been loaded')
+    
+    
+    def partition_for(self, timestamp: Optional[datetime] = None) -> str:
+        """
+        Наименование временной партиции для момента времени `timestamp` (по умолчанию - сейчас).
+        Наименования упорядочены лексикографически в том же порядке, что и периоды.
+        """
+        timestamp = timestamp or datetime.now()
+        if self.partition_period == 'week':
+            year, week, _ = timestamp.isocalendar()
+            return f'w_{year}_{week:02d}'
+        return f'd_{timestamp:%Y%m%d}'
+    
+    
+    def time_partitions(self, refresh: bool = False) -> list[str]:
+        """
+        Список временных партиций коллекции от новых к старым.
+        Список кэшируется на минуту, чтобы не запрашивать его при каждом поиске.
+        """
+        updated, names = self._partitions
+        if refresh or time.time() - updated > 60:
+            prefix = 'w_' if self.partition_period == 'week' else 'd_'
+            names = sorted(
+                [p.name for p in self.collection.partitions if p.name.startswith(prefix)],
+                reverse=True
+            )
+            self._partitions = (time.time(), names)
+        return names
+    
+    
+    def current_partition(self) -> str:
+        """
+        Текущая временная партиция для вставки. При смене периода партиция создается,
+        загружается, а устаревшие партиции освобождаются или удаляются.
+        Вставки из нескольких потоков создают и ротируют партиции один раз.
+        """
+        name = self.partition_for()
+        if name == self._current_partition:
+            return name
+        with self._partition_lock:
+            if name != self._current_partition:
+                if not self.collection.has_partition(name):
+                    self.collection.create_partition(name)
+                    logger.info(f'Partition {name} has been created')
+                self.collection.load(partition_names=[name])
+                self.time_partitions(refresh=True)
+                self.rotate_partitions()
+                self._current_partition = name
+        return name
+    
+    
+    def rotate_partitions(self) -> None:
+        """
+        Освобождение из памяти партиций старше `loaded_partitions` последних
+        и удаление партиций старше `partition_retention` последних.
+        """
+        partitions = self.time_partitions()
+        if self.loaded_partitions > 0:
+            for name in partitions[self.loaded_partitions:]:
+                self.collection.partition(name).release()
+                logger.info(f'Partition {name} has been released')
+        if self.partition_retention > 0:
+            for name in partitions[self.partition_retention:]:
+                self.collection.partition(name).release()
+                self.collection.drop_partition(name)
+                logger.info(f'Partition {name} has been dropped')
+            self.time_partitions(refresh=True)
+    
+    
+    def _to_rows(self, data: Union[list, DataFrame, dict]) -> list[dict]:
+        """
+        Приведение данных для вставки к списку строк-словарей.
+        """
+        if isinstance(data, DataFrame):
+            return data.to_dict('records')
+        if isinstance(data, dict):
+            return [data]
+        if len(data) > 0 and isinstance(data[0], dict):
+            return list(data)
+        
+        names = [field.name for field in self.collection.schema.fields if not field.auto_id]
+        return [dict(zip(names, values)) for values in zip(*data)]
+    
+    
+    @staticmethod
+    def _prepare_rows(rows: list[dict]) -> list[dict]:
+        return [
+            {k: v.tolist() if hasattr(v, 'tolist') else v for k, v in row.items()}
+            for row in rows
+        ]
+    
+    
+    def _insert_rows(self, rows: list[dict], partition_name: Optional[str] = None) -> Optional[list[int]]:
+        res = self.collection.insert(self._prepare_rows(rows), partition_name=partition_name)
+        if res.err_count > 0:
+            logger.error(f'Errors: {res.err_count}')
+        return list(res.primary_keys)
+    
+    
+    def create_scalar_indexes(self, field_names: list[str]) -> None:
+        """
+        Создание скалярных индексов для ускорения фильтрации по полям `field_names`.
+        Поля, отсутствующие в схеме коллекции (например, хранящиеся в динамическом поле), пропускаются.
+        """
+        schema_fields = {field.name for field in self.collection.schema.fields}
+        indexed = {index.field_name for index in self.collection.indexes}
+        for name in field_names:
+            if name in schema_fields and name not in indexed:
+                self.collection.create_index(field_name=name, index_name=f'{name}_idx')
+                logger.info(f'Scalar index on {name} has been created')
+    
+    
+    def flush(self) -> None:
+        """
+        Принудительная вставка всех строк из буфера отложенной вставки.
+        """
+        if self.buffer:
+            self.buffer.flush()
+    
+    
+    def close(self) -> None:
+        """
+        Остановка буфера отложенной вставки с записью оставшихся строк.
+        """
+        if self.buffer:
+            self.buffer.close()
+            self.buffer = None
     
     
     def insert(
@@ -155,6 +434,15 @@ class MilvusWrapper:
                 milvus_wrapper.insert(data)
             ```
                 
+            В виде списка строк-словарей (поля, которых нет в схеме, попадут в динамическое поле):
+            ```python
+                data = [
+                    {'video_id': str(i), 'features': [random.random() for _ in range(100)], 'duration': 12.5}
+                    for i in range(2000)
+                ]
+                milvus_wrapper.insert(data)
+            ```
+                
             В виде словаря параметров единичного вектора:
             ```python
                 data = {
@@ -174,14 +462,29 @@ class MilvusWrapper:
                 milvus_wrapper.insert(data)
             ```
                 
-            partition_name (str, optional): Партиция для вставки. Defaults to None.
+            partition_name (str, optional): Партиция для вставки. Если не указана и включены
+                временные партиции, то используется текущая. Defaults to None.
             timeout (float, optional): Тайминг ожидания ответа от сервера. Если None
                 то ожидаем, пока не получим ответ. Defaults to None.
 
         Returns:
-            Optional[list[int]]: Список primary_keys.
+            Optional[list[int]]: Список primary_keys. Если включен буфер отложенной вставки,
+                то строки будут вставлены позже и возвращается None.
         
         """
+        if self.partition_period and partition_name is None:
+            partition_name = self.current_partition()
+        
+        rows = self._to_rows(data) if self.buffer or self.hot_tier else None
+        if self.buffer:
+            # Строки попадают в горячий уровень до буфера, чтобы сброс буфера нашел их номера
+            tickets = self.hot_tier.add(rows) if self.hot_tier else None
+            self.buffer.add(rows, partition_name, tags=tickets)
+            return None
+        
+        if isinstance(data, list) and len(data) > 0 and isinstance(data[0], dict):
+            data = self._prepare_rows(data)
+        
         try:
             res = self.collection.insert(
                 data,
@@ -190,6 +493,8 @@ class MilvusWrapper:
             )
             if res.err_count > 0:
                 logger.error(f'Errors: {res.err_count}')
+            if self.hot_tier:
+                self.hot_tier.add(rows, list(res.primary_keys))
             return list(res.primary_keys)
         except Exception as e:
             logger.exception(e)
@@ -202,7 +507,12 @@ class MilvusWrapper:
         anns_field='features',
         nprobe=32,
         limit=10,
-        metric_type="COSINE"
+        metric_type="COSINE",
+        threshold: Optional[float] = None,
+        partition_names: Optional[list[str]] = None,
+        expr: Optional[str] = None,
+        metadata_filter: Optional[MetadataFilter] = None,
+        timeout: Optional[float] = None
     ) -> list[list[dict]]:
         """
         Функция для поиска ближайших векторов к запросу в коллекции - векторный поиск.
@@ -219,10 +529,92 @@ class MilvusWrapper:
                 вектора в запросе. Defaults to 10.
             metric_type (str, optional): Метрика близости в запросе. Должна совпадать с метрикой в индексе.
                 Defaults to "COSINE".
+            threshold (float, optional): Порог близости для горячего уровня в режиме fallback.
+                Если в горячем уровне найдено совпадение выше порога, Milvus не запрашивается.
+                Для временных партиций - если в последних партициях нет совпадений выше порога,
+                то выполняется поиск по всем загруженным партициям (при включенном deep_search).
+                Defaults to None.
+            partition_names (list[str], optional): Партиции для поиска. Если не указаны и включены
+                временные партиции, то поиск идет по `search_partitions` последним. Defaults to None.
+            expr (str, optional): Логическое выражение Milvus для скалярной фильтрации кандидатов.
+                Применяется только к поиску в Milvus. Defaults to None.
+            metadata_filter (MetadataFilter, optional): Фильтр по метаданным видео (длительность,
+                ориентация). Применяется и к Milvus, и к локальным уровням поиска. Defaults to None.
+            timeout (float, optional): Время ожидания ответа Milvus на каждый запрос поиска, сек.
+                Defaults to None.
 
         Returns:
             list[list[dict]]: Список совпадений для каждого запроса. Размер - [n_query, limit].
         """
+        row_filter = metadata_filter.match if metadata_filter else None
+        expr = ' and '.join(f'({e})' for e in [expr, metadata_filter and metadata_filter.expr] if e) or None
+        
+        local_results = []
+        if self.hot_tier:
+            local_results = self.hot_tier.search(features, limit, output_fields, metric_type, row_filter)
+            if (
+                self.hot_tier_mode == 'fallback'
+                and threshold is not None
+                and any(hit['distance'] > threshold for hits in local_results for hit in hits)
+            ):
+                logger.debug('Candidates have been found in hot tier')
+                return local_results
+        elif self.buffer:
+            # Недавно добавленные вектора могут быть еще не видны в Milvus
+            local_results = self.buffer.search(features, limit, output_fields, metric_type, row_filter)
+        
+        search_kwargs = dict(
+            output_fields=output_fields,
+            anns_field=anns_field,
+            nprobe=nprobe,
+            limit=limit,
+            metric_type=metric_type,
+            expr=expr,
+            timeout=timeout
+        )
+        
+        recent = self.time_partitions()[:self.search_partitions] if self.partition_period else []
+        if partition_names is None and recent:
+            parsed_results = self._search(features, partition_names=recent, **search_kwargs)
+            found = any(hit['distance'] > threshold for hits in parsed_results for hit in hits) \
+                if threshold is not None else True
+            if self.deep_search and not found:
+                loaded = self.time_partitions()
+                if self.loaded_partitions > 0:
+                    loaded = loaded[:self.loaded_partitions]
+                older = ['_default', *[name for name in loaded if name not in recent]]
+                logger.debug(f'Deep search in {len(older)} partitions')
+                parsed_results = merge_hits(
+                    parsed_results,
+                    self._search(features, partition_names=older, **search_kwargs),
+                    limit=limit,
+                    metric_type=metric_type
+                )
+        else:
+            parsed_results = self._search(features, partition_names=partition_names, **search_kwargs)
+        
+        if local_results:
+            parsed_results = merge_hits(
+                local_results,
+                parsed_results,
+                limit=limit,
+                metric_type=metric_type
+            )
+        return parsed_results
+    
+    
+    def _search(
+        self,
+        features,
+        output_fields,
+        anns_field,
+        nprobe,
+        limit,
+        metric_type,
+        expr: Optional[str] = None,
+        partition_names: Optional[list[str]] = None,
+        timeout: Optional[float] = None
+    ) -> list[list[dict]]:
         search_params = {
             "metric_type": metric_type,
             "params": {"nprobe": nprobe}
@@ -234,7 +626,10 @@ class MilvusWrapper:
             limit=limit,
             anns_field=anns_field,
             output_fields=output_fields,
-            consistency_level="Bounded"
+            expr=expr,
+            partition_names=partition_names,
+            consistency_level="Bounded",
+            timeout=timeout
         )
         
         parsed_results = []
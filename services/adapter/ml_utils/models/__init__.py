@@ -1,5 +1,11 @@
 try:
     from .triton import TritonWrapper
+except Exception as e:
+    print(e)
+    pass
+
+try:
+    from .triton_async import AsyncTritonWrapper
 except Exception as e:
     print(e)
     pass
\ No newline at end of file
@@ -0,0 +1,55 @@
+from typing import Any
+
+import tritonclient.grpc.aio as grpcaio
+import tritonclient.http.aio as httpaio
+
+from .. import logger
+from .triton import TritonWrapper
+
+
+class AsyncTritonWrapper(TritonWrapper):
+    """
+    Вариант TritonWrapper для asyncio на tritonclient.grpc.aio (tritonclient.http.aio для http).
+    Конфиг и входы/выходы те же, запрос отправляется через await wrapper(*data).
+    
+    Один клиент (одно соединение) используется всеми корутинами процесса. Клиент создается
+    в start() внутри работающего event loop.
+    """
+    
+    def _init_client(self) -> Any:
+        super()._init_client()
+        self.aio_type = grpcaio if self.connect_type == 'grpc' else httpaio
+        self.aio_client = None
+    
+    
+    async def start(self) -> None:
+        self.aio_client = self.aio_type.InferenceServerClient(url=self.url, verbose=self.verbose)
+        logger.info('Async client has been initialized')
+    
+    
+    async def close(self) -> None:
+        if self.aio_client is not None:
+            await self.aio_client.close()
+    
+    
+    async def _forward(self, *inputs) -> Any:
+        result = await self.aio_client.infer(
+            self.model_name,
+            model_version=self.model_version,
+            inputs=inputs
+        )
+        return result
+    
+    
+    async def __call__(self, *data) -> list:
+        """
+        Вызов всех элементов пайплайна, как в TritonWrapper, но без блокировки event loop
+        на время запроса.
+
+        Returns:
+            list: Выходы модели в заданной конфигом последовательности
+        """
+        inputs = self._preprocess(*data)
+        results = await self._forward(*inputs)
+        outputs = self._postprocess(results)
+        return outputs
@@ -1,4 +1,29 @@
 try:
     from .video_dataloader import VideoDataloader
+except:
+    pass
+
+try:
+    from .metrics import Metrics, metrics
+except:
+    pass
+
+try:
+    from .pipeline import Stage, StagedPipeline
+except:
+    pass
+
+try:
+    from .shared_ring import SharedClipRing
+except:
+    pass
+
+try:
+    from .arena import TensorArena
+except:
+    pass
+
+try:
+    from .supervisor import WorkerSupervisor, TooManyRestartsError
 except:
     pass
\ No newline at end of file
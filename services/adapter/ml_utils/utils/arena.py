@@ -0,0 +1,66 @@
+import queue
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+
+class TensorArena:
+    """
+    Пул заранее выделенных массивов одной формы для буферов горячего цикла.
+    
+    Вместо новых массивов на каждое сообщение буферы берутся из пула (acquire) и возвращаются
+    в него после использования (release), поэтому аллокатор не фрагментирует память под потоком
+    клипов. Если все буферы заняты, acquire ждет - это ограничивает число клипов в обработке.
+    """
+    
+    def __init__(self, shape: Tuple[int, ...], dtype: str = 'float32', size: int = 4) -> None:
+        """
+        Args:
+            shape (Tuple[int, ...]): Форма буфера.
+            dtype (str, optional): Тип данных буфера. Defaults to 'float32'.
+            size (int, optional): Количество буферов. Defaults to 4.
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.size = size
+        # LIFO: недавно освобожденный буфер с большей вероятностью еще в кэше процессора
+        self._free = queue.LifoQueue()
+        self._buffers = set()
+        for _ in range(size):
+            buffer = np.empty(self.shape, dtype=self.dtype)
+            self._buffers.add(id(buffer))
+            self._free.put(buffer)
+    
+    
+    @property
+    def free(self) -> int:
+        """ Сколько буферов свободно. """
+        return self._free.qsize()
+    
+    
+    def acquire(self, timeout: Optional[float] = None) -> np.ndarray:
+        """
+        Взять свободный буфер. Содержимое буфера не очищается.
+
+        Raises:
+            TimeoutError: Свободный буфер не появился за timeout.
+        """
+        try:
+            return self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f'There is no free buffer in {self.size} buffers')
+    
+    
+    def release(self, buffer: np.ndarray) -> None:
+        assert id(buffer) in self._buffers, 'Buffer does not belong to the arena'
+        self._free.put(buffer)
+    
+    
+    @contextmanager
+    def borrow(self, timeout: Optional[float] = None) -> Iterator[np.ndarray]:
+        buffer = self.acquire(timeout)
+        try:
+            yield buffer
+        finally:
+            self.release(buffer)
@@ -0,0 +1,46 @@
+import threading
+from collections import Counter
+from typing import Dict
+
+
+class Metrics:
+    """
+    Потокобезопасные счетчики событий адаптера, например отброшенных просроченных сообщений.
+    """
+    
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters = Counter()
+    
+    
+    def inc(self, name: str, value: int = 1) -> int:
+        """
+        Увеличить счетчик.
+
+        Args:
+            name (str): Название счетчика.
+            value (int, optional): На сколько увеличить. Defaults to 1.
+
+        Returns:
+            int: Новое значение счетчика.
+        """
+        with self._lock:
+            self._counters[name] += value
+            return self._counters[name]
+    
+    
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters[name]
+    
+    
+    def snapshot(self) -> Dict[str, int]:
+        """
+        Текущие значения всех счетчиков.
+        """
+        with self._lock:
+            return dict(self._counters)
+
+
+metrics = Metrics()
+""" Общие счетчики процесса адаптера. """
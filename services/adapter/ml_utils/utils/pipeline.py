@@ -0,0 +1,242 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from .. import logger
+
+
+class Stage:
+    """
+    Описание стадии StagedPipeline.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        workers: int = 1,
+        queue_size: Optional[int] = None,
+        batch_size: int = 1,
+        batch_timeout: float = 0.01,
+        processes: bool = False,
+        ordered: bool = False
+    ) -> None:
+        """
+        Args:
+            name (str): Название стадии, используется в логах и depths().
+            func (Callable): Функция стадии. Получает результат предыдущей стадии,
+                а если batch_size > 1 - список результатов, и возвращает список той же длины.
+            workers (int, optional): Сколько элементов стадия обрабатывает одновременно. Defaults to 1.
+            queue_size (int, optional): Размер входной очереди стадии. Если очередь заполнена,
+                предыдущая стадия ждет. Defaults to None (2 * workers * batch_size).
+            batch_size (int, optional): Максимальный размер батча. Defaults to 1.
+            batch_timeout (float, optional): Сколько ждать заполнения батча после первого элемента, сек.
+                Defaults to 0.01.
+            processes (bool, optional): Выполнять func в пуле из workers процессов.
+                func и данные должны сериализоваться pickle. Defaults to False.
+            ordered (bool, optional): Передавать результаты дальше в порядке поступления
+                элементов в конвейер, даже если workers > 1. Defaults to False.
+        """
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size or 2 * workers * batch_size
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.processes = processes
+        self.ordered = ordered
+
+
+class _Job:
+    
+    def __init__(self, seq: int, value: Any) -> None:
+        self.seq = seq
+        self.value = value
+        self.error: Optional[BaseException] = None
+        self.future = Future()
+
+
+_STOP = object()
+
+
+class StagedPipeline:
+    """
+    Конвейер из стадий, соединенных ограниченными очередями.
+    
+    У каждой стадии свои потоки (или процессы) и своя входная очередь. Заполненная очередь
+    останавливает предыдущую стадию, а заполненная первая - submit, поэтому в конвейере
+    никогда не больше элементов, чем помещается в очереди и обрабатывается стадиями.
+    Ошибка в стадии пропускает оставшиеся стадии элемента и возвращается из его Future.
+    
+    ```python
+        pipeline = StagedPipeline([
+            Stage('download', download, workers=4),
+            Stage('infer', infer, batch_size=8),
+            Stage('insert', insert, ordered=True),
+        ])
+        result = pipeline.submit(item).result()
+    ```
+    """
+    
+    def __init__(self, stages: List[Stage]) -> None:
+        assert stages, 'There are stages needed'
+        self.stages = stages
+        self._queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+        self._pools = [
+            ProcessPoolExecutor(max_workers=stage.workers) if stage.processes else None
+            for stage in stages
+        ]
+        self._reorder: List[Dict[int, _Job]] = [{} for _ in stages]
+        self._next_seq = [0 for _ in stages]
+        self._locks = [threading.Lock() for _ in stages]
+        self._seq = 0
+        self._submit_lock = threading.Lock()
+        self._threads: List[List[threading.Thread]] = []
+        for i, stage in enumerate(stages):
+            threads = [
+                threading.Thread(target=self._run, args=(i,), name=f'{stage.name}_{n}', daemon=True)
+                for n in range(stage.workers)
+            ]
+            for thread in threads:
+                thread.start()
+            self._threads.append(threads)
+        self._closed = False
+    
+    
+    def __enter__(self) -> 'StagedPipeline':
+        return self
+    
+    
+    def __exit__(self, *args) -> None:
+        self.close()
+    
+    
+    def submit(self, value: Any) -> Future:
+        """
+        Добавить элемент в конвейер. Ждет, если первая очередь заполнена.
+
+        Returns:
+            Future: Результат последней стадии.
+        """
+        assert not self._closed, 'Pipeline is closed'
+        # Номера нужны упорядоченным стадиям, поэтому в очередь элементы попадают в порядке номеров
+        with self._submit_lock:
+            job = _Job(self._seq, value)
+            self._seq += 1
+            self._queues[0].put(job)
+        return job.future
+    
+    
+    def map(self, values: Iterable[Any]) -> Iterator[Any]:
+        """
+        Обработать элементы, возвращая результаты в порядке входа.
+        Ошибка элемента выбрасывается при получении его результата.
+        """
+        futures = []
+        for value in values:
+            futures.append(self.submit(value))
+            while futures and futures[0].done():
+                yield futures.pop(0).result()
+        for future in futures:
+            yield future.result()
+    
+    
+    def depths(self) -> Dict[str, int]:
+        """
+        Сколько элементов ждет во входной очереди каждой стадии.
+        """
+        return {stage.name: q.qsize() for stage, q in zip(self.stages, self._queues)}
+    
+    
+    def close(self) -> None:
+        """
+        Дождаться обработки всех добавленных элементов и остановить стадии.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for i, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                self._queues[i].put(_STOP)
+            for thread in self._threads[i]:
+                thread.join()
+            if self._pools[i] is not None:
+                self._pools[i].shutdown()
+    
+    
+    def _run(self, i: int) -> None:
+        stage = self.stages[i]
+        while True:
+            jobs = self._take(i)
+            if not jobs:
+                return
+            
+            ready = [job for job in jobs if job.error is None]
+            if ready:
+                try:
+                    if stage.batch_size > 1:
+                        results = self._call(i, [job.value for job in ready])
+                        assert len(results) == len(ready), f'Stage {stage.name} returned {len(results)} results for {len(ready)} items'
+                    else:
+                        results = [self._call(i, ready[0].value)]
+                    for job, result in zip(ready, results):
+                        job.value = result
+                except Exception as e:
+                    logger.opt(exception=e).debug(f'Stage {stage.name} failed')
+                    for job in ready:
+                        job.error = e
+            
+            for job in jobs:
+                self._forward(i, job)
+    
+    
+    def _take(self, i: int) -> List[_Job]:
+        stage = self.stages[i]
+        job = self._queues[i].get()
+        if job is _STOP:
+            return []
+        jobs = [job]
+        deadline = time.monotonic() + stage.batch_timeout
+        while len(jobs) < stage.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                job = self._queues[i].get(timeout=timeout)
+            except queue.Empty:
+                break
+            if job is _STOP:
+                # Остальные элементы батча обработаются, а поток остановится на следующем круге
+                self._queues[i].put(_STOP)
+                break
+            jobs.append(job)
+        return jobs
+    
+    
+    def _call(self, i: int, value: Any) -> Any:
+        if self._pools[i] is not None:
+            return self._pools[i].submit(self.stages[i].func, value).result()
+        return self.stages[i].func(value)
+    
+    
+    def _forward(self, i: int, job: _Job) -> None:
+        if not self.stages[i].ordered:
+            self._emit(i, job)
+            return
+        # Результат ждет, пока не будут переданы все элементы с меньшими номерами
+        with self._locks[i]:
+            self._reorder[i][job.seq] = job
+            while self._next_seq[i] in self._reorder[i]:
+                self._emit(i, self._reorder[i].pop(self._next_seq[i]))
+                self._next_seq[i] += 1
+    
+    
+    def _emit(self, i: int, job: _Job) -> None:
+        if i + 1 < len(self.stages):
+            self._queues[i + 1].put(job)
+        elif job.error is not None:
+            job.future.set_exception(job.error)
+        else:
+            job.future.set_result(job.value)
@@ -0,0 +1,179 @@
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .. import logger
+
+
+class SharedClipRing:
+    """
+    Кольцо заранее выделенных слотов под клипы в разделяемой памяти.
+    
+    Процесс-декодер берет свободный слот (acquire), пишет в него кадры и передает дальше
+    только номер слота (handoff). Процесс-владелец кольца читает слот как NumPy view без копирования
+    и освобождает его (release). Для каждого слота в разделяемой памяти хранится pid процесса,
+    который им владеет, поэтому слоты упавших процессов можно вернуть в кольцо (reclaim).
+    
+    Кольцо передается в процессы пула через initargs (pickle передает только имя памяти),
+    создатель кольца должен вызвать close(), чтобы память была удалена.
+    """
+    
+    def __init__(
+        self,
+        slots: int,
+        shape: Tuple[int, ...] = (8, 3, 224, 224),
+        dtype: str = 'float32',
+        name: Optional[str] = None
+    ) -> None:
+        """
+        Args:
+            slots (int): Количество слотов.
+            shape (Tuple[int, ...], optional): Форма клипа. Defaults to (8, 3, 224, 224).
+            dtype (str, optional): Тип данных клипа. Defaults to 'float32'.
+            name (str, optional): Имя разделяемой памяти. Defaults to None (сгенерировать).
+        """
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner_pid = os.getpid()
+        self._lock = multiprocessing.Lock()
+        
+        self._slot_size = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._header_size = -(-slots * 8 // 64) * 64 # pid владельцев слотов, выровнено по 64 байта
+        self._shm = shared_memory.SharedMemory(
+            name=name,
+            create=True,
+            size=self._header_size + slots * self._slot_size
+        )
+        self._attach()
+        self._owners[:] = 0
+    
+    
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['_shm'] = self._shm.name
+        del state['_owners'], state['_clips']
+        return state
+    
+    
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._shm = shared_memory.SharedMemory(name=state['_shm'])
+        self._attach()
+    
+    
+    def _attach(self) -> None:
+        self._owners = np.ndarray((self.slots,), dtype=np.int64, buffer=self._shm.buf)
+        self._clips = np.ndarray(
+            (self.slots, *self.shape),
+            dtype=self.dtype,
+            buffer=self._shm.buf,
+            offset=self._header_size
+        )
+    
+    
+    @property
+    def free(self) -> int:
+        """ Сколько слотов свободно. """
+        return int(np.count_nonzero(self._owners == 0))
+    
+    
+    def view(self, slot: int) -> np.ndarray:
+        """
+        Клип слота без копирования. View действителен, пока слот не освобожден.
+        """
+        return self._clips[slot]
+    
+    
+    def acquire(self, timeout: Optional[float] = None) -> int:
+        """
+        Занять свободный слот текущим процессом. Если свободных нет, возвращает в кольцо
+        слоты завершившихся процессов и ждет освобождения.
+
+        Args:
+            timeout (float, optional): Сколько ждать свободный слот, сек. Defaults to None (без ограничения).
+
+        Raises:
+            TimeoutError: Свободный слот не появился за timeout.
+
+        Returns:
+            int: Номер слота.
+        """
+        start = time.monotonic()
+        reclaimed = False
+        while True:
+            with self._lock:
+                free = np.flatnonzero(self._owners == 0)
+                if len(free):
+                    slot = int(free[0])
+                    self._owners[slot] = os.getpid()
+                    return slot
+            if not reclaimed:
+                reclaimed = self.reclaim() > 0
+                if reclaimed:
+                    continue
+            if timeout is not None and time.monotonic() - start > timeout:
+                raise TimeoutError(f'There is no free slot in {self.slots} slots')
+            time.sleep(0.001)
+    
+    
+    def handoff(self, slot: int) -> None:
+        """
+        Передать заполненный слот процессу-владельцу кольца, чтобы слот не был освобожден
+        при завершении процесса-декодера.
+        """
+        with self._lock:
+            self._owners[slot] = self.owner_pid
+    
+    
+    def release(self, slot: int) -> None:
+        with self._lock:
+            self._owners[slot] = 0
+    
+    
+    def reclaim(self) -> int:
+        """
+        Освободить слоты, которыми владеют уже завершившиеся процессы.
+
+        Returns:
+            int: Сколько слотов освобождено.
+        """
+        with self._lock:
+            reclaimed = 0
+            for pid in set(self._owners[self._owners != 0].tolist()):
+                if not _is_alive(pid):
+                    dead = self._owners == pid
+                    reclaimed += int(np.count_nonzero(dead))
+                    self._owners[dead] = 0
+        if reclaimed:
+            logger.warning(f'{reclaimed} slots of finished processes have been reclaimed')
+        return reclaimed
+    
+    
+    def close(self) -> None:
+        """
+        Отключиться от разделяемой памяти. В процессе-владельце память удаляется.
+        """
+        self._owners = self._clips = None
+        self._shm.close()
+        if os.getpid() == self.owner_pid:
+            self._shm.unlink()
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    # Завершившийся, но не дождавшийся wait дочерний процесс еще существует
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().split(') ')[-1][0] != 'Z'
+    except OSError:
+        return True
@@ -0,0 +1,253 @@
+import ctypes
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from typing import Callable, Iterable, Mapping, Optional
+
+from loguru import logger
+
+from .metrics import metrics
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+    threadpool_limits = None
+
+# Переменные окружения, которыми ограничиваются пулы потоков BLAS/OpenMP в процессах, запущенных воркером
+THREAD_ENV = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+PR_SET_PDEATHSIG = 1
+
+
+class TooManyRestartsError(Exception):
+    """
+    Ошибка, которая вызывается, если воркер падает больше max_restarts раз подряд.
+    """
+    pass
+
+
+class WorkerSupervisor:
+    """
+    Запуск N процессов-воркеров из одного родителя и их перезапуск при падении,
+    по аналогии с FlowController из ultra_backend.
+    
+    Процессы создаются через fork, поэтому все, что родитель загрузил до run() (например AudioStore
+    и AudioIndex), доступно воркерам без копирования, пока они это не изменяют (copy-on-write).
+    Соединения, потоки и пулы процессов нужно создавать уже в воркере: после fork они не работают.
+    
+    Упавший воркер перезапускается через backoff, 2 * backoff, ... но не дольше max_backoff секунд.
+    Если воркер проработал дольше stable_time, задержка сбрасывается.
+    
+    Каждому воркеру выделяется свой набор ядер (sched_setaffinity), а пулы потоков OpenCV и BLAS
+    ограничиваются его размером, чтобы N воркеров не запускали по cpu_count потоков каждый.
+    """
+    
+    poll_interval = 0.5
+    """ Как часто проверяется состояние воркеров, сек. """
+    
+    def __init__(
+        self,
+        target: Callable,
+        args: Iterable = None,
+        kwargs: Mapping = None,
+        workers: int = 2,
+        threads_per_worker: Optional[int] = None,
+        pin_cpus: bool = True,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        stable_time: float = 60.0,
+        max_restarts: int = 10,
+        name: str = 'worker'
+    ) -> None:
+        """
+        Args:
+            target (Callable): Функция воркера, выполняется в каждом процессе.
+            args (Iterable, optional): Аргументы функции. Defaults to None.
+            kwargs (Mapping, optional): Ключевые аргументы функции. Defaults to None.
+            workers (int, optional): Количество процессов. Defaults to 2.
+            threads_per_worker (int, optional): Потоков OpenCV и BLAS на воркер.
+                По умолчанию ядра делятся между воркерами поровну. Defaults to None.
+            pin_cpus (bool, optional): Закреплять ли воркеры за своими ядрами. Defaults to True.
+            backoff (float, optional): Задержка перед первым перезапуском, сек. Defaults to 1.0.
+            max_backoff (float, optional): Максимальная задержка перезапуска, сек. Defaults to 60.0.
+            stable_time (float, optional): Сколько секунд должен проработать воркер,
+                чтобы падение не считалось повторным. Defaults to 60.0.
+            max_restarts (int, optional): Сколько раз подряд можно перезапустить воркер,
+                0 - без ограничения. Defaults to 10.
+            name (str, optional): Имя процессов в логах. Defaults to 'worker'.
+        """
+        self.target = target
+        self.args = tuple(args or ())
+        self.kwargs = dict(kwargs or {})
+        self.workers = workers
+        self.pin_cpus = pin_cpus
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stable_time = stable_time
+        self.max_restarts = max_restarts
+        self.name = name
+        
+        self.cpus = sorted(os.sched_getaffinity(0))
+        self.threads_per_worker = threads_per_worker or max(1, len(self.cpus) // workers)
+        
+        self.error: Optional[Exception] = None
+        self._context = multiprocessing.get_context('fork')
+        self._processes: list[Optional[multiprocessing.Process]] = [None] * workers
+        self._started = [0.0] * workers
+        self._failures = [0] * workers
+        self._restart_at = [0.0] * workers
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._run_thread: Optional[threading.Thread] = None
+    
+    
+    @property
+    def pids(self) -> list[Optional[int]]:
+        """ pid работающих воркеров, None - воркер ждет перезапуска. """
+        return [process.pid if process is not None else None for process in self._processes]
+    
+    
+    def worker_cpus(self, index: int) -> list[int]:
+        """
+        Ядра воркера index. Если ядер меньше, чем воркеров, воркеры делят все ядра.
+        """
+        size = len(self.cpus) // self.workers
+        if not self.pin_cpus or size == 0:
+            return self.cpus
+        return self.cpus[index * size:(index + 1) * size]
+    
+    
+    def run(self, block: bool = True) -> None:
+        """
+        Запуск воркеров и потока, который следит за ними.
+
+        Args:
+            block (bool, optional): Ждать ли остановки supervisor. Defaults to True.
+        """
+        for index in range(self.workers):
+            self._spawn(index)
+        self._run_thread = threading.Thread(target=self._loop_check, name='supervisor', daemon=True)
+        self._run_thread.start()
+        if block:
+            self.join()
+    
+    
+    def join(self) -> None:
+        """
+        Ожидание остановки supervisor.
+
+        Raises:
+            TooManyRestartsError: Если воркер упал больше max_restarts раз подряд.
+        """
+        while self._run_thread.is_alive():
+            self._run_thread.join(1)
+        if self.error is not None:
+            raise self.error
+    
+    
+    def stop(self, timeout: float = 10) -> None:
+        """
+        Остановка воркеров: SIGTERM (в воркере - KeyboardInterrupt), а через timeout секунд SIGKILL.
+        """
+        self._stopping.set()
+        # После захвата lock поток проверки уже не запустит новых воркеров
+        with self._lock:
+            for process in self._processes:
+                if process is not None and process.is_alive():
+                    process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            if process is not None:
+                process.join(max(0, deadline - time.monotonic()))
+                if process.is_alive():
+                    logger.warning(f'Worker {process.name} has not stopped in {timeout}s, killing it')
+                    process.kill()
+                    process.join()
+    
+    
+    def _loop_check(self) -> None:
+        try:
+            while not self._stopping.wait(self.poll_interval):
+                with self._lock:
+                    if self._stopping.is_set():
+                        break
+                    for index in range(self.workers):
+                        self._check(index)
+        except Exception as e:
+            logger.error(f'{e}')
+            self.error = e
+            self.stop()
+    
+    
+    def _check(self, index: int) -> None:
+        process = self._processes[index]
+        now = time.monotonic()
+        if process is None:
+            if now >= self._restart_at[index]:
+                self._spawn(index)
+            return
+        if process.is_alive():
+            return
+        
+        process.join()
+        self._processes[index] = None
+        uptime = now - self._started[index]
+        self._failures[index] = 1 if uptime >= self.stable_time else self._failures[index] + 1
+        if self.max_restarts and self._failures[index] > self.max_restarts:
+            raise TooManyRestartsError(f'Worker {process.name} has failed {self._failures[index]} times in a row')
+        
+        delay = min(self.backoff * 2 ** (self._failures[index] - 1), self.max_backoff)
+        self._restart_at[index] = now + delay
+        restarts = metrics.inc('worker_restarts')
+        logger.warning(
+            f'Worker {process.name} exited with code {process.exitcode} after {uptime:.1f}s, '
+            f'restart in {delay:.1f}s ({restarts} restarts in total)'
+        )
+    
+    
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=self._bootstrap,
+            args=(index,),
+            name=f'{self.name}-{index}'
+        )
+        process.start()
+        self._processes[index] = process
+        self._started[index] = time.monotonic()
+        logger.info(f'Worker {process.name} started with pid {process.pid} on cpus {self.worker_cpus(index)}')
+    
+    
+    def _bootstrap(self, index: int) -> None:
+        # Обработчики сигналов родителя наследуются при fork. SIGTERM из stop() поднимает в воркере
+        # KeyboardInterrupt, чтобы отработали его finally (например, запись буфера вставки в Milvus)
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        try:
+            # Воркер получит SIGTERM, если родитель умрет, не остановив его
+            ctypes.CDLL(None).prctl(PR_SET_PDEATHSIG, signal.SIGTERM)
+        except Exception:
+            pass
+        self._pin_threads(index)
+        try:
+            self.target(*self.args, **self.kwargs)
+        except KeyboardInterrupt:
+            pass
+    
+    
+    def _pin_threads(self, index: int) -> None:
+        if self.pin_cpus:
+            os.sched_setaffinity(0, self.worker_cpus(index))
+        
+        threads = self.threads_per_worker
+        for name in THREAD_ENV:
+            os.environ[name] = str(threads)
+        # Пулы BLAS и OpenCV, созданные в родителе до fork, переменные окружения уже не меняют
+        if threadpool_limits is not None:
+            threadpool_limits(threads)
+        try:
+            import cv2
+            cv2.setNumThreads(threads)
+        except ImportError:
+            pass
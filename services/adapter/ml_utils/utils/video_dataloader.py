@@ -10,16 +10,41 @@ class VideoDataloader:
         self, 
         video: Union[Path, str],
         transforms: Optional[Callable] = None,
+        out: Optional[np.ndarray] = None,
     ) -> None:
+        """
+        Args:
+            video (Union[Path, str]): Путь к видео
+            transforms (Optional[Callable], optional): Препроцессинг кадра. Defaults to None.
+            out (Optional[np.ndarray], optional): Заранее выделенный буфер на 8 кадров.
+                Кадры пишутся в него на месте вызовом transforms(frame, out=out[i]),
+                и итератор отдает срез буфера вместо нового массива. Defaults to None.
+        """
         self.video = video
         self.transforms = transforms
+        self.out = out
         
         self.cap = cv2.VideoCapture(video)
         self.fps = self.cap.get(cv2.CAP_PROP_FPS)
         self.length = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         
         self.need_indexes = np.floor(np.linspace(0, self.length - 1, 8))
     
+    @property
+    def metadata(self) -> dict:
+        """
+        Метаданные видео: длительность (сек), fps, разрешение и соотношение сторон.
+        """
+        return {
+            'duration': self.length / self.fps if self.fps > 0 else 0.0,
+            'fps': float(self.fps),
+            'width': self.width,
+            'height': self.height,
+            'aspect_ratio': self.width / self.height if self.height > 0 else 0.0
+        }
+    
     def _read_frames(self) -> None:
         # Добираем кадры до нужного количества или пока не дойдем до конца
         while self.success:
@@ -32,7 +57,14 @@ class VideoDataloader:
                         continue
                     
                     frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    if self.transforms:
+                    if self.out is not None:
+                        dst = self.out[len(self.frames)]
+                        if self.transforms:
+                            self.transforms(frame, out=dst)
+                        else:
+                            dst[...] = frame
+                        frame = dst
+                    elif self.transforms:
                         frame = self.transforms(frame)
                     self.frames.append(frame)
                 else:
@@ -53,6 +85,8 @@ class VideoDataloader:
     def __next__(self) -> np.ndarray:
         if self._is_video_opened():
             self._read_frames()
+            if self.out is not None:
+                return self.out[:len(self.frames)]
             return np.stack(self.frames)
         
         self.cap.release()
@@ -10,7 +10,7 @@ if __name__ == '__main__':
     root = Path('/home/borntowarn/projects/borntowarn/train_data_yappy/train_dataset')
     
     videos = open('train.txt').readlines()
-    videos = [{'video_link': str(root / f"{i.strip()}.mp4")} for i in videos]
+    videos = [{'video_link': str(root / f"{i.strip()}.mp4"), 'priority': 'bulk'} for i in videos]
     
     broker = RabbitWrapper(
         '../../configs/resources.ini',
@@ -18,5 +18,6 @@ if __name__ == '__main__':
         swap_topics=True
     )
     
-    broker.publish(videos)
+    # Массовая загрузка идет в отдельную очередь, чтобы не задерживать интерактивные запросы
+    broker.publish(videos, topic=broker.bulk_input_topic)
     logger.success(f'Published {len(videos)} videos')
\ No newline at end of file
@@ -0,0 +1,63 @@
+import albumentations as A
+import numpy as np
+from ml_utils import VideoDataloader
+from ml_utils.utils.shared_ring import SharedClipRing
+
+_resize = A.Compose([
+    A.SmallestMaxSize(224),
+    A.CenterCrop(224, 224)
+])
+_compose = A.Compose([
+    _resize,
+    A.Normalize((0.5, 0.5, 0.5), (0.5, 0.5, 0.5))
+])
+
+_ring: SharedClipRing | None = None
+
+
+def transform(frame: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    Препроцессинг кадра для TimeSformer. Функция модуля, чтобы ее можно было передать в процессы.
+    Если передан out формы (3, 224, 224), нормализованный кадр пишется в него сразу в порядке каналов
+    модели, без промежуточных float массивов.
+    """
+    if out is None:
+        return _compose(image=frame)['image']
+    
+    crop = _resize(image=frame)['image']
+    # То же, что A.Normalize(0.5, 0.5): (x / 255 - 0.5) / 0.5 = x / 127.5 - 1
+    np.multiply(crop.transpose(2, 0, 1), np.float32(1 / 127.5), out=out, dtype=np.float32)
+    out -= 1
+    return out
+
+
+def init_decoder(ring: SharedClipRing) -> None:
+    """
+    Инициализатор процесса-декодера: подключение к кольцу слотов в разделяемой памяти.
+    """
+    global _ring
+    _ring = ring
+
+
+def decode_clip(video_path: str) -> tuple[int, int, dict]:
+    """
+    Функция для декодирования первого клипа видео в процессе-декодере.
+    Кадры пишутся в свободный слот кольца, в родительский процесс возвращается только номер слота.
+
+    Returns:
+        tuple: 3 значения - номер слота, количество кадров и метаданные видео
+    """
+    slot = _ring.acquire()
+    try:
+        # Кадры декодируются сразу в слот, без промежуточного батча
+        dataloader = VideoDataloader(video_path, transforms=transform, out=_ring.view(slot))
+        for batch in dataloader:
+            if len(batch):
+                break
+        else:
+            raise ValueError(f'There are no frames in {video_path}')
+        _ring.handoff(slot)
+    except:
+        _ring.release(slot)
+        raise
+    return slot, len(batch), dataloader.metadata
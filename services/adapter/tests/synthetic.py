@@ -0,0 +1,105 @@
+import os
+import subprocess
+import wave
+from pathlib import Path
+
+import numpy as np
+
+
+SAMPLE_RATE = 11025
+
+
+def tones(freqs, duration, sr=SAMPLE_RATE, seed=0):
+    """
+    Последовательность нот: каждые 0.25 секунды звучит аккорд из случайных частот `freqs`.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sr)) / sr
+    signal = np.zeros_like(t)
+    step = int(0.25 * sr)
+    for start in range(0, len(t), step):
+        chord = rng.choice(freqs, size=3, replace=False)
+        part = slice(start, start + step)
+        signal[part] = sum(np.sin(2 * np.pi * f * t[part]) for f in chord)
+    return signal / np.abs(signal).max()
+
+
+def chirp(f0, f1, duration, sr=SAMPLE_RATE):
+    """
+    Линейно-частотно модулированный сигнал от f0 до f1 Гц.
+    """
+    t = np.arange(int(duration * sr)) / sr
+    return np.sin(2 * np.pi * (f0 * t + (f1 - f0) / (2 * duration) * t ** 2))
+
+
+def noise(duration, sr=SAMPLE_RATE, seed=0):
+    """
+    Белый шум с амплитудой 1.
+    """
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-1, 1, int(duration * sr))
+
+
+def track(duration, sr=SAMPLE_RATE, seed=0):
+    """
+    Синтетический "музыкальный" трек: ноты, свип и немного шума.
+    """
+    freqs = np.linspace(200, 3500, 40)
+    signal = tones(freqs, duration, sr, seed) + 0.3 * chirp(300, 3000, duration, sr) + 0.05 * noise(duration, sr, seed)
+    return signal / np.abs(signal).max()
+
+
+def write_wav(path, signal, sr=SAMPLE_RATE):
+    """
+    Запись моно сигнала в диапазоне [-1, 1] в 16-битный WAV.
+    """
+    pcm = (np.clip(signal, -1, 1) * 32000).astype('<i2')
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes(pcm.tobytes())
+    return path
+
+
+def shift(signal, seconds, sr=SAMPLE_RATE):
+    """
+    Сигнал без первых `seconds` секунд (отрицательный сдвиг добавляет тишину в начало).
+    """
+    n = int(abs(seconds) * sr)
+    if seconds >= 0:
+        return signal[n:]
+    return np.concatenate([np.zeros(n), signal])
+
+
+def gain(signal, db):
+    """
+    Изменение громкости на `db` децибел.
+    """
+    return signal * 10 ** (db / 20)
+
+
+def mix(signal, other, ratio=0.5):
+    """
+    Смесь двух сигналов, `ratio` - доля второго.
+    """
+    n = min(len(signal), len(other))
+    return (1 - ratio) * signal[:n] + ratio * other[:n]
+
+
+def write_mp4(path, signal, sr=SAMPLE_RATE):
+    """
+    Запись сигнала звуковой дорожкой AAC в MP4 с черным видеорядом через ffmpeg.
+    """
+    wav_path = Path(path).with_suffix('.wav')
+    write_wav(wav_path, signal, sr)
+    subprocess.run(
+        [
+            os.environ.get('FFMPEG_BINARY', 'ffmpeg'), '-nostdin', '-v', 'error', '-y',
+            '-f', 'lavfi', '-i', 'color=c=black:s=64x64:r=5',
+            '-i', str(wav_path), '-shortest', '-c:v', 'libx264', '-c:a', 'aac', str(path)
+        ],
+        check=True
+    )
+    os.remove(wav_path)
+    return path
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from unittest import TestCase, skipUnless
+
+from ..ml_utils.brokers.base import AsyncBaseWrapper, BULK
+
+try:
+    from ..ml_utils.brokers.rabbit.async_wrapper import AsyncRabbitWrapper
+except ImportError:
+    AsyncRabbitWrapper = None
+
+
+class DummyWrapper(AsyncBaseWrapper):
+    _load_config = _create_topic = _create_answer = publish = listen = lambda self: None
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class TestAsyncBaseWrapper(TestCase):
+
+    def setUp(self):
+        self.wrapper = DummyWrapper()
+
+    def process(self, pipeline, **payload):
+        return asyncio.run(self.wrapper._process_item(pipeline, **payload))
+
+    def test_items_are_processed_concurrently(self):
+        async def pipeline(video_link):
+            await asyncio.sleep(0.2)
+            return {'video_link': video_link}
+
+        async def run():
+            return await asyncio.gather(*(
+                self.wrapper._process_item(pipeline, video_link=str(i)) for i in range(10)
+            ))
+
+        start = time.time()
+        results = asyncio.run(run())
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual([result for result, _ in results], [{'video_link': str(i)} for i in range(10)])
+
+    def test_errors_give_empty_result(self):
+        async def pipeline(video_link):
+            raise ValueError(video_link)
+
+        self.assertEqual(self.process(pipeline, video_link='a'), (None, None))
+
+    def test_expired_items(self):
+        async def pipeline(**payload):
+            return payload
+
+        deadline = time.time() - 1
+        result, _ = self.process(pipeline, video_link='a', deadline=deadline)
+        self.assertEqual(result, {'video_link': 'a', 'expired': True})
+
+        self.wrapper.expired_policy = 'bulk'
+        result, _ = self.process(pipeline, video_link='a', deadline=deadline, priority=BULK)
+        self.assertEqual(result, {'video_link': 'a', 'priority': BULK})
+
+
+class FakeMessage:
+
+    def __init__(self):
+        self.acked = False
+
+    async def ack(self):
+        self.acked = True
+
+
+@skipUnless(AsyncRabbitWrapper, 'aio_pika is not installed')
+class TestAsyncRabbitHandle(TestCase):
+
+    def setUp(self):
+        self.wrapper = AsyncRabbitWrapper.__new__(AsyncRabbitWrapper)
+        self.wrapper.output_topic = 'output'
+        self.published = []
+
+        async def publish(result, time, payload):
+            self.published.append(result)
+
+        self.wrapper.publish = publish
+
+    def test_error_outside_pipeline_is_answered(self):
+        """
+        Исключение из _process_item не оставляет сообщение без ответа и ack
+        """
+        async def process_item(pipeline, **payload):
+            raise ValueError('Unexpected payload')
+
+        self.wrapper._process_item = process_item
+        message = FakeMessage()
+        asyncio.run(self.wrapper._handle(None, message, {'video_link': 'a'}))
+        self.assertEqual(self.published, [None])
+        self.assertTrue(message.acked)
+
+    def test_malformed_deadline(self):
+        async def pipeline(**payload):
+            return payload
+
+        message = FakeMessage()
+        asyncio.run(self.wrapper._handle(pipeline, message, {'video_link': 'a', 'deadline': 'soon'}))
+        self.assertEqual(self.published, [{'video_link': 'a'}])
+        self.assertTrue(message.acked)
@@ -0,0 +1,76 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from ..audio_fingerprint import shazam
+from ..audio_fingerprint.decode import read_audio
+from ..audio_fingerprint.index import AudioIndex
+from . import synthetic
+
+
+class TestSimilarityInvariants(TestCase):
+    """
+    Свойства сравнения отпечатков, которые должны сохраняться при оптимизациях
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        original = synthetic.track(40, seed=0)
+        signals = {
+            'original': original,
+            'shifted': synthetic.shift(original, 7.3),
+            'delayed': synthetic.shift(original, -2.1),
+            'quiet': synthetic.gain(original, -12),
+            'mixed': synthetic.mix(original, synthetic.noise(40, seed=5), 0.3),
+            'unrelated': synthetic.track(40, seed=1),
+            'chirp': synthetic.chirp(200, 4000, 40),
+        }
+        cls.fingerprints = {
+            name: cls.fingerprint(synthetic.write_wav(Path(cls.tmp.name) / f'{name}.wav', signal))
+            for name, signal in signals.items()
+        }
+        cls.fingerprints['mp4'] = cls.fingerprint(
+            synthetic.write_mp4(Path(cls.tmp.name) / 'original_video.mp4', original)
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    @staticmethod
+    def fingerprint(path):
+        return shazam.fingerprint_file(str(path))
+
+    def score(self, name, other='original'):
+        return shazam.compare_fingerprints(self.fingerprints[other], self.fingerprints[name])
+
+    def test_identical(self):
+        self.assertEqual(self.score('original'), 1.0)
+
+    def test_gain_does_not_change_fingerprint(self):
+        self.assertGreater(self.score('quiet'), 0.9)
+
+    def test_modified_copies_score_higher_than_unrelated(self):
+        unrelated = max(self.score('unrelated'), self.score('chirp'))
+        for name in ['shifted', 'delayed', 'mixed', 'mp4']:
+            with self.subTest(name=name):
+                self.assertGreater(self.score(name), unrelated)
+
+    def test_scores_are_symmetric(self):
+        self.assertAlmostEqual(self.score('shifted'), self.score('original', 'shifted'))
+
+    def test_index_finds_modified_copies(self):
+        index = AudioIndex.from_store({
+            name: self.fingerprints[name] for name in ['original', 'unrelated', 'chirp']
+        })
+        for name in ['shifted', 'delayed', 'mixed', 'mp4']:
+            with self.subTest(name=name):
+                self.assertEqual(index.search(self.fingerprints[name], limit=1)[0][0], 'original')
+
+    def test_mp4_decodes_like_wav(self):
+        wav = read_audio(Path(self.tmp.name) / 'original.wav')
+        mp4 = read_audio(Path(self.tmp.name) / 'original_video.mp4')
+        self.assertAlmostEqual(len(mp4) / len(wav), 1.0, delta=0.01)
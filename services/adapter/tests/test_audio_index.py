@@ -0,0 +1,79 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from ..audio_fingerprint import shazam
+from ..audio_fingerprint.index import AudioIndex
+from . import synthetic
+
+
+def fingerprint(signal, tmp, name):
+    return shazam.fingerprint_file(str(synthetic.write_wav(Path(tmp) / f'{name}.wav', signal)))
+
+
+class TestAudioIndex(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as tmp:
+            cls.tracks = {f'video_{n}': synthetic.track(30, seed=n) for n in range(5)}
+            cls.store = {}
+            for video_id, signal in cls.tracks.items():
+                cls.store[video_id] = fingerprint(signal, tmp, video_id)
+            # Фрагмент video_2, начинающийся с 10-го кадра спектрограммы
+            start = 10 * 1930
+            cls.query = fingerprint(cls.tracks['video_2'][start:start + 15 * synthetic.SAMPLE_RATE], tmp, 'query')
+
+    def test_finds_excerpt(self):
+        index = AudioIndex.from_store(self.store)
+        result = index.search(self.query, min_matches=1)
+        self.assertEqual(result[0][0], 'video_2')
+        self.assertGreater(result[0][1], 5 * max([0] + [m for _, m in result[1:]]))
+
+    def test_added_videos_are_searchable(self):
+        """
+        Видео из дельта-сегмента и после слияния сегментов находятся так же, как из основного
+        """
+        for merge_size in [10 ** 9, 1]:
+            index = AudioIndex(merge_size=merge_size)
+            for video_id, fp in self.store.items():
+                index.add(video_id, fp)
+            self.assertEqual(index.search(self.query, limit=1), AudioIndex.from_store(self.store).search(self.query, limit=1))
+
+    def test_min_matches(self):
+        index = AudioIndex.from_store(self.store)
+        self.assertEqual(index.search(self.query, min_matches=10 ** 6), [])
+        self.assertEqual(index.search(shazam.Fingerprint()), [])
+
+
+class TestAudioIndexSync(TestCase):
+    def test_workers_see_each_other_through_shared_store(self):
+        """
+        Два воркера с общим хранилищем: видео, вставленное одним, находится поиском другого
+        """
+        from ..audio_fingerprint import sh_opt
+        from ..audio_fingerprint.store import AudioStore
+
+        def make(seed):
+            return shazam.Fingerprint(np.arange(seed, seed + 50), np.arange(50) * sh_opt.HASH_DT_STEP)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'audio_store'
+            parent_store = AudioStore(path)
+            parent_store['old'] = make(0)
+            parent_index = AudioIndex.from_store(parent_store)
+            # После fork у каждого воркера свой экземпляр поверх тех же файлов
+            workers = [(AudioStore(path), parent_index), (AudioStore(path), AudioIndex.from_store(parent_store))]
+
+            (store_1, index_1), (store_2, index_2) = workers
+            store_1['first'] = make(1000)
+            index_1.sync(store_1)
+            store_2['second'] = make(2000)
+            index_2.sync(store_2)
+
+            self.assertEqual(index_2.search(make(1000), limit=1)[0][0], 'first')
+            index_1.sync(store_1)
+            self.assertEqual(index_1.search(make(2000), limit=1)[0][0], 'second')
+            self.assertEqual(len(index_1), 3)
+            self.assertEqual(len(index_2), 3)
@@ -0,0 +1,131 @@
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from ..audio_fingerprint.shazam import Fingerprint
+from ..audio_fingerprint.store import AudioStore
+
+
+class TestAudioStore(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / 'audio_store'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append_reopen(self):
+        store = AudioStore(self.path)
+        store['a'] = Fingerprint([3, 1, 2], [0.5, 0.1, 0.2])
+        store['b'] = Fingerprint()
+        store['c'] = Fingerprint([1, 1, 2], [0.1, 0.3, 0.2])
+        reopened = AudioStore(self.path, readonly=True)
+
+        self.assertEqual(sorted(reopened.keys()), ['a', 'b', 'c'])
+        np.testing.assert_array_equal(reopened['a'].hashes, [3, 1, 2])
+        np.testing.assert_allclose(reopened['a'].times, [0.5, 0.1, 0.2])
+        self.assertEqual(reopened['a'].hashes.dtype, np.uint32)
+        self.assertEqual(len(reopened['b']), 0)
+        np.testing.assert_array_equal(reopened['c'].unique, [1, 2])
+
+    def test_truncated_tail_is_ignored(self):
+        """
+        Оборванная при сбое запись не читается и обрезается следующим писателем
+        """
+        store = AudioStore(self.path)
+        store['a'] = Fingerprint([1, 2], [0.1, 0.2])
+        with open(self.path / AudioStore.HASHES, 'ab') as f:
+            f.write(np.array([7, 7, 7], '<u4').tobytes())
+        with open(self.path / AudioStore.ENTRIES, 'ab') as f:
+            f.write(b'b\t2\t3\t2\t1\nc\t5\t1\t3\t1')
+
+        reader = AudioStore(self.path, readonly=True)
+        self.assertEqual(list(reader.keys()), ['a'])
+
+        writer = AudioStore(self.path)
+        writer['d'] = Fingerprint([9], [0.9])
+        self.assertEqual(os.path.getsize(self.path / AudioStore.HASHES), 3 * 4)
+        self.assertEqual(list(AudioStore(self.path, readonly=True).keys()), ['a', 'd'])
+        np.testing.assert_array_equal(writer['d'].hashes, [9])
+
+    def test_upgrade_of_store_without_unique_hashes(self):
+        """
+        Хранилище со строками "video_id, offset, length" обновляется, а не обрезается
+        """
+        os.makedirs(self.path)
+        hashes = np.array([3, 1, 3, 2, 5, 5], '<u4')
+        (self.path / AudioStore.HASHES).write_bytes(hashes.tobytes())
+        (self.path / AudioStore.TIMES).write_bytes(np.arange(6, dtype='<f4').tobytes())
+        (self.path / AudioStore.ENTRIES).write_bytes(b'a\t0\t4\nb\t4\t0\nc\t4\t2\n')
+
+        with self.assertRaises(ValueError):
+            AudioStore(self.path, readonly=True)
+
+        store = AudioStore(self.path)
+        self.assertEqual(sorted(store.keys()), ['a', 'b', 'c'])
+        self.assertEqual(os.path.getsize(self.path / AudioStore.HASHES), 6 * 4)
+        np.testing.assert_array_equal(store['a'].hashes, [3, 1, 3, 2])
+        np.testing.assert_array_equal(store['a'].unique, [1, 2, 3])
+        np.testing.assert_array_equal(store['c'].unique, [5])
+        self.assertEqual(len(store['b']), 0)
+
+        store['d'] = Fingerprint([7], [0.7])
+        reopened = AudioStore(self.path, readonly=True)
+        self.assertEqual(sorted(reopened.keys()), ['a', 'b', 'c', 'd'])
+        np.testing.assert_array_equal(reopened['a'].unique, [1, 2, 3])
+        np.testing.assert_array_equal(reopened['d'].hashes, [7])
+
+    def test_invalid_entry_is_not_truncated(self):
+        store = AudioStore(self.path)
+        store['a'] = Fingerprint([1, 2], [0.1, 0.2])
+        with open(self.path / AudioStore.ENTRIES, 'ab') as f:
+            f.write(b'garbage\n')
+        size = os.path.getsize(self.path / AudioStore.ENTRIES)
+
+        with self.assertRaises(ValueError):
+            AudioStore(self.path)
+        self.assertEqual(os.path.getsize(self.path / AudioStore.ENTRIES), size)
+        self.assertEqual(os.path.getsize(self.path / AudioStore.HASHES), 2 * 4)
+
+    def test_reader_refresh(self):
+        writer = AudioStore(self.path)
+        reader = AudioStore(self.path, readonly=True)
+        writer['a'] = Fingerprint([1], [0.1])
+        self.assertNotIn('a', reader)
+        reader.refresh()
+        np.testing.assert_array_equal(reader['a'].hashes, [1])
+
+    def test_migrate_legacy_pickle(self):
+        """
+        Старый pickle пересчитывается по видео, недоступные видео получают пустой отпечаток
+        """
+        legacy = {'with_audio': [(123, 0.1, 0.2)], 'without_audio': (), 'missing': [(456, 0.1, 0.2)]}
+
+        def fingerprint(path):
+            if Path(path).stem == 'missing':
+                raise FileNotFoundError(path)
+            return Fingerprint([7], [0.1])
+
+        with open(self.path.with_suffix('.pkl'), 'wb') as f:
+            pickle.dump(legacy, f)
+        AudioStore.migrate(self.path.with_suffix('.pkl'), self.tmp.name, self.path, fingerprint=fingerprint)
+        reopened = AudioStore(self.path, readonly=True)
+
+        self.assertEqual(reopened['with_audio'].hashes.tolist(), [7])
+        self.assertEqual(len(reopened['without_audio']), 0)
+        self.assertEqual(len(reopened['missing']), 0)
+        self.assertTrue((self.path / AudioStore.MIGRATED).exists())
+
+    def test_open_does_not_migrate(self):
+        """
+        Миграция не запускается при открытии хранилища, ее делает scripts/migrate_audio_store.py
+        """
+        with open(self.path.with_suffix('.pkl'), 'wb') as f:
+            pickle.dump({'a': [(123, 0.1, 0.2)]}, f)
+        store = AudioStore.open(self.path)
+        self.assertEqual(len(store), 0)
+        self.assertFalse((self.path / AudioStore.MIGRATED).exists())
@@ -0,0 +1,71 @@
+import time
+from unittest import TestCase
+
+from ..ml_utils.brokers.base import BULK, INTERACTIVE, BaseWrapper
+from ..ml_utils.utils.metrics import metrics
+
+
+class DummyWrapper(BaseWrapper):
+    _load_config = _create_topic = _create_answer = publish = listen = lambda self: None
+
+
+def pipeline(**payload):
+    return payload
+
+
+class TestBaseWrapper(TestCase):
+
+    def setUp(self):
+        self.wrapper = DummyWrapper()
+        self.expired = time.time() - 1
+
+    def test_items_are_processed(self):
+        result, process_time = self.wrapper._process_item(pipeline, video_link='a', deadline=time.time() + 60)
+        self.assertEqual(result['video_link'], 'a')
+        self.assertIsNotNone(process_time)
+
+    def test_errors_give_empty_result(self):
+        self.assertEqual(self.wrapper._process_item(lambda video_link: 1 / 0, video_link='a'), (None, None))
+
+    def test_drop_policy(self):
+        dropped = metrics.get('expired_dropped')
+        for priority in [INTERACTIVE, BULK]:
+            with self.subTest(priority=priority):
+                result, process_time = self.wrapper._process_item(
+                    lambda **payload: self.fail('Expired item has been processed'),
+                    video_link='a', deadline=self.expired, priority=priority
+                )
+                self.assertEqual(result, {'video_link': 'a', 'expired': True})
+                self.assertIsNone(process_time)
+        self.assertEqual(metrics.get('expired_dropped'), dropped + 2)
+
+    def test_bulk_policy(self):
+        """
+        С политикой bulk просроченные bulk сообщения обрабатываются без deadline, остальные отбрасываются
+        """
+        self.wrapper.expired_policy = 'bulk'
+        dropped = metrics.get('expired_dropped')
+
+        result, _ = self.wrapper._process_item(pipeline, video_link='a', deadline=self.expired, priority=BULK)
+        self.assertEqual(result, {'video_link': 'a', 'priority': BULK})
+        self.assertEqual(metrics.get('expired_dropped'), dropped)
+
+        result, _ = self.wrapper._process_item(pipeline, video_link='a', deadline=self.expired, priority=INTERACTIVE)
+        self.assertEqual(result, {'video_link': 'a', 'expired': True})
+        self.assertEqual(metrics.get('expired_dropped'), dropped + 1)
+
+    def test_deadline_as_string(self):
+        result, _ = self.wrapper._process_item(pipeline, video_link='a', deadline=str(time.time() + 60))
+        self.assertIsInstance(result['deadline'], float)
+
+        result, _ = self.wrapper._process_item(pipeline, video_link='a', deadline=str(self.expired))
+        self.assertEqual(result, {'video_link': 'a', 'expired': True})
+
+    def test_malformed_deadline(self):
+        """
+        Сообщение с неверным deadline обрабатывается без срока, а не падает вне pipeline
+        """
+        for deadline in ['soon', [1], {}]:
+            with self.subTest(deadline=deadline):
+                result, _ = self.wrapper._process_item(pipeline, video_link='a', deadline=deadline)
+                self.assertEqual(result, {'video_link': 'a'})
@@ -0,0 +1,41 @@
+import sys
+from pathlib import Path
+from unittest import TestCase, skipUnless
+
+import numpy as np
+
+try:
+    import albumentations
+except ImportError:
+    albumentations = None
+
+
+@skipUnless(albumentations, 'albumentations is not installed')
+class TestTransform(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # src.decode импортирует ml_utils как пакет верхнего уровня, как в __main__
+        sys.path.append(str(Path(__file__).resolve().parents[1]))
+        from src import decode
+        cls.decode = decode
+
+    def test_out_matches_compose(self):
+        """
+        Запись в out дает тот же результат, что и полный A.Compose с транспонированием в CHW
+        """
+        rng = np.random.default_rng(0)
+        for height, width in [(360, 640), (640, 360), (224, 224), (100, 150)]:
+            with self.subTest(height=height, width=width):
+                frame = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+                out = np.empty((3, 224, 224), dtype=np.float32)
+                expected = self.decode._compose(image=frame)['image'].transpose(2, 0, 1)
+
+                self.assertIs(self.decode.transform(frame, out=out), out)
+                np.testing.assert_allclose(out, expected, atol=1e-5)
+
+    def test_out_is_overwritten(self):
+        frame = np.full((300, 400, 3), 255, dtype=np.uint8)
+        out = np.full((3, 224, 224), np.nan, dtype=np.float32)
+        self.decode.transform(frame, out=out)
+        np.testing.assert_allclose(out, 1.0)
@@ -0,0 +1,60 @@
+import threading
+import time
+from unittest import TestCase
+
+from pymilvus import MilvusException
+
+from ..ml_utils.databases import FederatedMilvusWrapper
+
+
+class FakeHit:
+
+    def __init__(self, id, distance):
+        self.id = id
+        self.distance = distance
+
+    def to_dict(self):
+        return {'id': self.id, 'distance': self.distance, 'entity': {'video_id': str(self.id)}}
+
+
+class FakeCollection:
+
+    def __init__(self, hits, stalled=False):
+        self.hits = hits
+        self.stalled = stalled
+        self.release = threading.Event()
+        self.timeouts = []
+
+    def search(self, data, param, limit, anns_field, output_fields, expr, partition_names, consistency_level, timeout):
+        self.timeouts.append(timeout)
+        if self.stalled and not self.release.wait(timeout):
+            raise MilvusException(message='Search has timed out')
+        return [[FakeHit(*hit) for hit in self.hits] for _ in data]
+
+
+class TestFederatedSearch(TestCase):
+
+    def setUp(self):
+        self.wrapper = FederatedMilvusWrapper(shards=['milvus-eu:19530', 'milvus-us:19530'], timeout=0.3)
+        self.fast = FakeCollection([(1, 0.9), (2, 0.5)])
+        self.stalled = FakeCollection([(3, 0.95)], stalled=True)
+        self.wrapper.wrappers[0].collection = self.fast
+        self.wrapper.wrappers[1].collection = self.stalled
+
+    def tearDown(self):
+        self.stalled.release.set()
+        self.wrapper.pool.shutdown(wait=True)
+
+    def test_stalled_shard_is_skipped(self):
+        for _ in range(5):
+            start = time.time()
+            results = self.wrapper.vector_search([[0.0]], limit=2)
+            self.assertLess(time.time() - start, 1)
+            self.assertEqual([hit['id'] for hit in results[0]], [1, 2])
+        self.assertEqual(self.stalled.timeouts, [0.3] * 5)
+        self.assertEqual(self.fast.timeouts, [0.3] * 5)
+
+    def test_not_enough_shards(self):
+        self.wrapper.min_shards = 2
+        with self.assertRaises(RuntimeError):
+            self.wrapper.vector_search([[0.0]], limit=2)
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from ..audio_fingerprint import decode, sh_opt, shazam
+from ..audio_fingerprint.executor import FingerprintExecutor
+from . import synthetic
+
+
+class TestFingerprintExecutor(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.paths = [
+            synthetic.write_wav(Path(cls.tmp.name) / f'track_{n}.wav', synthetic.track(10, seed=n))
+            for n in range(3)
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_same_fingerprints_as_inline(self):
+        """
+        Отпечатки из пула процессов совпадают с посчитанными в текущем процессе, порядок map сохраняется
+        """
+        files = self.paths + [Path(self.tmp.name) / 'missing.wav']
+        for max_workers in [0, 2]:
+            with FingerprintExecutor(max_workers=max_workers, max_pending=1, timeout=60) as executor:
+                executor.warm_up()
+                results = list(executor.map(files))
+
+            self.assertEqual([filename for filename, _ in results], files)
+            for path, (_, fingerprint) in zip(self.paths, results):
+                np.testing.assert_array_equal(fingerprint.hashes, shazam.fingerprint_file(str(path)).hashes)
+            self.assertIsInstance(results[-1][1], RuntimeError)
+
+    def test_default_max_duration(self):
+        """
+        Ограничение длительности передается в задачи явно, без изменения sh_opt
+        """
+        with FingerprintExecutor(max_workers=1, timeout=60, max_duration=3) as executor:
+            capped = executor.fingerprint(self.paths[0])
+            full = executor.result(executor.submit(self.paths[0], max_duration=10))
+
+        np.testing.assert_array_equal(capped.hashes, shazam.fingerprint_file(str(self.paths[0]), 3).hashes)
+        self.assertLess(len(capped), len(full))
+        self.assertIsNone(sh_opt.MAX_DURATION)
+
+    def test_hung_decode_is_killed(self):
+        """
+        Зависший ffmpeg убивается по timeout: процесс пула и слот освобождаются для следующих задач
+        """
+        ffmpeg = Path(self.tmp.name) / 'hung_ffmpeg'
+        ffmpeg.write_text('#!/bin/sh\nexec sleep 60\n')
+        os.chmod(ffmpeg, 0o755)
+        default, decode.FFMPEG_BINARY = decode.FFMPEG_BINARY, str(ffmpeg)
+        try:
+            # Процессы пула получают подмененный ffmpeg через fork
+            with FingerprintExecutor(max_workers=1, max_pending=1, timeout=0.5) as executor:
+                start = time.monotonic()
+                for path in self.paths[:2]:
+                    with self.assertRaises(TimeoutError):
+                        executor.result(executor.submit(path), timeout=10)
+                self.assertLess(time.monotonic() - start, 5)
+        finally:
+            decode.FFMPEG_BINARY = default
@@ -0,0 +1,100 @@
+from unittest import TestCase
+
+import numpy as np
+
+from ..ml_utils.databases.hot_tier import HotTier
+from ..ml_utils.databases.insert_buffer import InsertBuffer
+
+
+def row(video_id, vector):
+    return {'video_id': video_id, 'features': np.asarray(vector, dtype=np.float32)}
+
+
+class TestHotTier(TestCase):
+
+    def ids(self, results):
+        return [[(hit['id'], hit['entity']['video_id']) for hit in hits] for hits in results]
+
+    def test_search(self):
+        tier = HotTier(max_size=10)
+        tier.add([row('a', [1, 0]), row('b', [1, 1]), row('c', [0, 1])], [1, 2, 3])
+        results = tier.search([[2, 0], [0, 1]], limit=2)
+
+        self.assertEqual(len(tier), 3)
+        self.assertEqual(self.ids(results), [[(1, 'a'), (2, 'b')], [(3, 'c'), (2, 'b')]])
+        self.assertAlmostEqual(results[0][0]['distance'], 1.0, places=5)
+        self.assertAlmostEqual(results[0][1]['distance'], 1 / np.sqrt(2), places=5)
+
+    def test_empty(self):
+        tier = HotTier(max_size=10)
+        self.assertEqual(tier.add([]), [])
+        self.assertEqual(tier.search([[1, 0]]), [[]])
+
+    def test_oldest_rows_are_overwritten(self):
+        tier = HotTier(max_size=2)
+        tier.add([row('a', [1, 0]), row('b', [0, 1])])
+        tier.add([row('c', [1, 0.1])])
+
+        self.assertEqual(len(tier), 2)
+        self.assertEqual(self.ids(tier.search([[1, 0]], limit=5)), [[(None, 'c'), (None, 'b')]])
+
+    def test_expired_rows_are_skipped(self):
+        tier = HotTier(max_size=10, ttl_hours=0)
+        tier.add([row('a', [1, 0])])
+        self.assertEqual(len(tier), 0)
+        self.assertEqual(tier.search([[1, 0]]), [[]])
+
+    def test_set_ids_by_ticket(self):
+        tier = HotTier(max_size=2)
+        tickets = tier.add([row('a', [1, 0]), row('b', [0, 1])])
+        tier.set_ids(tickets, [10, 11])
+        self.assertEqual(self.ids(tier.search([[1, 0]], limit=1)), [[(10, 'a')]])
+
+    def test_set_ids_skips_overwritten_slots(self):
+        """
+        Номер вытесненной строки не попадает в слот, занятый более новой строкой
+        """
+        tier = HotTier(max_size=1)
+        old = tier.add([row('a', [1, 0])])
+        new = tier.add([row('b', [1, 0])])
+        tier.set_ids(old, [10])
+        self.assertEqual(self.ids(tier.search([[1, 0]])), [[(None, 'b')]])
+
+        tier.set_ids(new, [11])
+        self.assertEqual(self.ids(tier.search([[1, 0]])), [[(11, 'b')]])
+
+    def test_same_row_added_twice(self):
+        tier = HotTier(max_size=3)
+        same = row('a', [1, 0])
+        first = tier.add([same])
+        second = tier.add([same])
+        tier.set_ids(first + second, [10, 20])
+        self.assertEqual(sorted(hit['id'] for hit in tier.search([[1, 0]])[0]), [10, 20])
+
+    def test_row_filter(self):
+        tier = HotTier(max_size=10)
+        tier.add([row('a', [1, 0]), row('b', [0.9, 0.1])])
+        results = tier.search([[1, 0]], row_filter=lambda r: r['video_id'] == 'b')
+        self.assertEqual(self.ids(results), [[(None, 'b')]])
+
+    def test_only_cosine(self):
+        with self.assertRaises(AssertionError):
+            HotTier(max_size=10).search([[1, 0]], metric_type='L2')
+
+    def test_ids_from_insert_buffer(self):
+        """
+        После сброса буфера строки горячего уровня получают primary_keys из Milvus
+        """
+        tier = HotTier(max_size=10)
+        buffer = InsertBuffer(
+            lambda rows, partition_name: [100 + n for n in range(len(rows))],
+            flush_interval=60,
+            on_flush=tier.set_ids
+        )
+        try:
+            rows = [row('a', [1, 0]), row('b', [0, 1])]
+            buffer.add(rows, tags=tier.add(rows))
+            buffer.flush()
+        finally:
+            buffer.close()
+        self.assertEqual(self.ids(tier.search([[1, 0], [0, 1]], limit=1)), [[(100, 'a')], [(101, 'b')]])
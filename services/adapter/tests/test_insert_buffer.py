@@ -0,0 +1,102 @@
+import threading
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from ..ml_utils.databases.insert_buffer import InsertBuffer
+
+
+def row(video_id, vector):
+    return {'video_id': video_id, 'features': np.asarray(vector, dtype=np.float32)}
+
+
+class FakeCollection:
+    """ Вставка строк, как MilvusWrapper._insert_rows: возвращает primary_keys или падает. """
+
+    def __init__(self):
+        self.inserted = []
+        self.fail = False
+        self.flushed = threading.Event()
+
+    def insert(self, rows, partition_name=None):
+        if self.fail:
+            raise ConnectionError('Milvus is unavailable')
+        start = len(self.inserted)
+        self.inserted.extend((partition_name, r['video_id']) for r in rows)
+        self.flushed.set()
+        return list(range(start, start + len(rows)))
+
+
+class TestInsertBuffer(TestCase):
+
+    def setUp(self):
+        self.collection = FakeCollection()
+        self.flushed = []
+        self.buffer = InsertBuffer(
+            self.collection.insert,
+            max_rows=3,
+            flush_interval=60,
+            visibility_window=60,
+            on_flush=lambda rows, keys: self.flushed.append(([r['video_id'] for r in rows], keys))
+        )
+
+    def tearDown(self):
+        self.buffer.close()
+
+    def ids(self, results):
+        return [[(hit['id'], hit['entity']['video_id']) for hit in hits] for hits in results]
+
+    def test_pending_rows_are_searched(self):
+        self.buffer.add([row('a', [1, 0]), row('b', [0, 1])])
+        results = self.buffer.search([[1, 0.1]], limit=2)
+
+        self.assertEqual(len(self.buffer), 2)
+        self.assertEqual(self.ids(results), [[(None, 'a'), (None, 'b')]])
+        self.assertAlmostEqual(results[0][0]['distance'], 1 / np.sqrt(1.01), places=5)
+        self.assertEqual(self.collection.inserted, [])
+
+    def test_flush_by_partition(self):
+        self.buffer.add([row('a', [1, 0])], partition_name='d_20260101')
+        self.buffer.add([row('b', [0, 1])], partition_name='d_20260102')
+        self.buffer.flush()
+
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.collection.inserted, [('d_20260101', 'a'), ('d_20260102', 'b')])
+        self.assertEqual(self.flushed, [(['a'], [0]), (['b'], [1])])
+        # Вставленные строки ищутся локально с primary_keys, пока не истек visibility_window
+        self.assertEqual(self.ids(self.buffer.search([[0, 1]], limit=1)), [[(1, 'b')]])
+
+    def test_full_buffer_is_flushed_in_background(self):
+        self.buffer.add([row(str(n), [n, 1]) for n in range(3)])
+        self.assertTrue(self.collection.flushed.wait(5))
+        self.assertEqual([video_id for _, video_id in self.collection.inserted], ['0', '1', '2'])
+
+    def test_failed_flush_keeps_rows(self):
+        self.collection.fail = True
+        self.buffer.add([row('a', [1, 0])])
+        self.buffer.flush()
+        self.assertEqual(len(self.buffer), 1)
+        self.assertEqual(self.flushed, [])
+
+        self.collection.fail = False
+        self.buffer.flush()
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.collection.inserted, [(None, 'a')])
+
+    def test_flushed_rows_expire(self):
+        self.buffer.visibility_window = 0.05
+        self.buffer.add([row('a', [1, 0])])
+        self.buffer.flush()
+        time.sleep(0.1)
+        self.assertEqual(self.buffer.search([[1, 0]]), [[]])
+
+    def test_row_filter(self):
+        self.buffer.add([row('a', [1, 0]), row('b', [0.9, 0.1])])
+        results = self.buffer.search([[1, 0]], row_filter=lambda r: r['video_id'] != 'a')
+        self.assertEqual(self.ids(results), [[(None, 'b')]])
+
+    def test_close_flushes_rows(self):
+        self.buffer.add([row('a', [1, 0])])
+        self.buffer.close()
+        self.assertEqual(self.collection.inserted, [(None, 'a')])
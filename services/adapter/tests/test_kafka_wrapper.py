@@ -0,0 +1,248 @@
+import threading
+import time
+from collections import namedtuple
+from unittest import TestCase
+
+from kafka.errors import KafkaTimeoutError
+from kafka.structs import TopicPartition
+
+from ..ml_utils.brokers.kafka import KafkaWrapper
+from ..ml_utils.brokers.kafka.partition_worker import PartitionWorker, offset_and_metadata
+from ..ml_utils.brokers.kafka.wrapper import _RebalanceListener
+
+Record = namedtuple('Record', ['offset', 'value'])
+
+PARTITION = TopicPartition('input', 0)
+
+
+class FakeFuture:
+
+    def __init__(self):
+        self.errbacks = []
+
+    def add_errback(self, callback, *args):
+        self.errbacks.append((callback, args))
+
+
+class FakeProducer:
+    """ Ошибки доставки, как и в KafkaProducer, приходят в errback до возврата flush. """
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+        self.pending = []
+
+    def send(self, topic, value, partition=None):
+        future = FakeFuture()
+        self.sent.append(value)
+        self.pending.append(future)
+        return future
+
+    def flush(self, timeout=None):
+        pending, self.pending = self.pending, []
+        if self.fail:
+            for future in pending:
+                for callback, args in future.errbacks:
+                    callback(*args, KafkaTimeoutError('Batch has expired'))
+
+
+class FakeConsumer:
+
+    def __init__(self, polls=()):
+        self.polls = list(polls)
+        self.commits = []
+        self.seeks = []
+        self.paused_partitions = set()
+
+    def poll(self, timeout_ms=0, max_records=None):
+        return self.polls.pop(0) if self.polls else {}
+
+    def commit(self, offsets=None):
+        self.commits.append(offsets)
+
+    def seek(self, partition, offset):
+        self.seeks.append((partition, offset))
+
+    def pause(self, *partitions):
+        self.paused_partitions.update(partitions)
+
+    def resume(self, *partitions):
+        self.paused_partitions.difference_update(partitions)
+
+    def paused(self):
+        return set(self.paused_partitions)
+
+
+def make_wrapper(consumer, producer, **kwargs):
+    wrapper = KafkaWrapper(consumer_kwargs={'group_id': 'adapter'}, **kwargs)
+    wrapper.consumer = consumer
+    wrapper.producer = producer
+    wrapper.output_topic = 'output'
+    return wrapper
+
+
+class TestKafkaWrapper(TestCase):
+
+    def records(self, *offsets):
+        return {PARTITION: [Record(offset, {'video_link': str(offset)}) for offset in offsets]}
+
+    def test_batch_is_committed_after_delivery(self):
+        consumer = FakeConsumer([self.records(5, 6)])
+        producer = FakeProducer()
+        wrapper = make_wrapper(consumer, producer)
+
+        wrapper.listen(pipeline=lambda video_link: {'ok': video_link}, consumer_timeout_ms=0)
+        self.assertEqual(len(producer.sent), 2)
+        self.assertEqual(consumer.commits, [None])
+        self.assertEqual(consumer.seeks, [])
+
+    def test_failed_delivery_rewinds_batch(self):
+        consumer = FakeConsumer([self.records(5, 6)])
+        wrapper = make_wrapper(consumer, FakeProducer(fail=True))
+
+        wrapper.listen(pipeline=lambda video_link: {'ok': video_link}, consumer_timeout_ms=0)
+        self.assertEqual(consumer.commits, [])
+        self.assertEqual(consumer.seeks, [(PARTITION, 5)])
+
+    def test_publish_error_rewinds_batch(self):
+        class BrokenProducer(FakeProducer):
+            def send(self, topic, value, partition=None):
+                if len(self.sent) == 1:
+                    raise KafkaTimeoutError('Metadata is not available')
+                return super().send(topic, value, partition)
+
+        consumer = FakeConsumer([self.records(5, 6, 7)])
+        wrapper = make_wrapper(consumer, BrokenProducer())
+
+        wrapper.listen(pipeline=lambda video_link: {'ok': video_link}, consumer_timeout_ms=0)
+        self.assertEqual(consumer.commits, [])
+        self.assertEqual(consumer.seeks, [(PARTITION, 5)])
+
+    def test_flush_raises_delivery_errors_once(self):
+        producer = FakeProducer(fail=True)
+        wrapper = make_wrapper(None, producer)
+        wrapper.publish({'ok': True})
+        with self.assertRaises(KafkaTimeoutError):
+            wrapper.flush()
+        wrapper.flush()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise TimeoutError('Condition has not been met')
+        time.sleep(0.01)
+
+
+class TestPartitionWorkers(TestCase):
+
+    def setUp(self):
+        self.consumer = FakeConsumer()
+        self.producer = FakeProducer()
+        self.wrapper = make_wrapper(self.consumer, self.producer, max_backlog=4)
+        self.handled = []
+
+    def tearDown(self):
+        for worker in self.wrapper.workers.values():
+            worker.stop()
+
+    def handle(self, payload):
+        if payload.get('fail'):
+            raise ValueError(payload)
+        self.handled.append(payload['offset'])
+
+    def worker(self, partition=PARTITION, handler=None):
+        worker = self.wrapper.workers[partition] = PartitionWorker(partition, handler or self.handle)
+        return worker
+
+    def put(self, worker, *offsets, fail=()):
+        for offset in offsets:
+            worker.put(Record(offset, {'offset': offset, 'fail': offset in fail}))
+
+    def test_failed_message_stops_worker(self):
+        worker = self.worker()
+        self.put(worker, 0, 1, 2, 3, fail=[2])
+        wait_for(lambda: worker.failed is not None)
+        self.put(worker, 4)
+        worker.stop()
+
+        self.assertEqual(self.handled, [0, 1])
+        self.assertEqual(worker.processed, 2)
+        self.assertEqual(worker.failed, 2)
+        self.assertEqual(worker.start_offset, 0)
+
+    def test_commit_processed(self):
+        worker = self.worker()
+        self.put(worker, 10, 11)
+        wait_for(lambda: worker.processed == 12)
+
+        self.wrapper._commit_processed([worker])
+        self.wrapper._commit_processed([worker])
+        self.assertEqual(self.consumer.commits, [{PARTITION: offset_and_metadata(12)}])
+        self.assertEqual(worker.committed, 12)
+
+    def test_failed_delivery_rewinds_to_committed(self):
+        worker = self.worker()
+        worker.committed = worker.processed = 10
+        self.put(worker, 10, 11)
+        wait_for(lambda: worker.processed == 12)
+        self.wrapper.publish({'ok': True})
+        self.producer.fail = True
+
+        with self.assertRaises(KafkaTimeoutError):
+            self.wrapper._commit_processed([worker])
+        self.wrapper._rewind([worker])
+        self.assertEqual(self.consumer.commits, [])
+        self.assertEqual(self.consumer.seeks, [(PARTITION, 10)])
+        restarted = self.wrapper.workers[PARTITION]
+        self.assertIsNot(restarted, worker)
+        self.assertEqual((restarted.processed, restarted.committed), (10, 10))
+
+    def test_failed_partition_is_paused_and_retried(self):
+        worker = self.worker()
+        self.put(worker, 0, 1, 2, fail=[1])
+        wait_for(lambda: worker.failed is not None)
+
+        self.wrapper._apply_backpressure()
+        self.wrapper._apply_backpressure()
+        self.assertEqual(self.consumer.paused(), {PARTITION})
+
+        self.wrapper._retry_failed()
+        self.assertIs(self.wrapper.workers[PARTITION], worker)
+
+        worker.failed_time -= self.wrapper.retry_interval
+        self.wrapper._retry_failed()
+        self.assertEqual(self.consumer.commits, [{PARTITION: offset_and_metadata(1)}])
+        self.assertEqual(self.consumer.seeks, [(PARTITION, 1)])
+        self.assertEqual(self.consumer.paused(), set())
+
+        restarted = self.wrapper.workers[PARTITION]
+        self.put(restarted, 1, 2)
+        wait_for(lambda: restarted.processed == 3)
+        self.assertEqual(self.handled, [0, 1, 2])
+
+    def test_backpressure(self):
+        release = threading.Event()
+        worker = self.worker(handler=lambda payload: release.wait())
+        self.put(worker, *range(6))
+        wait_for(lambda: worker.backlog == 5)
+
+        self.wrapper._apply_backpressure()
+        self.assertEqual(self.consumer.paused(), {PARTITION})
+
+        release.set()
+        wait_for(lambda: worker.backlog == 0)
+        self.wrapper._apply_backpressure()
+        self.assertEqual(self.consumer.paused(), set())
+
+    def test_revoked_partitions_are_committed(self):
+        other = TopicPartition('input', 1)
+        worker = self.worker()
+        self.worker(other)
+        self.put(worker, 3)
+        wait_for(lambda: worker.processed == 4)
+
+        _RebalanceListener(self.wrapper).on_partitions_revoked([PARTITION])
+        self.assertEqual(self.consumer.commits, [{PARTITION: offset_and_metadata(4)}])
+        self.assertEqual(list(self.wrapper.workers), [other])
@@ -0,0 +1,114 @@
+import json
+from collections import Counter, namedtuple
+from unittest import TestCase
+
+from ..ml_utils.brokers.base import BULK, INTERACTIVE, LaneScheduler
+from ..ml_utils.brokers.rabbit.wrapper import RabbitWrapper
+
+Message = namedtuple('Message', ['body', 'delivery_tag'])
+
+
+class FakeChannel:
+
+    def __init__(self):
+        self.rejected = []
+
+    def basic_reject(self, delivery_tag, requeue):
+        self.rejected.append((delivery_tag, requeue))
+
+
+class TestLaneScheduler(TestCase):
+
+    def setUp(self):
+        self.lanes = LaneScheduler({INTERACTIVE: 4, BULK: 1})
+
+    def fill(self, interactive, bulk):
+        for n in range(interactive):
+            self.lanes.put(INTERACTIVE, f'i{n}')
+        for n in range(bulk):
+            self.lanes.put(BULK, f'b{n}')
+
+    def drain(self, count=None):
+        items = []
+        while len(self.lanes) and (count is None or len(items) < count):
+            items.append(self.lanes.get())
+        return items
+
+    def test_weighted_ratio(self):
+        self.fill(100, 100)
+        items = self.drain(50)
+
+        self.assertEqual(Counter(item[0] for item in items), {'i': 40, 'b': 10})
+        # Плавный round robin: bulk не ждет, пока закончится пачка interactive
+        for n in range(0, 50, 5):
+            self.assertEqual(sum(item[0] == 'b' for item in items[n:n + 5]), 1)
+
+    def test_order_within_lane(self):
+        self.fill(8, 2)
+        items = self.drain()
+        self.assertEqual([item for item in items if item[0] == 'i'], [f'i{n}' for n in range(8)])
+        self.assertEqual([item for item in items if item[0] == 'b'], ['b0', 'b1'])
+
+    def test_lane_goes_empty(self):
+        """
+        Когда одна полоса пуста, другая получает все место, а после возвращается к своей доле
+        """
+        self.fill(2, 10)
+        items = self.drain(6)
+        self.assertEqual(sorted(items), ['b0', 'b1', 'b2', 'b3', 'i0', 'i1'])
+
+        self.fill(20, 0)
+        items = self.drain(10)
+        self.assertEqual(Counter(item[0] for item in items), {'i': 8, 'b': 2})
+
+    def test_empty(self):
+        self.assertEqual(len(self.lanes), 0)
+        self.assertIsNone(self.lanes.get())
+
+    def test_clear(self):
+        self.fill(3, 3)
+        self.lanes.get()
+        self.lanes.clear()
+
+        self.assertEqual(len(self.lanes), 0)
+        self.assertIsNone(self.lanes.get())
+        self.fill(4, 1)
+        self.assertEqual(self.drain(), ['i0', 'i1', 'b0', 'i2', 'i3'])
+
+    def test_contains(self):
+        self.assertIn(INTERACTIVE, self.lanes)
+        self.assertIn(BULK, self.lanes)
+        self.assertNotIn('urgent', self.lanes)
+        self.assertNotIn(None, self.lanes)
+
+
+class TestLaneSelection(TestCase):
+
+    def setUp(self):
+        self.wrapper = RabbitWrapper.__new__(RabbitWrapper)
+        self.wrapper.channel = FakeChannel()
+        self.lanes = LaneScheduler({INTERACTIVE: 4, BULK: 1})
+
+    def lane_tags(self, lane):
+        return [message.delivery_tag for _, message, _ in self.lanes._lanes[lane]]
+
+    def test_lane_from_queue(self):
+        self.wrapper._receive(self.lanes, BULK, Message(json.dumps({'video_link': 'a'}), 1))
+        self.wrapper._receive(self.lanes, INTERACTIVE, Message(json.dumps({'video_link': 'b'}), 2))
+        self.assertEqual(self.lane_tags(BULK), [1])
+        self.assertEqual(self.lane_tags(INTERACTIVE), [2])
+
+    def test_priority_overrides_queue(self):
+        self.wrapper._receive(self.lanes, INTERACTIVE, Message(json.dumps({'priority': BULK}), 1))
+        self.wrapper._receive(self.lanes, BULK, Message(json.dumps({'priority': INTERACTIVE}), 2))
+        self.assertEqual(self.lane_tags(BULK), [1])
+        self.assertEqual(self.lane_tags(INTERACTIVE), [2])
+
+    def test_unknown_priority_uses_queue(self):
+        self.wrapper._receive(self.lanes, BULK, Message(json.dumps({'priority': 'urgent'}), 1))
+        self.assertEqual(self.lane_tags(BULK), [1])
+
+    def test_invalid_message_is_rejected(self):
+        self.wrapper._receive(self.lanes, INTERACTIVE, Message('not json', 7))
+        self.assertEqual(len(self.lanes), 0)
+        self.assertEqual(self.wrapper.channel.rejected, [(7, False)])
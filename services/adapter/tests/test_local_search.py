@@ -0,0 +1,76 @@
+from unittest import TestCase
+
+import numpy as np
+
+from ..ml_utils.databases.local_search import brute_force_search, merge_hits
+
+
+def hit(id_, distance):
+    return {'id': id_, 'distance': distance, 'entity': {'video_id': str(id_)}}
+
+
+class TestBruteForceSearch(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.queries = rng.normal(size=(3, 16)).astype(np.float32)
+        self.vectors = rng.normal(size=(50, 16)).astype(np.float32)
+
+    def reference(self, metric_type):
+        """
+        Полная сортировка всех расстояний
+        """
+        if metric_type == 'COSINE':
+            q = self.queries / np.linalg.norm(self.queries, axis=-1, keepdims=True)
+            v = self.vectors / np.linalg.norm(self.vectors, axis=-1, keepdims=True)
+            distances = q @ v.T
+        elif metric_type == 'IP':
+            distances = self.queries @ self.vectors.T
+        else:
+            distances = ((self.queries[:, None] - self.vectors[None]) ** 2).sum(-1)
+        order = np.argsort(distances if metric_type == 'L2' else -distances, axis=-1)
+        return order, np.take_along_axis(distances, order, -1)
+
+    def test_matches_full_sort(self):
+        for metric_type in ['COSINE', 'IP', 'L2']:
+            with self.subTest(metric_type=metric_type):
+                idx, distances = brute_force_search(self.queries, self.vectors, limit=5, metric_type=metric_type)
+                expected_idx, expected_distances = self.reference(metric_type)
+                np.testing.assert_array_equal(idx, expected_idx[:, :5])
+                np.testing.assert_allclose(distances, expected_distances[:, :5], rtol=1e-4, atol=1e-4)
+
+    def test_limit_over_size(self):
+        idx, distances = brute_force_search(self.queries[0], self.vectors[:3], limit=10)
+        self.assertEqual(idx.shape, (1, 3))
+        self.assertEqual(distances.shape, (1, 3))
+
+    def test_empty_vectors(self):
+        idx, distances = brute_force_search(self.queries, np.empty((0, 16)), limit=5)
+        self.assertEqual(idx.shape, (3, 0))
+        self.assertEqual(distances.shape, (3, 0))
+
+    def test_unsupported_metric(self):
+        with self.assertRaises(ValueError):
+            brute_force_search(self.queries, self.vectors, metric_type='HAMMING')
+
+
+class TestMergeHits(TestCase):
+
+    def test_merge_and_dedupe(self):
+        local = [[hit(None, 0.95), hit(1, 0.9)], [hit(4, 0.2)]]
+        milvus = [[hit(1, 0.9), hit(2, 0.8)], [hit(5, 0.7)]]
+        merged = merge_hits(local, milvus, limit=3)
+
+        self.assertEqual([[h['id'] for h in hits] for hits in merged], [[None, 1, 2], [5, 4]])
+
+    def test_without_dedupe(self):
+        merged = merge_hits([[hit(1, 0.9)]], [[hit(1, 0.8)]], dedupe=False)
+        self.assertEqual([h['distance'] for h in merged[0]], [0.9, 0.8])
+
+    def test_l2_order(self):
+        merged = merge_hits([[hit(1, 3.0)]], [[hit(2, 1.0), hit(3, 2.0)]], limit=2, metric_type='L2')
+        self.assertEqual([h['id'] for h in merged[0]], [2, 3])
+
+    def test_empty_results(self):
+        self.assertEqual(merge_hits([], [], limit=3), [])
+        self.assertEqual(merge_hits([], [[hit(1, 0.5)]]), [[hit(1, 0.5)]])
@@ -0,0 +1,63 @@
+import itertools
+from unittest import TestCase
+
+from ..ml_utils.databases import MetadataFilter
+
+
+class TestMetadataFilter(TestCase):
+
+    def test_expr(self):
+        self.assertEqual(MetadataFilter().expr, '')
+        self.assertEqual(MetadataFilter(duration=0, aspect_ratio=1.5).expr, '')
+        self.assertEqual(
+            MetadataFilter(duration=10, duration_tolerance=0.2).expr,
+            '(duration <= 0 or (duration >= 8.000 and duration <= 12.000))'
+        )
+        self.assertEqual(
+            MetadataFilter(duration=10, aspect_ratio=0.5625, same_orientation=True).expr,
+            '(duration <= 0 or (duration >= 8.000 and duration <= 12.000)) and (aspect_ratio < 1.0)'
+        )
+        self.assertEqual(
+            MetadataFilter(aspect_ratio=1.0, same_orientation=True).expr,
+            '(aspect_ratio <= 0 or aspect_ratio >= 1.0)'
+        )
+
+    def test_match(self):
+        metadata_filter = MetadataFilter(duration=10, aspect_ratio=1.78, same_orientation=True)
+
+        self.assertTrue(metadata_filter.match({'duration': 12.0, 'aspect_ratio': 1.0}))
+        self.assertFalse(metadata_filter.match({'duration': 12.5, 'aspect_ratio': 1.78}))
+        self.assertFalse(metadata_filter.match({'duration': 10.0, 'aspect_ratio': 0.56}))
+        self.assertTrue(MetadataFilter().match({'video_id': 'a'}))
+
+    def test_unknown_metadata(self):
+        """
+        Неизвестные метаданные (0 по умолчанию) фильтр проходят, строки без ключей метаданных - нет:
+        Milvus не находит их по expr, поэтому старые векторы нужно перевставить до включения фильтра
+        """
+        metadata_filter = MetadataFilter(duration=10, aspect_ratio=1.78, same_orientation=True)
+
+        self.assertTrue(metadata_filter.match({'duration': 0.0, 'aspect_ratio': 0.0}))
+        self.assertTrue(metadata_filter.match({'duration': 0.0, 'aspect_ratio': 1.78}))
+        self.assertFalse(metadata_filter.match({'duration': 0.0, 'aspect_ratio': 0.56}))
+        self.assertFalse(metadata_filter.match({'video_id': 'a'}))
+        self.assertFalse(metadata_filter.match({'video_id': 'a', 'duration': 10.0}))
+
+    def test_match_agrees_with_expr(self):
+        """
+        Локальные уровни поиска отбирают те же строки, что и Milvus по expr
+        """
+        filters = [
+            MetadataFilter(duration=duration, aspect_ratio=aspect_ratio, same_orientation=same_orientation)
+            for duration, aspect_ratio, same_orientation in itertools.product(
+                [None, 4, 10], [None, 0.5625, 1.0, 1.78], [False, True]
+            )
+        ]
+        rows = [
+            {'duration': duration / 2, 'aspect_ratio': aspect_ratio}
+            for duration, aspect_ratio in itertools.product(range(0, 30), [0.0, 0.5625, 0.99, 1.0, 1.78])
+        ]
+        for metadata_filter in filters:
+            for row in rows:
+                expected = eval(metadata_filter.expr, {}, row) if metadata_filter.expr else True
+                self.assertEqual(metadata_filter.match(row), expected, (metadata_filter, row))
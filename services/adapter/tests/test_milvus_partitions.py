@@ -0,0 +1,134 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from ..ml_utils.databases import MilvusWrapper
+
+
+class FakePartition:
+
+    def __init__(self, collection, name):
+        self.collection = collection
+        self.name = name
+
+    def release(self):
+        self.collection.released.append(self.name)
+
+
+class FakeCollection:
+
+    def __init__(self, names=()):
+        self.names = ['_default', *names]
+        self.created = []
+        self.loaded = []
+        self.released = []
+        self.dropped = []
+
+    @property
+    def partitions(self):
+        return [FakePartition(self, name) for name in self.names]
+
+    def partition(self, name):
+        return FakePartition(self, name)
+
+    def has_partition(self, name):
+        return name in self.names
+
+    def create_partition(self, name):
+        # Медленный запрос к Milvus расширяет окно гонки между проверкой и созданием
+        time.sleep(0.05)
+        if name in self.names:
+            raise RuntimeError(f'Partition {name} already exists')
+        self.created.append(name)
+        self.names.append(name)
+
+    def drop_partition(self, name):
+        self.dropped.append(name)
+        self.names.remove(name)
+
+    def load(self, partition_names=None):
+        self.loaded.append(partition_names)
+
+
+def make_wrapper(collection, **kwargs):
+    kwargs = {'port': 19530, 'partition_period': 'day', 'loaded_partitions': 0, 'partition_retention': 0, **kwargs}
+    wrapper = MilvusWrapper(**kwargs)
+    wrapper.collection = collection
+    return wrapper
+
+
+class TestCurrentPartition(TestCase):
+
+    def test_concurrent_inserts_create_partition_once(self):
+        collection = FakeCollection()
+        wrapper = make_wrapper(collection)
+        barrier = threading.Barrier(8)
+        names, errors = [], []
+
+        def insert():
+            barrier.wait()
+            try:
+                names.append(wrapper.current_partition())
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=insert) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(set(names), {wrapper.partition_for()})
+        self.assertEqual(collection.created, [wrapper.partition_for()])
+        self.assertEqual(collection.loaded, [[wrapper.partition_for()]])
+
+
+class TestTimePartitions(TestCase):
+
+    def test_partition_for(self):
+        day = make_wrapper(FakeCollection())
+        week = make_wrapper(FakeCollection(), partition_period='week')
+
+        self.assertEqual(day.partition_for(datetime(2026, 1, 5, 23, 59)), 'd_20260105')
+        self.assertEqual(week.partition_for(datetime(2026, 1, 5)), 'w_2026_02')
+        # ISO-неделя: 1 января 2027 года относится к 53-й неделе 2026 года
+        self.assertEqual(week.partition_for(datetime(2027, 1, 1)), 'w_2026_53')
+        names = [week.partition_for(datetime(2026, 1, 1) + timedelta(weeks=n)) for n in range(60)]
+        self.assertEqual(names, sorted(names))
+
+    def test_time_partitions_are_sorted_and_cached(self):
+        collection = FakeCollection(['d_20260102', 'w_2026_01', 'd_20260103', 'd_20260101'])
+        wrapper = make_wrapper(collection)
+
+        self.assertEqual(wrapper.time_partitions(), ['d_20260103', 'd_20260102', 'd_20260101'])
+        collection.names.append('d_20260104')
+        self.assertEqual(wrapper.time_partitions()[0], 'd_20260103')
+        self.assertEqual(wrapper.time_partitions(refresh=True)[0], 'd_20260104')
+
+    def test_rotate_partitions(self):
+        collection = FakeCollection([f'd_2026010{n}' for n in range(1, 6)])
+        wrapper = make_wrapper(collection, loaded_partitions=2, partition_retention=4)
+        wrapper.rotate_partitions()
+
+        self.assertEqual(collection.released, ['d_20260103', 'd_20260102', 'd_20260101', 'd_20260101'])
+        self.assertEqual(collection.dropped, ['d_20260101'])
+        self.assertEqual(wrapper.time_partitions(), ['d_20260105', 'd_20260104', 'd_20260103', 'd_20260102'])
+
+    def test_rotation_is_disabled_by_zero(self):
+        collection = FakeCollection([f'd_2026010{n}' for n in range(1, 6)])
+        make_wrapper(collection).rotate_partitions()
+        self.assertEqual((collection.released, collection.dropped), ([], []))
+
+    def test_new_period_rotates_partitions(self):
+        collection = FakeCollection(['d_20200101', 'd_20200102'])
+        wrapper = make_wrapper(collection, partition_retention=2)
+        name = wrapper.current_partition()
+
+        self.assertEqual(collection.created, [name])
+        self.assertEqual(collection.dropped, ['d_20200101'])
+        self.assertEqual(wrapper.time_partitions(), [name, 'd_20200102'])
+        # Повторный вызов в том же периоде не обращается к Milvus
+        wrapper.current_partition()
+        self.assertEqual(collection.loaded, [[name]])
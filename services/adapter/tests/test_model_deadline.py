@@ -0,0 +1,53 @@
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import SkipTest, TestCase
+
+
+class FakeFingerprinter:
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, filename):
+        self.submitted.append(filename)
+        return filename
+
+
+class TestExpiredAfterDownload(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # __main__ импортирует audio_fingerprint и ml_utils как пакеты верхнего уровня
+        sys.path.append(str(Path(__file__).resolve().parents[1]))
+        try:
+            from .. import __main__ as adapter
+        except ImportError as e:
+            raise SkipTest(f'Adapter dependencies are not installed: {e}')
+        cls.adapter = adapter
+
+    def setUp(self):
+        self.model = SimpleNamespace(mode='similarity', fingerprinter=FakeFingerprinter())
+
+    def prepare(self, deadline):
+        job = {'video_link': '/videos/abc.mp4', 'deadline': deadline}
+        return self.adapter.Model.prepare_video(self.model, job)
+
+    def test_expired_job_is_dropped(self):
+        """
+        Если видео скачивалось дольше deadline, ответ готов сразу, а отпечаток аудио не считается
+        """
+        dropped = self.adapter.metrics.get('expired_dropped')
+        job = self.prepare(time.time() - 1)
+
+        self.assertEqual(job['result'], {'video_link': '/videos/abc.mp4', 'is_duplicate': None, 'expired': True})
+        self.assertEqual(self.model.fingerprinter.submitted, [])
+        self.assertEqual(self.adapter.metrics.get('expired_dropped'), dropped + 1)
+
+    def test_job_in_time_is_processed(self):
+        job = self.prepare(time.time() + 60)
+        self.assertNotIn('result', job)
+        self.assertEqual(job['video_id'], 'abc')
+        self.assertEqual(self.model.fingerprinter.submitted, ['/videos/abc.mp4'])
+        self.assertEqual(self.prepare(None)['audio_future'], '/videos/abc.mp4')
@@ -0,0 +1,51 @@
+import tempfile
+from concurrent.futures import Future
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from ..audio_fingerprint.pending import PendingFingerprints
+from ..audio_fingerprint.shazam import Fingerprint
+from ..audio_fingerprint.store import AudioStore
+
+
+class TestPendingFingerprints(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = AudioStore(Path(self.tmp.name) / 'audio_store')
+        self.pending = PendingFingerprints(self.store)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fingerprint_is_saved_when_ready(self):
+        """
+        Видео остается в pending, пока отпечаток не посчитан, и сохраняется в хранилище после
+        """
+        future = Future()
+        self.pending.save_later('a', future)
+        self.assertIn('a', self.pending)
+        self.assertIs(self.pending.get('a'), future)
+        self.assertNotIn('a', self.store)
+
+        future.set_result(Fingerprint([1, 2, 3], [0.1, 0.2, 0.3]))
+        self.assertNotIn('a', self.pending)
+        self.assertIsNone(self.pending.get('a'))
+        np.testing.assert_array_equal(self.store['a'].hashes, [1, 2, 3])
+
+    def test_failed_fingerprint_is_saved_empty(self):
+        future = Future()
+        self.pending.save_later('a', future)
+        future.set_exception(RuntimeError('Unable to decode audio'))
+
+        self.assertNotIn('a', self.pending)
+        self.assertEqual(len(self.store['a']), 0)
+
+    def test_done_future_is_saved_immediately(self):
+        future = Future()
+        future.set_result(Fingerprint([4], [0.4]))
+        self.pending.save_later('a', future)
+
+        self.assertEqual(len(self.pending), 0)
+        np.testing.assert_array_equal(self.store['a'].hashes, [4])
@@ -0,0 +1,107 @@
+import json
+import queue
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from ..ml_utils.brokers.base import BULK, INTERACTIVE, LaneScheduler
+from ..ml_utils.brokers.rabbit.wrapper import RabbitWrapper
+
+Message = namedtuple('Message', ['body', 'delivery_tag'])
+
+
+class FakeChannel:
+    """ Канал amqp, который запоминает отправленные ответы и подтверждения. """
+
+    def __init__(self):
+        self.events = []
+        self.fail_publish = False
+
+    def basic_publish(self, msg, exchange, routing_key):
+        if self.fail_publish:
+            raise ConnectionError('Channel is closed')
+        self.events.append(('publish', json.loads(msg.body)))
+
+    def basic_ack(self, delivery_tag):
+        self.events.append(('ack', delivery_tag))
+
+    def basic_reject(self, delivery_tag, requeue):
+        self.events.append(('reject', delivery_tag))
+
+
+class TestRabbitDispatch(TestCase):
+
+    def setUp(self):
+        self.wrapper = RabbitWrapper.__new__(RabbitWrapper)
+        self.wrapper.channel = FakeChannel()
+        self.wrapper.output_topic = 'output'
+        self.wrapper.workers = 2
+        self.wrapper._in_flight = 0
+        self.lanes = LaneScheduler({INTERACTIVE: 4, BULK: 1})
+        self.done = queue.Queue()
+        self.pool = ThreadPoolExecutor(max_workers=2)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def put(self, tag, **payload):
+        self.lanes.put(INTERACTIVE, (self.wrapper.channel, Message(json.dumps(payload), tag), payload))
+
+    def run_once(self, pipeline):
+        """
+        Одна итерация цикла _consume: раздать сообщения потокам и обработать готовые результаты
+        """
+        self.wrapper._dispatch(self.pool, pipeline, self.lanes, self.done)
+        self.pool.shutdown()
+        self.wrapper._complete(self.done)
+
+    def test_ack_after_publish(self):
+        self.put(1, video_link='a')
+        self.put(2, video_link='b')
+        self.run_once(lambda video_link: {'is_duplicate': video_link == 'b'})
+
+        events = self.wrapper.channel.events
+        self.assertEqual(self.wrapper._in_flight, 0)
+        self.assertEqual(sorted(e[1] for e in events if e[0] == 'ack'), [1, 2])
+        for tag, video_link in [(1, 'a'), (2, 'b')]:
+            publish = next(n for n, e in enumerate(events) if e[0] == 'publish' and e[1]['inputs']['video_link'] == video_link)
+            self.assertLess(publish, events.index(('ack', tag)))
+
+    def test_no_ack_when_publish_fails(self):
+        """
+        Если ответ не отправлен, сообщение не подтверждается и будет доставлено повторно
+        """
+        self.wrapper.channel.fail_publish = True
+        self.put(1, video_link='a')
+        with self.assertRaises(ConnectionError):
+            self.run_once(lambda video_link: {})
+        self.assertEqual(self.wrapper.channel.events, [])
+
+    def test_pipeline_error_is_answered(self):
+        self.put(1, video_link='a')
+        self.run_once(lambda video_link: 1 / 0)
+        self.assertEqual(
+            [(kind, data['result'] if kind == 'publish' else data) for kind, data in self.wrapper.channel.events],
+            [('publish', None), ('ack', 1)]
+        )
+
+    def test_error_outside_pipeline_is_answered(self):
+        """
+        Исключение из _process_item не теряется в колбэке пула: сообщение получает ответ и ack
+        """
+        def process_item(pipeline, **payload):
+            raise ValueError('Unexpected payload')
+
+        self.wrapper._process_item = process_item
+        self.put(1, video_link='a')
+        self.run_once(lambda video_link: {})
+
+        self.assertEqual(self.wrapper._in_flight, 0)
+        self.assertEqual([kind for kind, _ in self.wrapper.channel.events], ['publish', 'ack'])
+
+    def test_workers_limit(self):
+        for tag in range(5):
+            self.put(tag, video_link=str(tag))
+        self.run_once(lambda video_link: {})
+        self.assertEqual(len(self.lanes), 3)
+        self.assertEqual(sorted(e[1] for e in self.wrapper.channel.events if e[0] == 'ack'), [0, 1])
@@ -0,0 +1,80 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest import TestCase
+
+import numpy as np
+
+from ..ml_utils.utils.shared_ring import SharedClipRing
+
+_ring = None
+
+
+def _init(ring):
+    global _ring
+    _ring = ring
+
+
+def _write(value):
+    slot = _ring.acquire(timeout=10)
+    _ring.view(slot)[:] = value
+    _ring.handoff(slot)
+    return slot
+
+
+def _crash():
+    _ring.acquire(timeout=10)
+    os._exit(1)
+
+
+class TestSharedClipRing(TestCase):
+    def setUp(self):
+        self.ring = SharedClipRing(slots=3, shape=(2, 3, 4, 4))
+
+    def tearDown(self):
+        self.ring.close()
+
+    def test_slots_are_views(self):
+        """
+        Слоты не пересекаются, view читает разделяемую память без копирования
+        """
+        slots = [self.ring.acquire() for _ in range(3)]
+        self.assertEqual(sorted(slots), [0, 1, 2])
+        self.assertEqual(self.ring.free, 0)
+        self.assertRaises(TimeoutError, self.ring.acquire, 0.01)
+
+        views = [self.ring.view(slot) for slot in slots]
+        self.assertTrue(all(view.base is not None for view in views))
+        for i, view in enumerate(views):
+            view[:] = i
+        for i, view in enumerate(views):
+            self.assertTrue(np.all(view == i))
+
+        self.ring.release(slots[1])
+        self.assertEqual(self.ring.acquire(), slots[1])
+
+    def test_handoff_between_processes(self):
+        """
+        Кадры, записанные процессом пула, видны в родительском процессе по номеру слота
+        """
+        with ProcessPoolExecutor(max_workers=2, initializer=_init, initargs=(self.ring,)) as pool:
+            slots = list(pool.map(_write, [1.0, 2.0, 3.0]))
+        self.assertEqual(sorted(slots), [0, 1, 2])
+        for slot, value in zip(slots, [1.0, 2.0, 3.0]):
+            self.assertTrue(np.all(self.ring.view(slot) == value))
+        # Слоты переданы родителю и не освобождаются после завершения процессов пула
+        self.assertEqual(self.ring.reclaim(), 0)
+        for slot in slots:
+            self.ring.release(slot)
+        self.assertEqual(self.ring.free, 3)
+
+    def test_reclaim_after_crash(self):
+        """
+        Слот упавшего процесса возвращается в кольцо
+        """
+        with ProcessPoolExecutor(max_workers=1, initializer=_init, initargs=(self.ring,)) as pool:
+            with self.assertRaises(BrokenProcessPool):
+                pool.submit(_crash).result()
+        self.assertEqual(self.ring.free, 2)
+        self.assertEqual(self.ring.reclaim(), 1)
+        self.assertEqual(self.ring.free, 3)
@@ -0,0 +1,171 @@
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from ..audio_fingerprint import sh_opt, shazam
+from ..audio_fingerprint.decode import read_audio
+from . import synthetic
+
+
+def reference_hash_points(points):
+    """
+    Исходная реализация hash_points с перебором всех пиков для каждого якоря.
+    """
+    hashes = []
+    for anchor in points:
+        for target in shazam.target_zone(
+                anchor, points, sh_opt.TARGET_T, sh_opt.TARGET_F, sh_opt.TARGET_START
+        ):
+            hashes.append((shazam.hash_point_pair(anchor, target), anchor[1]))
+    hashes.sort(key=lambda x: x[0])
+    return hashes
+
+
+def as_pairs(fingerprint):
+    return list(zip(fingerprint.hashes.tolist(), fingerprint.times.tolist()))
+
+
+def reference_pairs(points):
+    return [(h, float(np.float32(t))) for h, t in reference_hash_points(points)]
+
+
+class TestHashPoints(TestCase):
+    def test_same_pairs_on_synthetic_audio(self):
+        """
+        Векторизованное формирование пар дает те же хэши в том же порядке, что и перебор
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = synthetic.write_wav(Path(tmp) / 'track.wav', synthetic.track(20))
+            f, t, Sxx = shazam.file_to_spectrogram(str(path))
+        peaks = shazam.idxs_to_tf_pairs(shazam.find_peaks(Sxx), t, f)
+
+        expected = reference_pairs(peaks)
+        actual = as_pairs(shazam.hash_points(peaks))
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(actual, expected)
+
+    def test_same_pairs_on_zone_borders(self):
+        """
+        Точки ровно на границах целевой зоны и с одинаковым временем обрабатываются как в переборе
+        """
+        rng = np.random.default_rng(0)
+        times = rng.integers(0, 40, 300) * sh_opt.TARGET_START
+        freqs = rng.integers(0, 12, 300) * (sh_opt.TARGET_F / 4)
+        peaks = np.stack([freqs, times], axis=1)
+
+        self.assertEqual(as_pairs(shazam.hash_points(peaks)), reference_pairs(peaks))
+
+    def test_empty_peaks(self):
+        self.assertEqual(len(shazam.hash_points(np.array([]))), 0)
+
+
+class TestPackedHashes(TestCase):
+    def test_hash_layout(self):
+        """
+        Хэш детерминирован и содержит частоты обоих пиков и разницу во времени между ними
+        """
+        self.assertEqual(shazam.hash_point_pair((1000.0, 1.0), (2000.0, 1.35)), (200 << 20) | (400 << 8) | 2)
+
+    def test_time_delta_changes_hash(self):
+        self.assertNotEqual(
+            shazam.hash_point_pair((1000.0, 1.0), (2000.0, 1.2)),
+            shazam.hash_point_pair((1000.0, 1.0), (2000.0, 1.4))
+        )
+
+    def test_shifted_audio_has_same_hashes(self):
+        """
+        Сдвиг всех пиков во времени не меняет хэши, только время якорей
+        """
+        rng = np.random.default_rng(1)
+        peaks = np.stack([rng.integers(0, 1000, 200) * 5.0, rng.integers(0, 100, 200) * 0.175], axis=1)
+        shifted = peaks + [0.0, 3.5]
+
+        fp, fp_shifted = shazam.hash_points(peaks), shazam.hash_points(shifted)
+        np.testing.assert_array_equal(fp.hashes, fp_shifted.hashes)
+        np.testing.assert_allclose(fp_shifted.times - fp.times, 3.5, atol=1e-4)
+        self.assertEqual(shazam.compare_fingerprints(fp, fp_shifted), 1.0)
+
+
+class TestCompareFingerprints(TestCase):
+    def test_batch_matches_set_jaccard(self):
+        """
+        Пакетное сравнение совпадает с коэффициентом Жаккара по множествам хэшей
+        """
+        rng = np.random.default_rng(2)
+        make = lambda n: shazam.Fingerprint(np.sort(rng.integers(0, 500, n)).astype(np.uint32), np.zeros(n))
+        query = make(300)
+        candidates = [make(n) for n in [0, 1, 50, 300, 1000]] + [query]
+
+        expected = []
+        for c in candidates:
+            q, h = set(query.hashes.tolist()), set(c.hashes.tolist())
+            expected.append(len(q & h) / len(q | h) if q | h else 0)
+        np.testing.assert_allclose(shazam.compare_fingerprints_batch(query, candidates), expected)
+        self.assertEqual(shazam.compare_fingerprints(query, query), 1.0)
+        self.assertEqual(shazam.compare_fingerprints(shazam.Fingerprint(), query), 0.0)
+
+    def test_unsorted_hashes(self):
+        """
+        Уникальные хэши считаются и для неотсортированного отпечатка
+        """
+        fp = shazam.Fingerprint([5, 1, 5, 3, 1], np.zeros(5))
+        np.testing.assert_array_equal(fp.unique, [1, 3, 5])
+        self.assertEqual(shazam.compare_fingerprints(fp, shazam.Fingerprint([1, 3, 5], np.zeros(3))), 1.0)
+
+    def test_truncated_matches_capped_fingerprint(self):
+        """
+        Отпечаток всего трека, обрезанный при сравнении, ближе к отпечатку начала трека.
+        Полного совпадения нет: число пиков зависит от длительности аудио
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = synthetic.write_wav(Path(tmp) / 'track.wav', synthetic.track(20))
+            full = shazam.fingerprint_file(path)
+            capped = shazam.fingerprint_file(path, max_duration=8)
+
+        truncated = full.truncated(8)
+        self.assertLess(len(truncated), len(full))
+        score = shazam.compare_fingerprints(full, capped)
+        self.assertGreater(shazam.compare_fingerprints(truncated, capped), max(score + 0.2, 0.6))
+        self.assertIs(full.truncated(None), full)
+        self.assertIs(capped.truncated(60), capped)
+
+
+class TestReadAudio(TestCase):
+    def test_resample_and_cap(self):
+        """
+        Аудио приводится к SAMPLE_RATE, а при ограничении длительности читается только начало
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = synthetic.write_wav(Path(tmp) / 'track.wav', synthetic.track(5, sr=22050), sr=22050)
+            audio = read_audio(path)
+            capped = read_audio(path, max_duration=2)
+
+        self.assertEqual(audio.dtype, np.int16)
+        self.assertAlmostEqual(len(audio), 5 * sh_opt.SAMPLE_RATE, delta=sh_opt.SAMPLE_RATE // 100)
+        self.assertEqual(len(capped), 2 * sh_opt.SAMPLE_RATE)
+        np.testing.assert_array_equal(capped[:1000], audio[:1000])
+
+    def test_missing_file(self):
+        with self.assertRaises(RuntimeError):
+            read_audio('/nonexistent.mp4')
+
+
+class TestFindPeaks(TestCase):
+    def test_chunked_peaks_match_whole_spectrogram(self):
+        """
+        Пики, найденные по кускам спектрограммы, совпадают с пиками по всей спектрограмме
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = synthetic.write_wav(Path(tmp) / 'track.wav', synthetic.track(60))
+            audio = read_audio(path)
+            f, t, Sxx = shazam.file_to_spectrogram(str(path))
+        expected = shazam.idxs_to_tf_pairs(shazam.find_peaks(Sxx), t, f)
+
+        self.assertEqual(Sxx.dtype, np.float32)
+        for chunk_frames in [17, 50, 10 ** 6]:
+            np.testing.assert_array_equal(shazam.find_peaks_chunked(audio, chunk_frames), expected)
+
+    def test_short_audio(self):
+        self.assertEqual(shazam.find_peaks_chunked(np.zeros(100, np.int16)).shape, (0, 2))
@@ -0,0 +1,113 @@
+import random
+import threading
+import time
+from unittest import TestCase
+
+from ..ml_utils.utils.pipeline import Stage, StagedPipeline
+
+
+def _jitter(x):
+    time.sleep(random.random() * 0.005)
+    return x
+
+
+def _square(x):
+    return x * x
+
+
+class TestStagedPipeline(TestCase):
+    def test_results_and_errors(self):
+        """
+        Каждый элемент получает результат всех стадий, ошибка попадает только в Future своего элемента
+        """
+        def fail_on_seven(x):
+            if x == 7:
+                raise ValueError(x)
+            return x
+
+        with StagedPipeline([
+            Stage('jitter', _jitter, workers=4),
+            Stage('fail', fail_on_seven, workers=2),
+            Stage('batch', lambda xs: [x + 1 for x in xs], batch_size=4),
+        ]) as pipeline:
+            futures = [pipeline.submit(x) for x in range(20)]
+            for x, future in enumerate(futures):
+                if x == 7:
+                    self.assertRaises(ValueError, future.result, 10)
+                else:
+                    self.assertEqual(future.result(10), x + 1)
+
+    def test_ordered_stage(self):
+        """
+        Упорядоченная стадия передает элементы дальше в порядке submit при нескольких потоках
+        """
+        seen = []
+        with StagedPipeline([
+            Stage('jitter', _jitter, workers=4, ordered=True),
+            Stage('collect', seen.append),
+        ]) as pipeline:
+            for x in range(50):
+                pipeline.submit(x)
+        self.assertEqual(seen, list(range(50)))
+
+    def test_map_keeps_order(self):
+        with StagedPipeline([Stage('jitter', _jitter, workers=4)]) as pipeline:
+            self.assertEqual(list(pipeline.map(range(30))), list(range(30)))
+
+    def test_batches(self):
+        """
+        Батчевая стадия собирает ожидающие элементы в батчи не больше batch_size
+        """
+        sizes = []
+        release = threading.Event()
+
+        def wait(x):
+            release.wait()
+            return x
+
+        def batch(xs):
+            sizes.append(len(xs))
+            return xs
+
+        with StagedPipeline([
+            Stage('wait', wait),
+            Stage('batch', batch, batch_size=4, batch_timeout=1, queue_size=16),
+        ]) as pipeline:
+            futures = [pipeline.submit(x) for x in range(2)]
+            release.set()
+            futures += [pipeline.submit(x) for x in range(2, 10)]
+            self.assertEqual([future.result(10) for future in futures], list(range(10)))
+        self.assertLessEqual(max(sizes), 4)
+        self.assertLess(len(sizes), 10)
+        self.assertEqual(sum(sizes), 10)
+
+    def test_backpressure(self):
+        """
+        Пока последняя стадия стоит, submit блокируется после заполнения очередей
+        """
+        release = threading.Event()
+        pipeline = StagedPipeline([
+            Stage('first', _jitter, queue_size=2),
+            Stage('blocked', lambda x: release.wait() and x, queue_size=2),
+        ])
+        submitted = []
+
+        def produce():
+            for x in range(20):
+                pipeline.submit(x)
+                submitted.append(x)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        time.sleep(0.3)
+        # 1 в работе у blocked + 2 в ее очереди + 1 в работе у first + 2 в ее очереди
+        self.assertLessEqual(len(submitted), 6)
+        self.assertGreater(sum(pipeline.depths().values()), 0)
+        release.set()
+        producer.join(10)
+        pipeline.close()
+        self.assertEqual(len(submitted), 20)
+
+    def test_processes(self):
+        with StagedPipeline([Stage('square', _square, workers=2, processes=True)]) as pipeline:
+            self.assertEqual(list(pipeline.map(range(10))), [x * x for x in range(10)])
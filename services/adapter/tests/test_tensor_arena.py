@@ -0,0 +1,35 @@
+import threading
+from unittest import TestCase
+
+import numpy as np
+
+from ..ml_utils.utils.arena import TensorArena
+
+
+class TestTensorArena(TestCase):
+
+    def test_buffers_are_reused(self):
+        arena = TensorArena((2, 3), size=2)
+        first = arena.acquire()
+        arena.release(first)
+        self.assertIs(arena.acquire(), first)
+        self.assertEqual(arena.free, 1)
+
+    def test_acquire_waits_for_release(self):
+        arena = TensorArena((2, 3), size=1)
+        buffer = arena.acquire()
+        with self.assertRaises(TimeoutError):
+            arena.acquire(timeout=0.01)
+
+        threading.Timer(0.05, arena.release, (buffer,)).start()
+        self.assertIs(arena.acquire(timeout=5), buffer)
+
+    def test_borrow_releases_on_error(self):
+        arena = TensorArena((4,), dtype='uint8', size=1)
+        with self.assertRaises(ValueError):
+            with arena.borrow() as buffer:
+                self.assertEqual(buffer.dtype, np.uint8)
+                raise ValueError
+        self.assertEqual(arena.free, 1)
+        with self.assertRaises(AssertionError):
+            arena.release(np.empty(4, dtype='uint8'))
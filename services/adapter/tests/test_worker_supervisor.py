@@ -0,0 +1,80 @@
+import os
+import tempfile
+import time
+from pathlib import Path
+from unittest import TestCase
+
+from ..ml_utils.utils.supervisor import TooManyRestartsError, WorkerSupervisor
+
+# Загружено в родителе до fork, воркеры видят его без передачи
+SHARED = {'answer': 42}
+
+
+def _crash_once(folder):
+    runs = Path(folder) / f'{os.getpid()}'
+    runs.write_text(f"{SHARED['answer']} {os.environ['OMP_NUM_THREADS']} {len(os.sched_getaffinity(0))}")
+    if len(os.listdir(folder)) == 1:
+        os._exit(1)
+    time.sleep(60)
+
+
+def _crash():
+    os._exit(1)
+
+
+def _wait_for_stop(folder):
+    try:
+        (Path(folder) / 'started').touch()
+        time.sleep(60)
+    finally:
+        (Path(folder) / 'closed').touch()
+
+
+class TestWorkerSupervisor(TestCase):
+
+    def test_restarts_crashed_worker(self):
+        with tempfile.TemporaryDirectory() as folder:
+            supervisor = WorkerSupervisor(_crash_once, args=(folder,), workers=1, threads_per_worker=1, backoff=0.01)
+            supervisor.poll_interval = 0.01
+            supervisor.run(block=False)
+            try:
+                deadline = time.time() + 10
+                # Воркер может записать файл раньше, чем родитель запомнит его процесс
+                while (len(os.listdir(folder)) < 2 or supervisor.pids[0] is None) and time.time() < deadline:
+                    time.sleep(0.01)
+                pid = supervisor.pids[0]
+            finally:
+                supervisor.stop()
+
+            runs = {int(name): (Path(folder) / name).read_text() for name in os.listdir(folder)}
+            self.assertEqual(len(runs), 2)
+            self.assertIn(pid, runs)
+            self.assertEqual(runs[pid], f'42 1 {len(supervisor.worker_cpus(0))}')
+
+    def test_stop_runs_worker_cleanup(self):
+        """
+        По SIGTERM из stop() в воркере отрабатывает finally, как close() модели с буфером вставки
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            supervisor = WorkerSupervisor(_wait_for_stop, args=(folder,), workers=1)
+            supervisor.run(block=False)
+            try:
+                deadline = time.time() + 10
+                while not (Path(folder) / 'started').exists() and time.time() < deadline:
+                    time.sleep(0.01)
+            finally:
+                supervisor.stop()
+            self.assertTrue((Path(folder) / 'closed').exists())
+
+    def test_gives_up_after_max_restarts(self):
+        supervisor = WorkerSupervisor(_crash, workers=2, backoff=0.01, max_restarts=2)
+        supervisor.poll_interval = 0.01
+        with self.assertRaises(TooManyRestartsError):
+            supervisor.run()
+
+    def test_cpus_are_split_between_workers(self):
+        supervisor = WorkerSupervisor(_crash, workers=2)
+        supervisor.cpus = list(range(8))
+        self.assertEqual(supervisor.worker_cpus(1), [4, 5, 6, 7])
+        supervisor.cpus = [0]
+        self.assertEqual(supervisor.worker_cpus(1), [0])
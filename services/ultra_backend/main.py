@@ -31,6 +31,9 @@ input_queue: str | None = None
 output_queue: str | None = None
 rabbit_consumer: RabbitConsumerThread | None = None
 
+REQUEST_TIMEOUT = 20
+"""Сколько секунд запрос ждет ответа адаптера"""
+
 
 def get_rabbit() -> RabbitPipelineUnit:
     r = RabbitPipelineUnit(rabbit_url, input_queue, output_queue)
@@ -65,7 +68,11 @@ def check_video_duplicate_post(
     :return: Результат проверки в виде модели VideoLinkResponse
     """
     # Формирование модели запроса
-    rabbit_out = RabbitPipelineOut(video_link=video_link.link)
+    rabbit_out = RabbitPipelineOut(
+        video_link=video_link.link,
+        priority='interactive',
+        deadline=time.time() + REQUEST_TIMEOUT
+    )
     logger.info(f"Got request: {json.dumps(rabbit_out.model_dump(), ensure_ascii=False)}")
     # Отправка в очередь
     rabbit.send_message(json.dumps(rabbit_out.model_dump()))
@@ -82,10 +89,12 @@ def check_video_duplicate_post(
     rabbit_task = RabbitTask(task_id=video_link.link, in_args=rabbit_out.model_dump(), callback=set_ready)
     rabbit_cons.add_task(rabbit_task)
     # Само ожидания, ограниченное по времени
-    if not ready_event.wait(20):
+    if not ready_event.wait(REQUEST_TIMEOUT):
         raise HTTPException(status_code=500, detail="Timeout")
     # Формирование результата в модели
     nn_output = RabbitPipelineIn.InnerResult.model_validate(result_task.result)
+    if nn_output.expired:
+        raise HTTPException(status_code=500, detail="Timeout")
     # Распаковка результата из модели
     logger.info(json.dumps(nn_output.model_dump(), ensure_ascii=False))
     # Возврат результата
@@ -1,15 +1,23 @@
+from typing import Literal
+
 import pydantic
 
 
 class RabbitPipelineOut(pydantic.BaseModel):
     video_link: str
+    # Интерактивные запросы обрабатываются раньше массовой загрузки (bulk)
+    priority: Literal['interactive', 'bulk'] = 'interactive'
+    # unix time, после которого ответ уже не нужен и адаптер не обрабатывает запрос
+    deadline: float | None = None
 
 
 class RabbitPipelineIn(pydantic.BaseModel):
     class InnerResult(pydantic.BaseModel):
         video_link: str
-        is_duplicate: bool
+        is_duplicate: bool | None = None
         duplicate_for: str | None = None
+        # Адаптер не обработал запрос, т.к. его deadline истек
+        expired: bool = False
 
     result: InnerResult
 
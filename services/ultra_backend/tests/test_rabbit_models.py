@@ -1,6 +1,7 @@
 import json
 from unittest import TestCase
 
+import pydantic
 from loguru import logger
 
 from ..rabbit import custom_models
@@ -25,3 +26,34 @@ class TestCustomModels(TestCase):
         custom_model = custom_models.RabbitPipelineIn.model_validate(custom_model_dict)
         logger.info(json.dumps(custom_model.model_dump(), ensure_ascii=False))
 
+
+    def test_rabbit_pipeline_out_priority(self):
+        """
+        Запросы бэкенда по умолчанию интерактивные, неизвестный приоритет не принимается
+        """
+        rabbit_out = custom_models.RabbitPipelineOut(video_link="https://example.com/video.mp4")
+        self.assertEqual(rabbit_out.model_dump()["priority"], "interactive")
+        rabbit_out = custom_models.RabbitPipelineOut(video_link="https://example.com/video.mp4", priority="bulk")
+        self.assertEqual(rabbit_out.priority, "bulk")
+        with self.assertRaises(pydantic.ValidationError):
+            custom_models.RabbitPipelineOut(video_link="https://example.com/video.mp4", priority="urgent")
+
+    def test_rabbit_pipeline_in_expired(self):
+        """
+        Ответ адаптера на просроченный запрос не содержит признака дублирования
+        """
+        custom_model_dict = {
+            "inputs": {
+                "video_link": "https://example.com/video.mp4",
+                "priority": "interactive",
+                "deadline": 1727530282.0},
+            "process_time": None,
+            "current_time": "2024-09-28 13:31:22",
+            "result": {
+                "video_link": "https://example.com/video.mp4",
+                "expired": True
+            }
+        }
+        custom_model = custom_models.RabbitPipelineIn.model_validate(custom_model_dict)
+        self.assertTrue(custom_model.result.expired)
+        self.assertIsNone(custom_model.result.is_duplicate)